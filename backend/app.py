@@ -1,15 +1,47 @@
 import os
 import uuid
+import asyncio
 import json
+import math
 import base64
-import requests
+import functools
 import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timezone
-from flask import Flask, request, jsonify
+
+# Start-up profiling: everything below, imports included, counts towards import time
+IMPORT_STARTED = time.monotonic()
+
+import numpy as np
+from flask import Flask, Request, Response, abort, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import google.generativeai as genai
 from PIL import Image
-import io
+from category_rules import GENERIC_SUGGESTIONS, match_location_query, suggestion_type_for_categories, suggestion_type_for_tags
+from budgets import LoadShed, TokenBuckets, model_bucket, parse_budget
+from classification_cache import ClassificationCache, SQLiteClassificationStore, dhash
+from location_cache import LocationCache, ProvidersUnavailable, normalize_query
+from location_index import LocationIndex
+from location_ranking import attach_distances, rank_suggestions
+from overpass_stream import AsyncChunkReader, ChunkReader, NearestElements, collect_nearest, collect_nearest_async
+from process_stats import memory_mb
+from provider_client import ProviderClient, ProviderError
+from local_classifier import LocalClassifier, SQLiteExampleStore, image_embedding
+from image_preprocess import ImageRejected, PreprocessStats, prepare_image
+from jobs import JOB_PRIORITIES, JobWorkers, QueueFull, SQLiteJobStore
+from model_registry import ModelRegistry
+import metrics
+from metrics import RequestProfiler, span
+from single_flight import SingleFlight, SQLiteFlightStore
+from uploads import UPLOAD_CHUNK_BYTES, SpooledUpload, UploadTooLarge, parse_coordinate, upload_kind
+from structured_log import log_event
+import structured_log
+from summary_cache import (SummaryCache, SummaryFiller, bucket_summary_stats, fill_summary, render_template_summary,
+                           summary_cache_key, summary_figures)
+from werkzeug.exceptions import RequestEntityTooLarge
 
 app = Flask(__name__)
 CORS(app)
@@ -18,8 +50,191 @@ CORS(app)
 from dotenv import load_dotenv
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+# Perceptual-hash cache so near-duplicate photos skip the Gemini call
+CACHE_DIR = os.getenv('BINBUDDY_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+CLASSIFY_CACHE_TTL = int(os.getenv('CLASSIFY_CACHE_TTL', 7 * 24 * 3600))
+
+classification_store = None
+if os.getenv('CLASSIFY_CACHE_DISK', 'true').lower() == 'true':
+    classification_store = SQLiteClassificationStore(os.path.join(CACHE_DIR, 'classifications.sqlite3'))
+    classification_store.prune(time.time() - CLASSIFY_CACHE_TTL)
+
+classification_cache = ClassificationCache(
+    max_entries=int(os.getenv('CLASSIFY_CACHE_SIZE', 1024)),
+    ttl_seconds=CLASSIFY_CACHE_TTL,
+    max_distance=int(os.getenv('CLASSIFY_CACHE_MAX_DISTANCE', 4)),
+    store=classification_store
+)
+
+# CPU-only nearest-neighbour classifier over an embedding index of past model
+# answers. Near-identical photos reuse a stored answer, and it stands in when the
+# model is slow or failing
+LOCAL_CLASSIFIER_ENABLED = os.getenv('LOCAL_CLASSIFIER', 'true').lower() == 'true'
+# Answering confident common items without the model is opt-in: nothing yet measures
+# the embedding's accuracy against model labels, and a wrong answer would be cached
+LOCAL_ROUTE_FIRST = os.getenv('LOCAL_ROUTE_FIRST', 'false').lower() == 'true'
+LOCAL_FALLBACK_BUDGET = float(os.getenv('LOCAL_FALLBACK_BUDGET', 6))
+
+local_classifier = None
+if LOCAL_CLASSIFIER_ENABLED:
+    local_classifier = LocalClassifier(
+        store=SQLiteExampleStore(os.path.join(CACHE_DIR, 'local_examples.sqlite3')),
+        index_dir=os.path.join(CACHE_DIR, 'embedding_index'),
+        k=int(os.getenv('LOCAL_CLASSIFIER_K', 5)),
+        min_examples=int(os.getenv('LOCAL_CLASSIFIER_MIN_EXAMPLES', 20)),
+        max_examples=int(os.getenv('LOCAL_CLASSIFIER_MAX_EXAMPLES', 100000)),
+        min_similarity=float(os.getenv('LOCAL_CLASSIFIER_MIN_SIMILARITY', 0.85)),
+        confident_similarity=float(os.getenv('LOCAL_CLASSIFIER_CONFIDENT_SIMILARITY', 0.97)),
+        common_min_examples=int(os.getenv('LOCAL_CLASSIFIER_COMMON_EXAMPLES', 25)),
+        reuse_similarity=float(os.getenv('EMBEDDING_REUSE_SIMILARITY', 0.99)),
+        n_lists=int(os.getenv('EMBEDDING_INDEX_LISTS', 64)),
+        n_probe=int(os.getenv('EMBEDDING_INDEX_PROBE', 8))
+    )
+
+classify_route_stats = Counter()
+remote_classify_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('CLASSIFY_REMOTE_WORKERS', 16)),
+    thread_name_prefix='classify'
+)
+# Async model calls still running after their request fell back to a local answer;
+# the event loop only holds weak references to tasks
+background_classify_tasks = set()
+
+# Identical classify and location calls that are already in flight are coalesced,
+# optionally across worker processes through a shared SQLite store
+SINGLE_FLIGHT_LEASE = int(os.getenv('SINGLE_FLIGHT_LEASE', 30))
+LOCATION_FLIGHT_PRECISION = int(os.getenv('LOCATION_FLIGHT_PRECISION', 3))
+
+flight_store = None
+if os.getenv('SINGLE_FLIGHT_SHARED', 'false').lower() == 'true':
+    flight_store = SQLiteFlightStore(
+        os.path.join(CACHE_DIR, 'inflight.sqlite3'),
+        result_ttl_seconds=int(os.getenv('SINGLE_FLIGHT_RESULT_TTL', 30))
+    )
+
+classify_flight = SingleFlight('classify', store=flight_store, lease_seconds=SINGLE_FLIGHT_LEASE)
+location_flight = SingleFlight('location', store=flight_store, lease_seconds=SINGLE_FLIGHT_LEASE)
+
+# Uploads are downscaled and re-encoded before they go to the model
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 1024))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG')
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 64_000_000))
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+preprocess_stats = PreprocessStats()
+
+# Largest request body per endpoint, checked against Content-Length before the body
+# is read. A JSON upload carries the image base64-encoded, a third larger than the
+# same image sent as multipart or a raw image/* body
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv('MAX_BATCH_UPLOAD_BYTES', 200 * 1024 * 1024))
+UPLOAD_LIMITS = {'classify_waste_batch': MAX_BATCH_UPLOAD_BYTES}
+# Raw uploads up to this size stay in memory, larger ones spill to a temporary file
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', 1024 * 1024))
+# For requests that matched no endpoint; matched ones are held to their own limit below
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_UPLOAD_BYTES, *UPLOAD_LIMITS.values())
+upload_stats = Counter()
+
+# Location providers are queried concurrently under an overall deadline
+LOCATION_SEARCH_DEADLINE = float(os.getenv('LOCATION_SEARCH_DEADLINE', 8))
+LOCATION_TARGET_RESULTS = int(os.getenv('LOCATION_TARGET_RESULTS', 10))
+MAX_SUGGESTION_DISTANCE_KM = 25
+
+# Overpass is asked one merged union query per radius, widening only when too few places come back
+OVERPASS_RADII = [int(radius) for radius in os.getenv('OVERPASS_RADII', '2000,5000,15000').split(',')]
+OVERPASS_RESULT_LIMIT = int(os.getenv('OVERPASS_RESULT_LIMIT', 50))
+# Responses are parsed element by element; parsing stops once 10 places this close are held,
+# which may miss closer places later in the response (0 parses every element)
+OVERPASS_SETTLE_KM = float(os.getenv('OVERPASS_SETTLE_KM', 1.0))
+PROVIDER_TIMEOUTS = {'overpass': 15, 'here': 10, 'foursquare': 10}
+# Overridable so benchmarks can point the providers at local stand-ins (bench/fake_providers.py)
+OVERPASS_URL = os.getenv('OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+HERE_DISCOVER_URL = os.getenv('HERE_DISCOVER_URL', 'https://discover.search.hereapi.com/v1/discover')
+FOURSQUARE_SEARCH_URL = os.getenv('FOURSQUARE_SEARCH_URL', 'https://api.foursquare.com/v3/places/search')
+
+# One pooled keep-alive session per provider, with retries and a circuit breaker
+provider_clients = {
+    name: ProviderClient(
+        name,
+        pool_size=int(os.getenv('PROVIDER_POOL_SIZE', 10)),
+        max_retries=int(os.getenv('PROVIDER_MAX_RETRIES', 2)),
+        backoff_base=float(os.getenv('PROVIDER_BACKOFF_BASE', 0.25)),
+        failure_threshold=int(os.getenv('PROVIDER_BREAKER_THRESHOLD', 5)),
+        reset_seconds=int(os.getenv('PROVIDER_BREAKER_RESET', 60))
+    )
+    for name in PROVIDER_TIMEOUTS
+}
+
+provider_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('LOCATION_SEARCH_WORKERS', 16)),
+    thread_name_prefix='provider'
+)
+
+# Provider results are cached per query and geohash cell
+location_cache = LocationCache(
+    precision=int(os.getenv('LOCATION_CACHE_PRECISION', 5)),
+    max_entries=int(os.getenv('LOCATION_CACHE_SIZE', 5000)),
+    ttl_seconds=int(os.getenv('LOCATION_CACHE_TTL', 24 * 3600)),
+    stale_seconds=int(os.getenv('LOCATION_CACHE_STALE', 6 * 24 * 3600)),
+    negative_ttl_seconds=int(os.getenv('LOCATION_CACHE_NEGATIVE_TTL', 600))
+)
+
+# Stored disposal locations (and harvested Overpass places) answer lookups locally
+LOCATION_INDEX_MIN_RESULTS = int(os.getenv('LOCATION_INDEX_MIN_RESULTS', 5))
+
+def load_disposal_locations():
+    """Load active rows of the disposal_locations table as (category, place) pairs"""
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_KEY')
+    if not supabase_url or not supabase_key:
+        return []
+    
+    from supabase import create_client
+    client = create_client(supabase_url, supabase_key)
+    rows = client.table('disposal_locations') \
+        .select('name, type, category, lat, lon, address') \
+        .eq('active', True) \
+        .execute().data
+    
+    return [
+        (row['category'].lower(), {
+            "type": row['type'],
+            "name": row['name'],
+            "address": row.get('address') or 'Address not available',
+            "lat": float(row['lat']),
+            "lon": float(row['lon']),
+            "source": "binbuddy"
+        })
+        for row in rows
+    ]
+
+location_index = LocationIndex(
+    loader=load_disposal_locations,
+    refresh_seconds=int(os.getenv('LOCATION_INDEX_REFRESH', 900))
+)
+if os.getenv('LOCATION_INDEX_ENABLED', 'true').lower() == 'true':
+    location_index.start_background_refresh()
+
+# Batch classification packs several images into one model call
+CLASSIFY_BATCH_MAX_IMAGES = int(os.getenv('CLASSIFY_BATCH_MAX_IMAGES', 50))
+CLASSIFY_BATCH_PACK_SIZE = int(os.getenv('CLASSIFY_BATCH_PACK_SIZE', 4))
+
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('CLASSIFY_BATCH_CONCURRENCY', 4)),
+    thread_name_prefix='batch'
+)
+location_lookup_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('LOCATION_LOOKUP_WORKERS', 4)),
+    thread_name_prefix='location-lookup'
+)
+
+# Recent location queries drive the speculative location prefetch on the async path
+LOCATION_PREFETCH_MAX_DISTANCE = int(os.getenv('LOCATION_PREFETCH_MAX_DISTANCE', 12))
+LOCATION_PREFETCH_MAX_QUERIES = int(os.getenv('LOCATION_PREFETCH_MAX_QUERIES', 256))
+recent_location_queries = Counter()
+recent_location_queries_lock = threading.Lock()
+location_prefetch_stats = Counter(started=0, used=0, wasted=0)
 
 # Default CO2 rates by general category (as fallback)
 DEFAULT_CO2_RATES = {
@@ -78,108 +293,615 @@ Research accurate CO2 savings rates for the specific material.
 Choose colors that visually represent the item.
 Pick the most appropriate icon from the available sets."""
 
+# Model handles are built once, on first use or by warm_up(); the Gemini SDK is
+# only imported and configured then, so routes that never call it start fast
+CLASSIFICATION_MODEL = os.getenv('CLASSIFICATION_MODEL', 'gemini-2.0-flash')
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gemini-1.5-flash')
+CLASSIFICATION_PROMPT = create_dynamic_prompt()
+
+# Upstream quotas as token buckets ('<count>/<second|minute|hour|day>', unset is unlimited),
+# shared by all workers and kept across restarts. HERE's free tier allows 1000 calls a day
+UPSTREAM_BUDGETS = {
+    'overpass': os.getenv('OVERPASS_BUDGET', ''),
+    'here': os.getenv('HERE_BUDGET', '1000/day'),
+    'foursquare': os.getenv('FOURSQUARE_BUDGET', ''),
+    model_bucket(CLASSIFICATION_MODEL): os.getenv('CLASSIFICATION_MODEL_BUDGET', ''),
+    model_bucket(SUMMARY_MODEL): os.getenv('SUMMARY_MODEL_BUDGET', '')
+}
+upstream_budgets = TokenBuckets(
+    os.path.join(CACHE_DIR, 'budgets.sqlite3'),
+    {name: parse_budget(spec) for name, spec in UPSTREAM_BUDGETS.items() if parse_budget(spec)}
+)
+# Providers with less than this share of their budget left only run when the others come up short
+BUDGET_DEFER_BELOW = float(os.getenv('BUDGET_DEFER_BELOW', 0.2))
+# Once the classification model has less than this share left, images that neither the
+# cache nor the local classifier can answer get a 503 instead of a model call
+CLASSIFY_SHED_BELOW = float(os.getenv('CLASSIFY_SHED_BELOW', 0.05))
+CLASSIFY_SHED_ERROR = 'Classification is over its quota, retry later'
+budget_stats = Counter()
+
+model_registry = ModelRegistry(api_key=os.getenv('GEMINI_API_KEY'), budgets=upstream_budgets)
+
+# Summaries are cached per bucket of stats; users with very little activity get a template
+SUMMARY_TEMPLATE_MAX_ITEMS = int(os.getenv('SUMMARY_TEMPLATE_MAX_ITEMS', 3))
+summary_cache = SummaryCache(
+    max_entries=int(os.getenv('SUMMARY_CACHE_SIZE', 2000)),
+    ttl_seconds=int(os.getenv('SUMMARY_CACHE_TTL', 24 * 3600)),
+    stale_seconds=int(os.getenv('SUMMARY_CACHE_STALE', 6 * 24 * 3600))
+)
+
+# Returned whenever the model call or its response parsing fails
+FALLBACK_CLASSIFICATION = {
+    "main_category": "general",
+    "specific_category": "unidentified_item",
+    "display_name": "Unidentified Item",
+    "estimated_weight_kg": 0.2,
+    "confidence": "low",
+    "co2_saved_kg_per_kg": 0.0,
+    "color": "#757575",
+    "icon": "material/MdDelete",
+    "disposal_methods": ["Consult local waste management guidelines"],
+    "location_query": "nearest_disposal",
+    "recyclable": False,
+    "donation_worthy": False
+}
+
+def fallback_classification():
+    """Fresh copy of the classification used when Gemini fails"""
+    return json.loads(json.dumps(FALLBACK_CLASSIFICATION))
+
+def prepare_upload(image_data):
+    """Decode an upload and downscale it; returns (image_hash, encoded_image, mime_type, embedding).
+    
+    image_data is a base64 data URL from a JSON body, or the image bytes or a
+    binary file from a multipart or raw upload, which PIL reads directly.
+    """
+    if isinstance(image_data, str):
+        with span('base64_decode'):
+            image_data = base64.b64decode(image_data.split(',')[1])
+    
+    # Downscale and re-encode before hashing and upload
+    try:
+        image, encoded_image, mime_type, image_info = prepare_image(
+            image_data, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_QUALITY,
+            image_format=IMAGE_FORMAT, max_pixels=IMAGE_MAX_PIXELS
+        )
+    except ImageRejected:
+        preprocess_stats.record_rejected()
+        raise
+    preprocess_stats.record(image_info)
+    log_event('image_prepared', **image_info)
+    
+    with span('image_hash'):
+        image_hash = dhash(image)
+    with span('embedding'):
+        embedding = image_embedding(image)
+    return image_hash, encoded_image, mime_type, embedding
+
+def get_cached_classification(image_hash):
+    """Near-duplicate photos reuse the stored, already-validated result"""
+    cached = classification_cache.get(image_hash)
+    if cached is not None:
+        log_event('classify_cache_hit', category=cached['specific_category'])
+    return cached
+
+def strip_code_fences(response_text):
+    """Remove a markdown code fence around the model's JSON answer"""
+    result_text = response_text.strip()
+    if result_text.startswith('```json'):
+        result_text = result_text[7:-3]
+    elif result_text.startswith('```'):
+        result_text = result_text[3:-3]
+    return result_text
+
+def parse_classification_response(response_text):
+    """Parse the model's JSON answer and fill in or correct missing fields"""
+    return validate_classification(json.loads(strip_code_fences(response_text)))
+
+def validate_classification(result):
+    """Fill in or correct missing fields of one classification dict"""
+    # Validate and set defaults
+    required_fields = ['main_category', 'specific_category', 'display_name', 'estimated_weight_kg', 
+                      'confidence', 'co2_saved_kg_per_kg', 'color', 'icon', 'disposal_methods', 
+                      'location_query', 'recyclable', 'donation_worthy']
+    
+    for field in required_fields:
+        if field not in result:
+            # Set sensible defaults
+            if field == 'main_category':
+                result[field] = 'general'
+            elif field == 'specific_category':
+                result[field] = 'unidentified_item'
+            elif field == 'display_name':
+                result[field] = 'Unidentified Item'
+            elif field == 'estimated_weight_kg':
+                result[field] = 0.2
+            elif field == 'confidence':
+                result[field] = 'low'
+            elif field == 'co2_saved_kg_per_kg':
+                result[field] = DEFAULT_CO2_RATES.get(result.get('main_category', 'general'), 0.0)
+            elif field == 'color':
+                result[field] = '#757575'
+            elif field == 'icon':
+                result[field] = 'material/MdDelete'
+            elif field == 'disposal_methods':
+                result[field] = ["Consult local waste management guidelines"]
+            elif field == 'location_query':
+                result[field] = 'nearest_disposal'
+            elif field in ['recyclable', 'donation_worthy']:
+                result[field] = False
+    
+    # Validate color format
+    if not result['color'].startswith('#') or len(result['color']) != 7:
+        result['color'] = '#757575'
+    
+    # Validate icon format
+    if '/' not in result['icon']:
+        result['icon'] = 'material/MdDelete'
+    
+    # Clean up confidence value (remove % symbols and ensure valid values)
+    if 'confidence' in result:
+        confidence = str(result['confidence']).lower().replace('%', '').strip()
+        if confidence not in ['low', 'medium', 'high']:
+            result['confidence'] = 'medium'
+        else:
+            result['confidence'] = confidence
+    
+    return result
+
 def classify_image_with_gemini(image_data):
     """Classify image using dynamic Gemini Vision API"""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        image_hash, encoded_image, mime_type, embedding = prepare_upload(image_data)
         
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data.split(',')[1])
-        image = Image.open(io.BytesIO(image_bytes))
+        cached = get_cached_classification(image_hash)
+        if cached is not None:
+            return cached
         
-        # Use dynamic prompt
-        prompt = create_dynamic_prompt()
+        return route_classification(image_hash, encoded_image, mime_type, embedding)
         
-        response = model.generate_content([prompt, image])
+    except (ImageRejected, LoadShed):
+        raise
+    except Exception as e:
+        log_event('classify_error', level='error', error=str(e))
+        return fallback_classification()
+
+def classify_flight_key(image_hash):
+    """Coalescing key for classifications: the perceptual hash of the prepared image"""
+    return f"classify:{image_hash:016x}"
+
+def location_flight_key(location_query, lat, lon):
+    """Coalescing key for provider searches: normalized query and rounded coordinates"""
+    return "location:{}:{}:{}".format(
+        normalize_query(location_query),
+        round(float(lat), LOCATION_FLIGHT_PRECISION),
+        round(float(lon), LOCATION_FLIGHT_PRECISION)
+    )
+
+def local_prediction(embedding):
+    """(result, mode) from the local classifier, or None when it has no answer"""
+    if local_classifier is None:
+        return None
+    return local_classifier.classify(embedding)
+
+def should_answer_locally(local):
+    """True when a local answer is returned without asking the model"""
+    if local is None:
+        return False
+    if local[1] == 'reuse':
+        classify_route_stats['reused'] += 1
+    elif local[1] == 'confident' and LOCAL_ROUTE_FIRST:
+        classify_route_stats['local_first'] += 1
+    else:
+        return False
+    log_event('local_classifier_answered', mode=local[1], category=local[0]['specific_category'])
+    return True
+
+def shed_classification(local, retry_after):
+    """Answer for an image the model's nearly spent budget should not be used on.
+    
+    A local prediction is returned even when it is not confident; without one
+    LoadShed is raised, which the endpoints turn into a 503.
+    """
+    if local is not None:
+        classify_route_stats['local_shed'] += 1
+        log_event('local_classifier_answered', mode='shed', category=local[0]['specific_category'])
+        return local[0]
+    budget_stats['classify_shed'] += 1
+    metrics.events.inc(event='classify_shed')
+    raise LoadShed(retry_after)
+
+def record_local_example(image_hash, embedding, result):
+    """Teach the local classifier a validated model answer"""
+    if local_classifier is not None and embedding is not None and result['confidence'] in ('high', 'medium'):
+        local_classifier.add(f"{image_hash:016x}", embedding, result)
+
+def remember_classification(image_hash, embedding, result):
+    """Cache a validated model answer and teach it to the local classifier"""
+    classification_cache.put(image_hash, result)
+    record_local_example(image_hash, embedding, result)
+
+def route_classification(image_hash, encoded_image, mime_type, embedding, classify=None):
+    """Answer locally when possible, otherwise ask the model within the latency budget.
+
+    Near-identical photos reuse a stored answer and confident common items skip
+    the model; a slow or failing model call falls back to the local answer.
+    classify() makes the model call, by default classify_prepared_image().
+    """
+    local = local_prediction(embedding)
+    if should_answer_locally(local):
+        return local[0]
+    
+    retry_after = classify_shed_retry_after()
+    if retry_after is not None:
+        return shed_classification(local, retry_after)
+    
+    if classify is None:
+        classify = lambda: classify_prepared_image(image_hash, encoded_image, mime_type, embedding)
+    
+    # Identical photos uploaded at the same time share one model call
+    def classify_remote():
+        return classify_flight.do(classify_flight_key(image_hash), classify)
+    
+    if local is None:
+        classify_route_stats['remote'] += 1
+        return classify_remote()
+    
+    # The model keeps running past the budget so its answer still reaches the caches
+    future = remote_classify_executor.submit(classify_remote)
+    try:
+        result = future.result(timeout=LOCAL_FALLBACK_BUDGET)
+    except FutureTimeoutError:
+        classify_route_stats['local_timeout'] += 1
+        log_event('model_over_budget', level='warning', budget_s=LOCAL_FALLBACK_BUDGET,
+                  category=local[0]['specific_category'])
+        return local[0]
+    except Exception as e:
+        classify_route_stats['local_error'] += 1
+        log_event('model_error_local_answer', level='warning', error=str(e),
+                  category=local[0]['specific_category'])
+        return local[0]
+    
+    classify_route_stats['remote'] += 1
+    return result
+
+def finish_background_classify(task):
+    """Done callback for a model call that outlived its request's local-fallback budget"""
+    background_classify_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log_event('classify_error', level='error', error=str(task.exception()), background=True)
+
+async def route_classification_async(image_hash, encoded_image, mime_type, embedding):
+    """Async twin of route_classification"""
+    # The index search and SQLite reads block, keep them off the event loop
+    local = await asyncio.to_thread(local_prediction, embedding)
+    if should_answer_locally(local):
+        return local[0]
+    
+    retry_after = await asyncio.to_thread(classify_shed_retry_after)
+    if retry_after is not None:
+        return shed_classification(local, retry_after)
+    
+    remote = classify_flight.do_async(
+        classify_flight_key(image_hash),
+        lambda: classify_prepared_image_async(image_hash, encoded_image, mime_type, embedding)
+    )
+    
+    if local is None:
+        classify_route_stats['remote'] += 1
+        return await remote
+    
+    # Our wait runs as its own task, so the shared model call keeps a waiter past the
+    # budget and its answer still reaches the caches; only a cancelled request drops it
+    remote = asyncio.ensure_future(remote)
+    try:
+        result = await asyncio.wait_for(asyncio.shield(remote), LOCAL_FALLBACK_BUDGET)
+    except asyncio.TimeoutError:
+        classify_route_stats['local_timeout'] += 1
+        log_event('model_over_budget', level='warning', budget_s=LOCAL_FALLBACK_BUDGET,
+                  category=local[0]['specific_category'])
+        background_classify_tasks.add(remote)
+        remote.add_done_callback(finish_background_classify)
+        return local[0]
+    except asyncio.CancelledError:
+        remote.cancel()
+        raise
+    except Exception as e:
+        classify_route_stats['local_error'] += 1
+        log_event('model_error_local_answer', level='warning', error=str(e),
+                  category=local[0]['specific_category'])
+        return local[0]
+    
+    classify_route_stats['remote'] += 1
+    return result
+
+def classify_prepared_image(image_hash, encoded_image, mime_type, embedding=None):
+    """Send a preprocessed image to Gemini and cache the validated result"""
+    with span('model_call'):
+        response = model_registry.generate(
+            CLASSIFICATION_MODEL,
+            [{'mime_type': mime_type, 'data': encoded_image}],
+            system_instruction=CLASSIFICATION_PROMPT
+        )
+    
+    with span('parse'):
+        result = parse_classification_response(response.text)
+    remember_classification(image_hash, embedding, result)
+    return result
+
+async def classify_prepared_image_async(image_hash, encoded_image, mime_type, embedding=None):
+    """Async twin of classify_prepared_image for the ASGI serving path"""
+    with span('model_call'):
+        response = await model_registry.generate_async(
+            CLASSIFICATION_MODEL,
+            [{'mime_type': mime_type, 'data': encoded_image}],
+            system_instruction=CLASSIFICATION_PROMPT
+        )
+    
+    with span('parse'):
+        result = parse_classification_response(response.text)
+    await asyncio.to_thread(remember_classification, image_hash, embedding, result)
+    return result
+
+def remember_location_query(location_query):
+    """Track which location queries come up most, to guess the next one"""
+    with recent_location_queries_lock:
+        recent_location_queries[location_query] += 1
+        # Queries are model free text; halving every count once there are too many keeps
+        # the table bounded and lets recent queries outweigh old ones
+        if len(recent_location_queries) > LOCATION_PREFETCH_MAX_QUERIES:
+            for query, count in list(recent_location_queries.items()):
+                if count > 1:
+                    recent_location_queries[query] = count // 2
+                else:
+                    del recent_location_queries[query]
+
+def guess_location_query(image_hash):
+    """Best guess at the location query before the model has answered"""
+    similar = classification_cache.peek(image_hash, LOCATION_PREFETCH_MAX_DISTANCE)
+    if similar is not None:
+        return similar['location_query']
+    with recent_location_queries_lock:
+        most_common = recent_location_queries.most_common(1)
+    return most_common[0][0] if most_common else None
+
+def build_classify_response(classification, suggestions):
+    """Shape a classification and its location suggestions into the /api/classify response"""
+    # Use Gemini's weight estimate and CO2 rate
+    weight = classification['estimated_weight_kg']
+    co2_saved = calculate_co2_savings(classification['co2_saved_kg_per_kg'], weight)
+    
+    # Create response with all dynamic data
+    return {
+        "image_id": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
         
-        # Parse JSON response
-        result_text = response.text.strip()
-        if result_text.startswith('```json'):
-            result_text = result_text[7:-3]
-        elif result_text.startswith('```'):
-            result_text = result_text[3:-3]
-            
-        result = json.loads(result_text)
+        # Core classification
+        "main_category": classification['main_category'],
+        "specific_category": classification['specific_category'],
+        "display_name": classification['display_name'],
+        "confidence": classification['confidence'],
         
-        # Validate and set defaults
-        required_fields = ['main_category', 'specific_category', 'display_name', 'estimated_weight_kg', 
-                          'confidence', 'co2_saved_kg_per_kg', 'color', 'icon', 'disposal_methods', 
-                          'location_query', 'recyclable', 'donation_worthy']
+        # Weight and impact
+        "weight": weight,
+        "co2_saved": co2_saved,
+        "co2_rate": classification['co2_saved_kg_per_kg'],
         
-        for field in required_fields:
-            if field not in result:
-                # Set sensible defaults
-                if field == 'main_category':
-                    result[field] = 'general'
-                elif field == 'specific_category':
-                    result[field] = 'unidentified_item'
-                elif field == 'display_name':
-                    result[field] = 'Unidentified Item'
-                elif field == 'estimated_weight_kg':
-                    result[field] = 0.2
-                elif field == 'confidence':
-                    result[field] = 'low'
-                elif field == 'co2_saved_kg_per_kg':
-                    result[field] = DEFAULT_CO2_RATES.get(result.get('main_category', 'general'), 0.0)
-                elif field == 'color':
-                    result[field] = '#757575'
-                elif field == 'icon':
-                    result[field] = 'material/MdDelete'
-                elif field == 'disposal_methods':
-                    result[field] = ["Consult local waste management guidelines"]
-                elif field == 'location_query':
-                    result[field] = 'nearest_disposal'
-                elif field in ['recyclable', 'donation_worthy']:
-                    result[field] = False
+        # Visual and interaction
+        "color": classification['color'],
+        "icon": classification['icon'],
         
-        # Validate color format
-        if not result['color'].startswith('#') or len(result['color']) != 7:
-            result['color'] = '#757575'
+        # Disposal guidance
+        "disposal_methods": classification['disposal_methods'],
+        "recyclable": classification['recyclable'],
+        "donation_worthy": classification['donation_worthy'],
+        
+        # Location suggestions
+        "suggestions": suggestions,
+        "location_query": classification['location_query']
+    }
+
+@functools.lru_cache(maxsize=None)
+def create_batch_prompt(count):
+    """Instructions asking for one classification per image, as a JSON array in image order"""
+    return f"""You will receive {count} separate waste item images, labelled Image 1 to Image {count}.
+Classify each image on its own using the classification instructions, but return ONLY a JSON array
+containing exactly {count} objects, one per image, in the same order as the images."""
+
+def classify_prepared_batch(prepared_images):
+    """Classify several preprocessed images with one Gemini call.
+
+    prepared_images is a list of prepare_upload() tuples. Returns None when
+    there is only one image or the packed answer can't be matched to the
+    images, in which case each is classified on its own instead.
+    """
+    if len(prepared_images) < 2:
+        return None
+    try:
+        with span('prompt_build'):
+            content = [create_batch_prompt(len(prepared_images))]
+            for number, (_, encoded_image, mime_type, _) in enumerate(prepared_images, start=1):
+                content.append(f"Image {number}:")
+                content.append({'mime_type': mime_type, 'data': encoded_image})
         
-        # Validate icon format
-        if '/' not in result['icon']:
-            result['icon'] = 'material/MdDelete'
+        with span('model_call'):
+            response = model_registry.generate(CLASSIFICATION_MODEL, content, system_instruction=CLASSIFICATION_PROMPT)
+        with span('parse'):
+            results = json.loads(strip_code_fences(response.text))
         
-        # Clean up confidence value (remove % symbols and ensure valid values)
-        if 'confidence' in result:
-            confidence = str(result['confidence']).lower().replace('%', '').strip()
-            if confidence not in ['low', 'medium', 'high']:
-                result['confidence'] = 'medium'
+        if isinstance(results, list) and len(results) == len(prepared_images):
+            with span('parse'):
+                results = [validate_classification(result) for result in results]
+            for (image_hash, _, _, embedding), result in zip(prepared_images, results):
+                remember_classification(image_hash, embedding, result)
+            return results
+        log_event('packed_classification_mismatch', level='warning', images=len(prepared_images),
+                  results=len(results) if isinstance(results, list) else None)
+    except Exception as e:
+        log_event('packed_classification_error', level='warning', error=str(e))
+    return None
+
+def _prepare_batch_item(image_data):
+    try:
+        return prepare_upload(image_data), None
+    except ImageRejected as e:
+        return None, f'Image rejected: {e}'
+    except Exception as e:
+        log_event('batch_prepare_error', level='error', error=str(e))
+        return None, None
+
+def shared_call(fn):
+    """A function that runs fn() on its first call and returns that same result to every call"""
+    lock = threading.Lock()
+    result = []
+    
+    def call():
+        with lock:
+            if not result:
+                result.append(fn())
+        return result[0]
+    
+    return call
+
+def classify_batch(images, lat, lon, timeout):
+    """Classify a list of image data URLs, yielding per-item results as they complete.
+
+    Cache hits and confident local answers come back first, the rest are packed
+    into CLASSIFY_BATCH_PACK_SIZE images per model call, and location lookups are
+    shared between items with the same location_query. Each packed item is routed
+    like a single upload, so it coalesces with identical in-flight classifies and
+    falls back to a local answer. Items still missing after timeout seconds are
+    reported as errors.
+    """
+    deadline = time.monotonic() + timeout
+    completed = queue.Queue()
+    location_futures = {}
+    location_lock = threading.Lock()
+    
+    def finish(index, classification):
+        location_query = classification['location_query']
+        remember_location_query(location_query)
+        with location_lock:
+            future = location_futures.get(location_query)
+            if future is None:
+                future = location_lookup_executor.submit(find_nearby_locations, lat, lon, location_query)
+                location_futures[location_query] = future
+        future.add_done_callback(lambda f: completed.put((index, classification, f)))
+    
+    # Decode and downscale every image; near-duplicates are answered from the cache
+    prepared = list(batch_executor.map(_prepare_batch_item, images))
+    misses = []
+    for index, (upload, error) in enumerate(prepared):
+        if error is not None:
+            completed.put((index, None, error))
+        elif upload is None:
+            finish(index, fallback_classification())
+        else:
+            cached = get_cached_classification(upload[0])
+            local = local_prediction(upload[3]) if cached is None else None
+            if cached is not None:
+                finish(index, cached)
+            elif should_answer_locally(local):
+                finish(index, local[0])
             else:
-                result['confidence'] = confidence
+                misses.append((index, upload))
+    
+    # The packed model call runs once, for whichever item of the pack needs it first;
+    # items answered by an identical in-flight classify or a local fallback may not
+    def classify_pack(pack):
+        packed = shared_call(lambda: classify_prepared_batch([upload for _, upload in pack]))
         
-        return result
+        def classify_item(position, upload):
+            results = packed()
+            return results[position] if results is not None else classify_prepared_image(*upload)
         
-    except Exception as e:
-        print(f"Error classifying image: {e}")
-        return {
-            "main_category": "general",
-            "specific_category": "unidentified_item",
-            "display_name": "Unidentified Item",
-            "estimated_weight_kg": 0.2,
-            "confidence": "low",
-            "co2_saved_kg_per_kg": 0.0,
-            "color": "#757575",
-            "icon": "material/MdDelete",
-            "disposal_methods": ["Consult local waste management guidelines"],
-            "location_query": "nearest_disposal",
-            "recyclable": False,
-            "donation_worthy": False
-        }
+        for position, (index, upload) in enumerate(pack):
+            try:
+                classification = route_classification(
+                    *upload, classify=functools.partial(classify_item, position, upload)
+                )
+            except LoadShed:
+                completed.put((index, None, CLASSIFY_SHED_ERROR))
+                continue
+            except Exception as e:
+                log_event('classify_error', level='error', error=str(e))
+                classification = fallback_classification()
+            finish(index, classification)
+    
+    packs = [misses[i:i + CLASSIFY_BATCH_PACK_SIZE] for i in range(0, len(misses), CLASSIFY_BATCH_PACK_SIZE)]
+    for pack in packs:
+        batch_executor.submit(classify_pack, pack)
+    
+    outstanding = set(range(len(images)))
+    while outstanding:
+        try:
+            index, classification, outcome = completed.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            log_event('batch_over_budget', level='warning', budget_s=timeout, missing=len(outstanding))
+            for index in sorted(outstanding):
+                yield {'index': index, 'error': 'Timed out'}
+            return
+        outstanding.discard(index)
+        if classification is None:
+            yield {'index': index, 'error': outcome}
+            continue
+        try:
+            suggestions = outcome.result()
+        except Exception as e:
+            log_event('batch_location_error', level='error', error=str(e))
+            suggestions = []
+        yield {'index': index, **build_classify_response(classification, suggestions)}
 
 def calculate_co2_savings(co2_rate, weight):
     """Calculate CO2 savings based on rate and weight"""
     return round(weight * co2_rate, 2)
 
-def find_nearby_locations(lat, lon, location_query):
+def find_nearby_locations(lat, lon, location_query, report=None):
     """Find nearby disposal locations using multiple FREE APIs"""
     
-    print(f"🔍 Searching for locations: '{location_query}' at {lat}, {lon}")
+    log_event('location_search', query=location_query, lat=lat, lon=lon)
+    
+    local_suggestions = find_local_suggestions(lat, lon, location_query)
+    if local_suggestions is not None:
+        return local_suggestions
+    
+    # Nearby users share provider results through the geo-tiled cache
+    cache_key = location_cache.key(location_query, lat, lon)
+    flight_key = location_flight_key(location_query, lat, lon)
+    cached_suggestions = location_cache.get_or_fetch(
+        cache_key,
+        lambda: location_flight.do(flight_key, lambda: search_unique_suggestions(lat, lon, location_query, report))
+    )
+    
+    return finalize_suggestions(lat, lon, location_query, cached_suggestions)
+
+async def find_nearby_locations_async(lat, lon, location_query, report=None):
+    """Async twin of find_nearby_locations for the ASGI serving path"""
+    
+    log_event('location_search', query=location_query, lat=lat, lon=lon)
+    
+    local_suggestions = find_local_suggestions(lat, lon, location_query)
+    if local_suggestions is not None:
+        return local_suggestions
+    
+    async def fetch():
+        all_suggestions = await search_providers_async(lat, lon, location_query, report)
+        return dedupe_and_harvest(lat, lon, location_query, all_suggestions)
     
+    cache_key = location_cache.key(location_query, lat, lon)
+    flight_key = location_flight_key(location_query, lat, lon)
+    cached_suggestions = await location_cache.get_or_fetch_async(
+        cache_key, lambda: location_flight.do_async(flight_key, fetch)
+    )
+    
+    return finalize_suggestions(lat, lon, location_query, cached_suggestions)
+
+def find_local_suggestions(lat, lon, location_query):
+    """Answer without any provider call when possible; returns None otherwise"""
     # Handle "nearest_X" format queries
     if location_query.startswith('nearest_'):
         simple_type = location_query.replace('nearest_', '').replace('_', ' ')
-        print(f"📍 Using simple nearest location for: {simple_type}")
+        log_event('location_simple_nearest', type=simple_type)
         return [{
             "type": "dropoff",
             "name": f"Nearest {simple_type}",
@@ -188,454 +910,972 @@ def find_nearby_locations(lat, lon, location_query):
             "lon": lon
         }]
     
-    # Try multiple FREE APIs in order of quality
-    all_suggestions = []
+    # Serve from the local spatial index when it knows enough places nearby
+    category = get_location_category(location_query)
+    indexed_suggestions = location_index.nearest(
+        category, lat, lon, k=10, radius_km=MAX_SUGGESTION_DISTANCE_KM,
+        min_results=LOCATION_INDEX_MIN_RESULTS
+    )
+    if len(indexed_suggestions) >= LOCATION_INDEX_MIN_RESULTS:
+        log_event('location_index_answered', category=category, results=len(indexed_suggestions))
+        return indexed_suggestions
     
-    # 1. Try Overpass API (FREE, powerful OpenStreetMap queries)
-    print("🔍 Trying Overpass API (FREE)...")
-    suggestions = try_overpass_api(lat, lon, location_query)
-    if suggestions:
-        all_suggestions.extend(suggestions)
+    return None
+
+def finalize_suggestions(lat, lon, location_query, cached_suggestions):
+    """Rank cached provider results for this user and pad with generic suggestions"""
+    # Distances are recomputed from this user's exact position
+    final_suggestions = rank_suggestions(lat, lon, cached_suggestions, MAX_SUGGESTION_DISTANCE_KM, limit=10)
     
-    # 2. Try HERE API (1000 requests/day FREE)
-    if len(all_suggestions) < 3:
-        print("🔍 Trying HERE API (FREE tier)...")
-        suggestions = try_here_api(lat, lon, location_query)
-        if suggestions:
-            all_suggestions.extend(suggestions)
+    log_event('location_results', results=len(final_suggestions), candidates=len(cached_suggestions),
+              nearest_km=final_suggestions[0]['distance_km'] if final_suggestions else None)
     
-    # 3. Try Foursquare API (FREE tier)
-    if len(all_suggestions) < 3:
-        print("🔍 Trying Foursquare API (FREE tier)...")
-        suggestions = try_foursquare_api(lat, lon, location_query)
-        if suggestions:
-            all_suggestions.extend(suggestions)
+    # If we still don't have enough results, add some generic ones
+    if len(final_suggestions) < 5:
+        final_suggestions.extend(get_generic_suggestions(lat, lon, location_query))
     
+    return final_suggestions[:10]
+
+def search_unique_suggestions(lat, lon, location_query, report=None):
+    """Query the providers and drop far-away and duplicate places"""
+    # Query all FREE APIs and their sub-queries at the same time
+    all_suggestions = search_providers_concurrently(lat, lon, location_query, report)
+    return dedupe_and_harvest(lat, lon, location_query, all_suggestions)
+
+def dedupe_and_harvest(lat, lon, location_query, all_suggestions):
+    """Drop far-away and duplicate places, remembering OpenStreetMap ones in the local index"""
     # Remove duplicates and filter by distance
-    unique_suggestions = []
-    seen_places = set()
+    unique_suggestions = rank_suggestions(lat, lon, all_suggestions, MAX_SUGGESTION_DISTANCE_KM)
     
-    for suggestion in all_suggestions:
-        # Skip if too far (more than 25km)
-        if suggestion['distance_km'] > 25:
-            continue
-        
-        # Skip duplicates (based on name and rough location)
-        place_key = f"{suggestion['name'].lower().replace(' ', '')}_{suggestion['lat']:.2f}_{suggestion['lon']:.2f}"
-        if place_key not in seen_places:
-            seen_places.add(place_key)
-            unique_suggestions.append(suggestion)
+    # Keep OpenStreetMap places around so the local index can answer next time
+    harvested = [s for s in unique_suggestions if s.get('source') == 'overpass']
+    if harvested:
+        location_index.add_harvested(get_location_category(location_query), harvested)
     
-    # Sort by distance and return top 10
-    unique_suggestions.sort(key=lambda x: x['distance_km'])
-    final_suggestions = unique_suggestions[:10]
+    return unique_suggestions
+
+def get_provider_tasks(lat, lon, location_query):
+    """List every (provider, sub-query) pair to run, in order of preference"""
+    # One Overpass task whose radius widens as needed
+    tasks = [('overpass', tuple(get_overpass_queries(lat, lon, location_query)))]
     
-    print(f"✅ Returning {len(final_suggestions)} FREE API suggestions (filtered from {len(all_suggestions)} total)")
-    for i, suggestion in enumerate(final_suggestions):
-        rating_text = f" - {suggestion.get('rating', 'N/A')}⭐" if suggestion.get('rating') else ""
-        print(f"   {i+1}. {suggestion['name']} - {suggestion['distance_km']}km{rating_text}")
+    search_terms = get_search_terms_for_category(location_query)[:2]  # Limit API calls
+    if os.getenv('HERE_API_KEY'):
+        for search_term in search_terms:
+            tasks.append(('here', search_term))
+    if os.getenv('FOURSQUARE_API_KEY'):
+        for search_term in search_terms:
+            tasks.append(('foursquare', search_term))
     
-    # If we still don't have enough results, add some generic ones
-    if len(final_suggestions) < 5:
-        final_suggestions.extend(get_generic_suggestions(lat, lon, location_query))
+    # Providers that keep failing are skipped instead of paying their timeout
+    skipped = {provider for provider, _ in tasks if not provider_clients[provider].available()}
+    if skipped:
+        log_event('providers_skipped', level='warning', providers=sorted(skipped), reason='circuit_open')
+    # So are providers without a call left in their budget, until it refills
+    exhausted = {provider for provider, _ in tasks if provider not in skipped and upstream_budgets.seconds_until(provider, 1) > 0}
+    if exhausted:
+        budget_stats.update(f'{provider}.skipped' for provider in exhausted)
+        log_event('providers_skipped', level='warning', providers=sorted(exhausted), reason='budget')
+    return [task for task in tasks if task[0] not in skipped | exhausted]
+
+def split_deferred_tasks(tasks):
+    """Number provider tasks by preference and split them into (start now, hold back).
+
+    Providers low on budget are held back until the others finish with too few
+    places; if every provider is low they all start as usual.
+    """
+    numbered = list(enumerate(tasks))
+    low = {provider for provider, _ in tasks if upstream_budgets.fraction(provider) < BUDGET_DEFER_BELOW}
+    if not low or low == {provider for provider, _ in tasks}:
+        return numbered, []
+    log_event('providers_deferred', providers=sorted(low), reason='budget')
+    return [task for task in numbered if task[1][0] not in low], [task for task in numbered if task[1][0] in low]
+
+def search_providers_concurrently(lat, lon, location_query, report=None):
+    """Run all providers in parallel until enough results arrive or the deadline passes"""
+    started = time.monotonic()
+    deadline = started + LOCATION_SEARCH_DEADLINE
+    tasks, deferred = split_deferred_tasks(get_provider_tasks(lat, lon, location_query))
     
-    return final_suggestions[:10]
+    futures = {}
+    def submit(order, provider, query):
+        timeout = min(PROVIDER_TIMEOUTS[provider], deadline - time.monotonic())
+        future = provider_executor.submit(_timed_search, provider, lat, lon, location_query, query, timeout)
+        futures[future] = (order, provider, query)
+        return future
+    
+    pending = {submit(order, provider, query) for order, (provider, query) in tasks}
+    finished = []
+    nearby_count = 0
+    while nearby_count < LOCATION_TARGET_RESULTS:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not pending:
+            if not deferred:
+                break
+            # The others came up short: spend the held-back providers' budget after all
+            budget_stats['deferred_started'] += 1
+            pending = {submit(order, provider, query) for order, (provider, query) in deferred}
+            deferred = []
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            suggestions, elapsed, error = future.result()
+            finished.append((*futures[future], suggestions, elapsed, error))
+            nearby_count += sum(1 for s in suggestions if s['distance_km'] <= MAX_SUGGESTION_DISTANCE_KM)
+    
+    # Stragglers are ignored; anything not started yet is cancelled
+    for future in pending:
+        future.cancel()
+    
+    abandoned = [futures[future] for future in pending]
+    return collect_provider_results(finished, abandoned, started, report)
 
-def try_overpass_api(lat, lon, location_query):
-    """Search using Overpass API - completely FREE and powerful OpenStreetMap queries"""
+async def search_providers_async(lat, lon, location_query, report=None):
+    """Async twin of search_providers_concurrently; stragglers are cancelled outright"""
+    started = time.monotonic()
+    deadline = started + LOCATION_SEARCH_DEADLINE
+    provider_tasks, deferred = await asyncio.to_thread(
+        lambda: split_deferred_tasks(get_provider_tasks(lat, lon, location_query))
+    )
+    
+    tasks = {}
+    def submit(order, provider, query):
+        timeout = min(PROVIDER_TIMEOUTS[provider], deadline - time.monotonic())
+        task = asyncio.ensure_future(_timed_search_async(provider, lat, lon, location_query, query, timeout))
+        tasks[task] = (order, provider, query)
+        return task
+    
+    pending = {submit(order, provider, query) for order, (provider, query) in provider_tasks}
+    finished = []
+    nearby_count = 0
     try:
-        # Create search radius (in meters)
-        radius = 15000  # 15km
-        
-        # Build category-specific Overpass queries
-        queries = []
-        
-        if 'electronic' in location_query.lower() or 'e-waste' in location_query.lower():
-            queries = [
-                f'[out:json][timeout:10];(node["shop"="electronics"](around:{radius},{lat},{lon});node["name"~"Best Buy|Staples|Future Shop"](around:{radius},{lat},{lon}););out;',
-                f'[out:json][timeout:10];(node["recycling:small_appliances"="yes"](around:{radius},{lat},{lon});node["amenity"="recycling"]["recycling_type"="centre"](around:{radius},{lat},{lon}););out;'
-            ]
-        elif 'furniture' in location_query.lower():
-            queries = [
-                f'[out:json][timeout:10];(node["shop"="charity"](around:{radius},{lat},{lon});node["name"~"Goodwill|Salvation Army|Value Village"](around:{radius},{lat},{lon}););out;',
-                f'[out:json][timeout:10];(node["shop"="second_hand"](around:{radius},{lat},{lon});node["shop"="thrift"](around:{radius},{lat},{lon}););out;'
-            ]
-        elif 'clothing' in location_query.lower():
-            queries = [
-                f'[out:json][timeout:10];(node["shop"="charity"](around:{radius},{lat},{lon});node["shop"="second_hand"](around:{radius},{lat},{lon}););out;',
-                f'[out:json][timeout:10];(node["name"~"Goodwill|Salvation Army|Value Village"](around:{radius},{lat},{lon}););out;'
-            ]
-        elif 'battery' in location_query.lower():
-            queries = [
-                f'[out:json][timeout:10];(node["amenity"="recycling"]["recycling:batteries"="yes"](around:{radius},{lat},{lon});node["shop"="car_repair"](around:{radius},{lat},{lon}););out;'
-            ]
-        elif 'recycling' in location_query.lower():
-            queries = [
-                f'[out:json][timeout:10];(node["amenity"="recycling"](around:{radius},{lat},{lon});node["amenity"="waste_disposal"](around:{radius},{lat},{lon}););out;'
-            ]
-        elif 'donation' in location_query.lower():
-            queries = [
-                f'[out:json][timeout:10];(node["shop"="charity"](around:{radius},{lat},{lon});node["amenity"="social_facility"](around:{radius},{lat},{lon}););out;'
-            ]
-        else:
-            queries = [
-                f'[out:json][timeout:10];(node["amenity"="recycling"](around:{radius},{lat},{lon});node["amenity"="waste_disposal"](around:{radius},{lat},{lon}););out;'
-            ]
-        
-        suggestions = []
-        
-        for query in queries[:2]:  # Limit to 2 queries per search
-            print(f"🔍 Running Overpass query...")
-            
-            response = requests.post(
-                'https://overpass-api.de/api/interpreter',
-                data=query,
-                timeout=15,
-                headers={'User-Agent': 'BinBuddy/1.0'}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                elements = data.get('elements', [])
-                print(f"📊 Overpass API found {len(elements)} elements")
-                
-                for element in elements:
-                    if 'lat' not in element or 'lon' not in element:
-                        continue
-                    
-                    tags = element.get('tags', {})
-                    name = tags.get('name', tags.get('operator', 'Unknown Location'))
-                    
-                    if not name or name == 'Unknown Location':
-                        continue
-                    
-                    result_lat = element['lat']
-                    result_lon = element['lon']
-                    distance = calculate_distance(lat, lon, result_lat, result_lon)
-                    
-                    # Determine type based on tags
-                    suggestion_type = determine_overpass_type(tags, location_query)
-                    
-                    # Build address from tags
-                    address_parts = []
-                    for addr_key in ['addr:housenumber', 'addr:street', 'addr:city']:
-                        if addr_key in tags:
-                            address_parts.append(tags[addr_key])
-                    address = ', '.join(address_parts) if address_parts else 'Address not available'
-                    
-                    suggestions.append({
-                        "type": suggestion_type,
-                        "name": name,
-                        "address": address,
-                        "distance_km": round(distance, 1),
-                        "lat": result_lat,
-                        "lon": result_lon,
-                        "source": "overpass"
-                    })
-                
-                if suggestions:
-                    break  # Found results, no need to try more queries
-        
-        return suggestions[:10]  # Return top 10
-        
+        while nearby_count < LOCATION_TARGET_RESULTS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not pending:
+                if not deferred:
+                    break
+                budget_stats['deferred_started'] += 1
+                pending = {submit(order, provider, query) for order, (provider, query) in deferred}
+                deferred = []
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                suggestions, elapsed, error = task.result()
+                finished.append((*tasks[task], suggestions, elapsed, error))
+                nearby_count += sum(1 for s in suggestions if s['distance_km'] <= MAX_SUGGESTION_DISTANCE_KM)
+    finally:
+        # Also reached when the search itself is cancelled, e.g. a prefetch nobody is waiting for
+        for task in pending:
+            task.cancel()
+    
+    abandoned = [tasks[task] for task in pending]
+    return collect_provider_results(finished, abandoned, started, report)
+
+def collect_provider_results(finished, abandoned, started, report=None):
+    """Merge provider results in preference order and log/report per-provider timings"""
+    finished.sort(key=lambda f: f[0])
+    timings = []
+    all_suggestions = []
+    for order, provider, query, suggestions, elapsed, error in finished:
+        all_suggestions.extend(suggestions)
+        timings.append({
+            'provider': provider,
+            'query': query if provider != 'overpass' else 'union',
+            'elapsed_ms': round(elapsed * 1000),
+            'results': len(suggestions),
+            'status': 'error' if error else 'ok'
+        })
+    for order, provider, query in sorted(abandoned):
+        timings.append({
+            'provider': provider,
+            'query': query if provider != 'overpass' else 'union',
+            'elapsed_ms': None,
+            'results': 0,
+            'status': 'abandoned'
+        })
+    
+    total_ms = round((time.monotonic() - started) * 1000)
+    answered = sorted({t['provider'] for t in timings if t['results']})
+    for timing in timings:
+        if timing['elapsed_ms'] is None:
+            metrics.events.inc(event=f"{timing['provider']}_abandoned")
+            continue
+        metrics.provider_seconds.observe(timing['elapsed_ms'] / 1000, provider=timing['provider'], status=timing['status'])
+        metrics.provider_results.inc(timing['results'], provider=timing['provider'])
+    log_event('provider_search', total_ms=total_ms, answered=answered, providers=timings)
+    
+    if report is not None:
+        report['providers'] = timings
+        report['elapsed_ms'] = total_ms
+    
+    # With no provider answering, an empty result must not be cached as "no places here"
+    if not all_suggestions and not any(timing['status'] == 'ok' for timing in timings):
+        raise ProvidersUnavailable(f"No location provider answered: {[t['status'] for t in timings]}")
+    return all_suggestions
+
+def _timed_search(provider, lat, lon, location_query, query, timeout):
+    started = time.monotonic()
+    try:
+        return run_provider_query(provider, lat, lon, location_query, query, timeout), time.monotonic() - started, None
     except Exception as e:
-        print(f"💥 Error with Overpass API: {e}")
-        return []
+        log_event('provider_error', level='error', provider=provider, error=str(e))
+        return [], time.monotonic() - started, e
 
-def try_here_api(lat, lon, location_query):
-    """Search using HERE API - 1000 requests/day FREE"""
+async def _timed_search_async(provider, lat, lon, location_query, query, timeout):
+    started = time.monotonic()
     try:
-        here_api_key = os.getenv('HERE_API_KEY')
-        if not here_api_key:
-            print("⚠️ No HERE API key found, skipping...")
-            return []
-        
-        # Build search terms
-        search_terms = get_search_terms_for_category(location_query)
-        
-        suggestions = []
-        for search_term in search_terms[:2]:  # Limit API calls
-            url = "https://discover.search.hereapi.com/v1/discover"
-            params = {
-                'at': f"{lat},{lon}",
-                'q': search_term,
-                'limit': 10,
-                'apikey': here_api_key
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                items = data.get('items', [])
-                print(f"📊 HERE API found {len(items)} results for '{search_term}'")
-                
-                for item in items:
-                    position = item.get('position', {})
-                    if 'lat' not in position or 'lng' not in position:
-                        continue
-                    
-                    result_lat = position['lat']
-                    result_lon = position['lng']
-                    distance = calculate_distance(lat, lon, result_lat, result_lon)
-                    
-                    suggestions.append({
-                        "type": determine_suggestion_type_from_categories(item.get('categories', []), location_query),
-                        "name": item.get('title', 'Unknown Location'),
-                        "address": item.get('address', {}).get('label', 'Address not available'),
-                        "distance_km": round(distance, 1),
-                        "lat": result_lat,
-                        "lon": result_lon,
-                        "source": "here"
-                    })
-                
-                if suggestions:
-                    break  # Found results
-        
-        return suggestions[:10]
-        
+        suggestions = await run_provider_query_async(provider, lat, lon, location_query, query, timeout)
+        return suggestions, time.monotonic() - started, None
     except Exception as e:
-        print(f"💥 Error with HERE API: {e}")
-        return []
+        log_event('provider_error', level='error', provider=provider, error=str(e))
+        return [], time.monotonic() - started, e
+
+def run_provider_query(provider, lat, lon, location_query, query, timeout=10):
+    """Run one provider sub-query over the pooled session and parse its results.
+
+    A tuple of queries is a widening search: each is tried in turn, within one
+    shared timeout, until LOCATION_TARGET_RESULTS places are found. Each step's
+    places are merged into the previous ones, since a capped wider query may
+    leave out what a narrower one found. Every request takes a call from the
+    provider's budget; without one the places found so far are returned.
+    ProviderError is raised when no request was answered with 200 OK, so an
+    empty list always means the provider found nothing.
+    """
+    build_request, parse_response = PROVIDER_HANDLERS[provider]
+    queries = query if isinstance(query, tuple) else (query,)
+    deadline = time.monotonic() + timeout
+    suggestions = []
+    statuses = []
+    for attempt, step in enumerate(queries):
+        if not acquire_provider_budget(provider):
+            break
+        method, url, kwargs = build_request(lat, lon, step)
+        response = provider_clients[provider].request(method, url, timeout=deadline - time.monotonic(), **kwargs)
+        check_provider_quota(provider, response)
+        statuses.append(response.status_code)
+        suggestions = merge_widened(lat, lon, suggestions, parse_response(lat, lon, location_query, step, response))
+        if not widen_search(suggestions, attempt, len(queries), deadline):
+            break
+    check_provider_answered(provider, statuses)
+    return suggestions
+
+async def run_provider_query_async(provider, lat, lon, location_query, query, timeout=10):
+    """Async twin of run_provider_query"""
+    build_request, parse_response = PROVIDER_HANDLERS[provider]
+    parse_response_async = PROVIDER_ASYNC_PARSERS.get(provider)
+    queries = query if isinstance(query, tuple) else (query,)
+    deadline = time.monotonic() + timeout
+    suggestions = []
+    statuses = []
+    for attempt, step in enumerate(queries):
+        # Budgets are SQLite write transactions shared with other workers; keep them off the event loop
+        if not await asyncio.to_thread(acquire_provider_budget, provider):
+            break
+        method, url, kwargs = build_request(lat, lon, step)
+        response = await provider_clients[provider].request_async(
+            method, url, timeout=deadline - time.monotonic(), **kwargs
+        )
+        # Parsed straight away, so a streamed response is always closed
+        if parse_response_async is not None:
+            found = await parse_response_async(lat, lon, location_query, step, response)
+        else:
+            found = parse_response(lat, lon, location_query, step, response)
+        if response.status_code == 429:
+            await asyncio.to_thread(check_provider_quota, provider, response)
+        statuses.append(response.status_code)
+        suggestions = merge_widened(lat, lon, suggestions, found)
+        if not widen_search(suggestions, attempt, len(queries), deadline):
+            break
+    check_provider_answered(provider, statuses)
+    return suggestions
+
+def acquire_provider_budget(provider):
+    """Take one call from the provider's budget; False (and counted) when it has none left"""
+    if upstream_budgets.try_acquire(provider):
+        return True
+    budget_stats[f'{provider}.denied'] += 1
+    metrics.events.inc(event=f'{provider}_over_quota')
+    return False
+
+def check_provider_quota(provider, response):
+    """Empty the provider's budget when it answers 429 despite retries, whatever our count says"""
+    if response.status_code == 429:
+        upstream_budgets.drain(provider)
+        log_event('provider_quota_exhausted', level='warning', provider=provider)
+
+def check_provider_answered(provider, statuses):
+    """Raise ProviderError unless one of a query's requests was answered with 200 OK"""
+    if 200 not in statuses:
+        raise ProviderError(f"{provider} answered {statuses}" if statuses else f"{provider} is out of budget")
 
-def try_foursquare_api(lat, lon, location_query):
-    """Search using Foursquare API - FREE tier available"""
+def merge_widened(lat, lon, found, suggestions):
+    """Places from one widening step added to those found so far, duplicates dropped"""
+    if not found:
+        return suggestions
+    return rank_suggestions(lat, lon, found + suggestions, MAX_SUGGESTION_DISTANCE_KM)
+
+def widen_search(suggestions, attempt, attempts, deadline):
+    """Whether a widening search should move on to its next, larger query"""
+    if attempt + 1 >= attempts or len(suggestions) >= LOCATION_TARGET_RESULTS:
+        return False
+    # Not worth starting another round trip with almost no time left
+    return deadline - time.monotonic() > 1
+
+def get_overpass_queries(lat, lon, location_query):
+    """Build the category's Overpass union query for each search radius, smallest first.
+
+    The cap keeps the first elements in quadtile order, not the nearest, so the
+    smallest radius is left uncapped; the stream parser bounds what it keeps.
+    """
+    filters = match_location_query(location_query)['overpass_filters']
+    return [
+        build_overpass_union(lat, lon, filters, radius, limit=OVERPASS_RESULT_LIMIT if i else None)
+        for i, radius in enumerate(OVERPASS_RADII)
+    ]
+
+def build_overpass_union(lat, lon, filters, radius, limit=None):
+    """One Overpass query over nodes, ways and relations matching any filter.
+
+    Only tags and centre points are returned, at most limit of them when given.
+    """
+    union = ''.join(f'nwr{tag_filter}(around:{radius},{lat},{lon});' for tag_filter in filters)
+    out = f'out center tags qt {limit};' if limit else 'out center tags qt;'
+    return f'[out:json][timeout:10];({union});{out}'
+
+def build_overpass_request(lat, lon, query):
+    """Overpass interpreter request for one query, with the body left unread for streaming"""
+    return 'POST', OVERPASS_URL, {'data': query, 'stream': True}
+
+def overpass_nearest(lat, lon, location_query):
+    """The bounded set of nearest places an Overpass response is parsed into"""
+    return NearestElements(
+        lat, lon, k=10, radius_km=MAX_SUGGESTION_DISTANCE_KM, settle_km=OVERPASS_SETTLE_KM,
+        suggestion_type=lambda tags: determine_overpass_type(tags, location_query)
+    )
+
+def parse_overpass_response(lat, lon, location_query, query, response):
+    """Convert Overpass elements into suggestions, parsing the body as it arrives"""
+    reader = ChunkReader(response)
+    try:
+        if response.status_code != 200:
+            return []
+        nearest = collect_nearest(reader, overpass_nearest(lat, lon, location_query))
+        log_event('overpass_parsed', elements=nearest.seen, skipped=nearest.skipped)
+    finally:
+        reader.close()
+    
+    return rank_suggestions(lat, lon, nearest.suggestions(), MAX_SUGGESTION_DISTANCE_KM, limit=10)
+
+async def parse_overpass_response_async(lat, lon, location_query, query, response):
+    """Async twin of parse_overpass_response over a streamed httpx response"""
+    reader = AsyncChunkReader(response)
     try:
-        fsq_api_key = os.getenv('FOURSQUARE_API_KEY')
-        if not fsq_api_key:
-            print("⚠️ No Foursquare API key found, skipping...")
+        if response.status_code != 200:
             return []
+        nearest = await collect_nearest_async(reader, overpass_nearest(lat, lon, location_query))
+        log_event('overpass_parsed', elements=nearest.seen, skipped=nearest.skipped)
+    finally:
+        await reader.aclose()
+    
+    return rank_suggestions(lat, lon, nearest.suggestions(), MAX_SUGGESTION_DISTANCE_KM, limit=10)
+
+def build_here_request(lat, lon, search_term):
+    """HERE discover request for one search term"""
+    params = {
+        'at': f"{lat},{lon}",
+        'q': search_term,
+        'limit': 10,
+        'apikey': os.getenv('HERE_API_KEY')
+    }
+    return 'GET', HERE_DISCOVER_URL, {'params': params}
+
+def parse_here_response(lat, lon, location_query, search_term, response):
+    """Convert HERE discover items into suggestions"""
+    suggestions = []
+    if response.status_code == 200:
+        data = response.json()
+        items = data.get('items', [])
+        log_event('here_results', term=search_term, results=len(items))
         
-        # Build search terms and categories
-        search_terms = get_search_terms_for_category(location_query)
+        for item in items:
+            position = item.get('position', {})
+            if 'lat' not in position or 'lng' not in position:
+                continue
+            
+            result_lat = position['lat']
+            result_lon = position['lng']
+            
+            suggestions.append({
+                "type": determine_suggestion_type_from_categories(item.get('categories', []), location_query),
+                "name": item.get('title', 'Unknown Location'),
+                "address": item.get('address', {}).get('label', 'Address not available'),
+                "lat": result_lat,
+                "lon": result_lon,
+                "source": "here"
+            })
+    
+    return attach_distances(lat, lon, suggestions[:10])
+
+def build_foursquare_request(lat, lon, search_term):
+    """Foursquare place search request for one search term"""
+    params = {
+        'll': f"{lat},{lon}",
+        'query': search_term,
+        'radius': 20000,  # 20km
+        'limit': 10
+    }
+    
+    headers = {
+        'Authorization': os.getenv('FOURSQUARE_API_KEY'),
+        'Accept': 'application/json'
+    }
+    return 'GET', FOURSQUARE_SEARCH_URL, {'params': params, 'headers': headers}
+
+def parse_foursquare_response(lat, lon, location_query, search_term, response):
+    """Convert Foursquare places into suggestions"""
+    suggestions = []
+    if response.status_code == 200:
+        data = response.json()
+        results = data.get('results', [])
+        log_event('foursquare_results', term=search_term, results=len(results))
         
-        suggestions = []
-        for search_term in search_terms[:2]:
-            url = "https://api.foursquare.com/v3/places/search"
-            params = {
-                'll': f"{lat},{lon}",
-                'query': search_term,
-                'radius': 20000,  # 20km
-                'limit': 10
-            }
+        for result in results:
+            geocodes = result.get('geocodes', {}).get('main', {})
+            if 'latitude' not in geocodes or 'longitude' not in geocodes:
+                continue
             
-            headers = {
-                'Authorization': fsq_api_key,
-                'Accept': 'application/json'
-            }
+            result_lat = geocodes['latitude']
+            result_lon = geocodes['longitude']
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            location_info = result.get('location', {})
+            address = location_info.get('formatted_address', 'Address not available')
             
-            if response.status_code == 200:
-                data = response.json()
-                results = data.get('results', [])
-                print(f"📊 Foursquare API found {len(results)} results for '{search_term}'")
-                
-                for result in results:
-                    geocodes = result.get('geocodes', {}).get('main', {})
-                    if 'latitude' not in geocodes or 'longitude' not in geocodes:
-                        continue
-                    
-                    result_lat = geocodes['latitude']
-                    result_lon = geocodes['longitude']
-                    distance = calculate_distance(lat, lon, result_lat, result_lon)
-                    
-                    location_info = result.get('location', {})
-                    address = location_info.get('formatted_address', 'Address not available')
-                    
-                    suggestions.append({
-                        "type": determine_suggestion_type_from_categories(result.get('categories', []), location_query),
-                        "name": result.get('name', 'Unknown Location'),
-                        "address": address,
-                        "distance_km": round(distance, 1),
-                        "lat": result_lat,
-                        "lon": result_lon,
-                        "rating": result.get('rating'),
-                        "source": "foursquare"
-                    })
-                
-                if suggestions:
-                    break
-        
-        return suggestions[:10]
-        
-    except Exception as e:
-        print(f"💥 Error with Foursquare API: {e}")
-        return []
+            suggestions.append({
+                "type": determine_suggestion_type_from_categories(result.get('categories', []), location_query),
+                "name": result.get('name', 'Unknown Location'),
+                "address": address,
+                "lat": result_lat,
+                "lon": result_lon,
+                "rating": result.get('rating'),
+                "source": "foursquare"
+            })
+    
+    return attach_distances(lat, lon, suggestions[:10])
+
+PROVIDER_HANDLERS = {
+    'overpass': (build_overpass_request, parse_overpass_response),
+    'here': (build_here_request, parse_here_response),
+    'foursquare': (build_foursquare_request, parse_foursquare_response)
+}
+# Providers whose responses the async path streams rather than reads whole
+PROVIDER_ASYNC_PARSERS = {'overpass': parse_overpass_response_async}
+
+def get_location_category(location_query):
+    """Map a location query onto the category keys used by disposal_locations"""
+    return match_location_query(location_query)['category']
 
 def get_search_terms_for_category(location_query):
     """Get search terms based on the location query category"""
-    if 'electronic' in location_query.lower() or 'e-waste' in location_query.lower():
-        return ['electronics recycling', 'Best Buy', 'computer repair', 'e-waste']
-    elif 'furniture' in location_query.lower():
-        return ['Goodwill', 'Salvation Army', 'thrift store', 'furniture donation']
-    elif 'clothing' in location_query.lower():
-        return ['clothing donation', 'Goodwill', 'thrift store', 'charity shop']
-    elif 'battery' in location_query.lower():
-        return ['battery recycling', 'auto parts store', 'car repair']
-    elif 'recycling' in location_query.lower():
-        return ['recycling center', 'waste management', 'municipal recycling']
-    elif 'donation' in location_query.lower():
-        return ['donation center', 'charity', 'Goodwill', 'Salvation Army']
-    else:
-        return ['recycling center', 'waste management']
+    return list(match_location_query(location_query)['search_terms'])
 
 def determine_overpass_type(tags, location_query):
     """Determine suggestion type from OpenStreetMap tags"""
-    shop = tags.get('shop', '').lower()
-    amenity = tags.get('amenity', '').lower()
-    name = tags.get('name', '').lower()
-    
-    if shop in ['charity', 'second_hand', 'thrift'] or 'goodwill' in name or 'salvation army' in name:
-        return "donate"
-    elif amenity in ['waste_disposal', 'waste_transfer_station'] or 'dump' in name:
-        return "dispose"
-    else:
-        return "dropoff"
+    return suggestion_type_for_tags(tags)
 
 def determine_suggestion_type_from_categories(categories, location_query):
     """Determine suggestion type from API categories"""
-    # This is a simplified version - you can expand based on actual category data
-    for category in categories:
-        cat_name = category.get('name', '').lower() if isinstance(category, dict) else str(category).lower()
-        if any(keyword in cat_name for keyword in ['charity', 'thrift', 'donation']):
-            return "donate"
-        elif any(keyword in cat_name for keyword in ['waste', 'dump', 'disposal']):
-            return "dispose"
-    
-    return "dropoff"
+    return suggestion_type_for_categories(categories)
 
 def get_generic_suggestions(lat, lon, location_query):
     """Generate generic suggestions as fallback"""
-    generic_suggestions = []
-    
-    if 'donation' in location_query.lower() or 'furniture' in location_query.lower() or 'clothing' in location_query.lower():
-        generic_suggestions.extend([
-            {
-                "type": "donate",
-                "name": "Local Goodwill Store",
-                "address": "Check maps for nearest location",
-                "distance_km": 3.2,
-                "lat": lat + 0.02,
-                "lon": lon + 0.015
-            },
-            {
-                "type": "donate",
-                "name": "Salvation Army Donation Center",
-                "address": "Check maps for nearest location", 
-                "distance_km": 4.1,
-                "lat": lat - 0.025,
-                "lon": lon + 0.02
-            }
-        ])
-    else:
-        generic_suggestions.extend([
-            {
-                "type": "dropoff",
-                "name": "Municipal Recycling Center",
-                "address": "Contact city for location",
-                "distance_km": 2.8,
-                "lat": lat + 0.015,
-                "lon": lon - 0.01
-            },
-            {
-                "type": "dropoff",
-                "name": "Local Waste Management Facility",
-                "address": "Check city website",
-                "distance_km": 5.3,
-                "lat": lat - 0.03,
-                "lon": lon + 0.025
-            }
-        ])
-    
-    return generic_suggestions
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate approximate distance in km between two coordinates"""
-    import math
-    
-    # Convert to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    r = 6371  # Earth's radius in km
-    
-    return r * c
+    return [
+        {
+            "type": template["type"],
+            "name": template["name"],
+            "address": template["address"],
+            "distance_km": template["distance_km"],
+            "lat": lat + template["lat_offset"],
+            "lon": lon + template["lon_offset"]
+        }
+        for template in GENERIC_SUGGESTIONS[match_location_query(location_query)['generic']]
+    ]
+
+def upload_limit(endpoint):
+    """Bytes an endpoint (by view function name) accepts in one request body"""
+    return UPLOAD_LIMITS.get(endpoint, MAX_UPLOAD_BYTES)
+
+def classify_shed_retry_after():
+    """Seconds a model classification should retry after while the model's budget is nearly spent, else None"""
+    bucket = model_bucket(CLASSIFICATION_MODEL)
+    if upstream_budgets.fraction(bucket) >= CLASSIFY_SHED_BELOW:
+        return None
+    # The last few calls stay for requests already admitted; new ones wait for the bucket to refill
+    capacity = upstream_budgets.limits[bucket][0]
+    return max(1, math.ceil(upstream_budgets.seconds_until(bucket, capacity * CLASSIFY_SHED_BELOW)))
+
+class UploadLimitedRequest(Request):
+    """Request whose body limit is its endpoint's, so chunked bodies are cut off at the same size"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint is not None:
+            return upload_limit(self.endpoint)
+        return super().max_content_length
+
+    def get_data(self, cache=True, as_text=False, parse_form_data=False):
+        # A bounded stream's read() quietly stops at the limit; reading in chunks raises 413 instead
+        if getattr(self, '_cached_data', None) is None and not parse_form_data:
+            self._cached_data = b''.join(iter(functools.partial(self.stream.read, UPLOAD_CHUNK_BYTES), b''))
+        return super().get_data(cache, as_text, parse_form_data)
+
+app.request_class = UploadLimitedRequest
+
+def upload_too_large_error(endpoint):
+    return f'Upload too large, the limit is {upload_limit(endpoint) // (1024 * 1024)} MB'
+
+def read_classify_upload():
+    """(image, lat, lon) of a classify request: a JSON data URL, a multipart file or a raw image/* body"""
+    kind = upload_kind(request.mimetype)
+    upload_stats[kind] += 1
+    
+    if kind == 'multipart':
+        upload = request.files.get('image')
+        return (upload.stream if upload else None,
+                parse_coordinate(request.form.get('lat')), parse_coordinate(request.form.get('lon')))
+    
+    if kind == 'raw':
+        spool = SpooledUpload(upload_limit(request.endpoint), UPLOAD_SPOOL_BYTES)
+        for chunk in iter(functools.partial(request.stream.read, UPLOAD_CHUNK_BYTES), b''):
+            spool.write(chunk)
+        return spool.finish(), parse_coordinate(request.args.get('lat')), parse_coordinate(request.args.get('lon'))
+    
+    data = request.json
+    return data.get('image'), data.get('lat'), data.get('lon')
+
+def run_classify_job(encoded_image, params):
+    """Job handler for async classification: the same work and response as a synchronous /api/classify"""
+    try:
+        image_hash = int(params['image_hash'], 16)
+        classification = get_cached_classification(image_hash)
+        if classification is None:
+            embedding = np.asarray(params['embedding'], dtype=np.float32)
+            classification = route_classification(image_hash, encoded_image, params['mime_type'], embedding)
+    except LoadShed:
+        # The job fails with the reason, rather than completing with a made-up classification
+        raise
+    except Exception as e:
+        log_event('classify_error', level='error', error=str(e), job=True)
+        classification = fallback_classification()
+    
+    remember_location_query(classification['location_query'])
+    suggestions = find_nearby_locations(params['lat'], params['lon'], classification['location_query'])
+    return build_classify_response(classification, suggestions)
+
+# Opt-in async classification (?mode=async or "Prefer: respond-async"): the image
+# is prepared and queued, the response is 202 with a job id, and a bounded pool of
+# workers in each process runs queued jobs in priority order. Jobs live in SQLite,
+# so they are shared by all workers and survive restarts
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', 200))
+JOB_RETRY_AFTER = int(os.getenv('JOB_RETRY_AFTER', 5))
+JOB_MAX_WAIT = float(os.getenv('JOB_MAX_WAIT', 25))
+job_store = SQLiteJobStore(os.path.join(CACHE_DIR, 'jobs.sqlite3'))
+job_workers = JobWorkers(
+    job_store, run_classify_job,
+    workers=JOB_WORKERS,
+    max_queued=JOB_MAX_QUEUED,
+    lease_seconds=int(os.getenv('JOB_LEASE', 30)),
+    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 2)),
+    result_ttl_seconds=int(os.getenv('JOB_RESULT_TTL', 3600))
+)
+
+def wants_async_job(mode, prefer):
+    return mode == 'async' or 'respond-async' in (prefer or '')
+
+def enqueue_classify_job(image_data, lat, lon, priority='normal'):
+    """Prepare an upload and queue it for classification; returns the job id.
+    
+    Raises ImageRejected for uploads that cannot be decoded and QueueFull when
+    too many jobs are already waiting.
+    """
+    image_hash, encoded_image, mime_type, embedding = prepare_upload(image_data)
+    params = {
+        'image_hash': f'{image_hash:016x}',
+        'mime_type': mime_type,
+        'embedding': np.asarray(embedding, dtype=np.float32).tolist(),
+        'lat': lat,
+        'lon': lon
+    }
+    return job_workers.submit(encoded_image, params, priority if priority in JOB_PRIORITIES else 'normal')
+
+def job_accepted_response(job_id):
+    """Body and headers of the 202 answer to an async classify request"""
+    status_url = f'/api/classify/{job_id}'
+    return {'job_id': job_id, 'status': 'queued', 'status_url': status_url}, {'Location': status_url}
 
 @app.route('/api/classify', methods=['POST'])
 def classify_waste():
-    """Main endpoint to classify waste and return recommendations"""
+    """Main endpoint to classify waste and return recommendations.
+    
+    Accepts JSON with a base64 data URL, multipart/form-data with an image file
+    and lat/lon fields, or a raw image/* body with lat/lon query parameters.
+    """
     try:
-        data = request.json
-        
-        # Extract data
-        image_data = data.get('image')
-        lat = data.get('lat')
-        lon = data.get('lon')
+        try:
+            image_data, lat, lon = read_classify_upload()
+        except (UploadTooLarge, RequestEntityTooLarge):
+            return jsonify({'error': upload_too_large_error(request.endpoint)}), 413
         
         if not image_data or not lat or not lon:
             return jsonify({'error': 'Missing required fields: image, lat, lon'}), 400
         
+        if wants_async_job(request.args.get('mode'), request.headers.get('Prefer')):
+            try:
+                job_id = enqueue_classify_job(image_data, lat, lon, request.args.get('priority', 'normal'))
+            except ImageRejected as e:
+                return jsonify({'error': f'Image rejected: {e}'}), 413
+            except QueueFull:
+                return jsonify({'error': 'Too many queued jobs, retry later'}), 429, {'Retry-After': str(JOB_RETRY_AFTER)}
+            body, headers = job_accepted_response(job_id)
+            return jsonify(body), 202, headers
+        
         # Classify image with Gemini (now returns comprehensive data)
-        classification = classify_image_with_gemini(image_data)
+        try:
+            classification = classify_image_with_gemini(image_data)
+        except ImageRejected as e:
+            return jsonify({'error': f'Image rejected: {e}'}), 413
+        except LoadShed as e:
+            return jsonify({'error': CLASSIFY_SHED_ERROR}), 503, {'Retry-After': str(e.retry_after)}
         
-        # Use Gemini's weight estimate and CO2 rate
-        weight = classification['estimated_weight_kg']
-        co2_saved = calculate_co2_savings(classification['co2_saved_kg_per_kg'], weight)
+        remember_location_query(classification['location_query'])
         
         # Find nearby locations using Gemini's location query
         suggestions = find_nearby_locations(lat, lon, classification['location_query'])
         
-        # Create response with all dynamic data
-        response = {
-            "image_id": str(uuid.uuid4()),
-            "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
-            
-            # Core classification
-            "main_category": classification['main_category'],
-            "specific_category": classification['specific_category'],
-            "display_name": classification['display_name'],
-            "confidence": classification['confidence'],
-            
-            # Weight and impact
-            "weight": weight,
-            "co2_saved": co2_saved,
-            "co2_rate": classification['co2_saved_kg_per_kg'],
-            
-            # Visual and interaction
-            "color": classification['color'],
-            "icon": classification['icon'],
-            
-            # Disposal guidance
-            "disposal_methods": classification['disposal_methods'],
-            "recyclable": classification['recyclable'],
-            "donation_worthy": classification['donation_worthy'],
-            
-            # Location suggestions
-            "suggestions": suggestions,
-            "location_query": classification['location_query']
-        }
+        return jsonify(build_classify_response(classification, suggestions))
+        
+    except Exception as e:
+        log_event('request_error', level='error', endpoint='classify_waste', error=str(e))
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/classify/batch', methods=['POST'])
+def classify_waste_batch():
+    """Classify many images for one location, streaming one NDJSON line per item as it completes"""
+    try:
+        data = request.json
+        
+        images = data.get('images')
+        lat = data.get('lat')
+        lon = data.get('lon')
+        
+        if not images or not isinstance(images, list) or not lat or not lon:
+            return jsonify({'error': 'Missing required fields: images, lat, lon'}), 400
+        if len(images) > CLASSIFY_BATCH_MAX_IMAGES:
+            return jsonify({'error': f'Too many images, the limit is {CLASSIFY_BATCH_MAX_IMAGES}'}), 413
+        
+        def generate():
+            for item in classify_batch(images, lat, lon, request_budget('classify_waste_batch')):
+                yield json.dumps(item) + '\n'
         
-        return jsonify(response)
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
     except Exception as e:
-        print(f"Error in classify_waste: {e}")
+        log_event('request_error', level='error', endpoint='classify_waste_batch', error=str(e))
         return jsonify({'error': 'Internal server error'}), 500
 
+def job_events(job_id):
+    """Yield SSE events for a job: its status when it changes, then done or failed with the job"""
+    last_status = None
+    last_sent = 0.0
+    while True:
+        job = job_workers.wait(job_id, 1.0)
+        if job is None:
+            yield sse_event('failed', {'job_id': job_id, 'status': 'failed', 'error': 'Job no longer exists'})
+            return
+        if job['status'] in ('done', 'failed'):
+            yield sse_event(job['status'], job)
+            return
+        # Repeated now and then, which also keeps proxies from closing an idle stream
+        if job['status'] != last_status or time.monotonic() - last_sent > 15:
+            yield sse_event('status', job)
+            last_status = job['status']
+            last_sent = time.monotonic()
+
+@app.route('/api/classify/<job_id>', methods=['GET'])
+def classify_job_status(job_id):
+    """State of an async classification job, with its result once done.
+    
+    ?wait=<seconds> long-polls until the job finishes (at most JOB_MAX_WAIT);
+    with Accept: text/event-stream the status is streamed as Server-Sent Events.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return Response(stream_with_context(job_events(job_id)), mimetype='text/event-stream', headers=SSE_HEADERS)
+    
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    job = job_workers.wait(job_id, wait)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+# Per-endpoint request budgets in seconds. The async server enforces them; with
+# threaded workers overruns are counted and gunicorn's worker timeout is the backstop
+REQUEST_BUDGETS = {
+    'classify_waste': float(os.getenv('REQUEST_BUDGET_CLASSIFY', 20)),
+    'classify_waste_batch': float(os.getenv('REQUEST_BUDGET_CLASSIFY_BATCH', 60)),
+    'generate_environmental_summary': float(os.getenv('REQUEST_BUDGET_SUMMARY', 15)),
+    'stream_environmental_summary': float(os.getenv('REQUEST_BUDGET_SUMMARY_STREAM', 30)),
+    # Long-polls wait up to JOB_MAX_WAIT
+    'classify_job_status': float(os.getenv('REQUEST_BUDGET_CLASSIFY_JOB', 30))
+}
+DEFAULT_REQUEST_BUDGET = float(os.getenv('REQUEST_BUDGET_DEFAULT', 10))
+request_budget_stats = Counter()
+
+def request_budget(endpoint):
+    """Seconds an endpoint (by view function name) may take"""
+    return REQUEST_BUDGETS.get(endpoint, DEFAULT_REQUEST_BUDGET)
+
+# A random sample of requests can be run under cProfile; profiles go to PROFILE_DIR
+request_profiler = RequestProfiler(
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    output_dir=os.getenv('PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
+)
+
+@app.before_request
+def start_request_clock():
+    g.request_started = time.monotonic()
+    g.metrics_token = metrics.start_request()
+    g.profiler = request_profiler.start()
+
+@app.before_request
+def reject_oversized_upload():
+    if request.content_length is not None and request.content_length > upload_limit(request.endpoint):
+        abort(413)
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_upload_too_large(error):
+    return jsonify({'error': upload_too_large_error(request.endpoint)}), 413
+
+@app.after_request
+def check_request_budget(response):
+    """Record the request's latency and stage timings, and count budget overruns"""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    
+    endpoint = request.endpoint or 'not_found'
+    elapsed = time.monotonic() - started
+    stages = metrics.end_request(g.metrics_token, endpoint, response.status_code, elapsed)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        log_event('request_profile', endpoint=endpoint, profile=request_profiler.stop(profiler, endpoint))
+    
+    budget = request_budget(endpoint)
+    request_budget_stats[f'{endpoint}.requests'] += 1
+    over_budget = elapsed > budget
+    if over_budget:
+        request_budget_stats[f'{endpoint}.over_budget'] += 1
+    log_event('request', level='warning' if over_budget else 'info', endpoint=endpoint,
+              status=response.status_code, ms=round(elapsed * 1000, 1), budget_s=budget, stages=stages)
+    return response
+
+# Readiness of this worker, separate from liveness (/api/health)
+server_state = {'started_at': time.time(), 'draining': False, 'import_s': None, 'warm_up': None}
+
+# Servers call warm_up() before taking traffic; under gunicorn that happens in the
+# master before forking, so the lazily imported SDK is still shared by all workers
+WARM_UP = os.getenv('WARM_UP', 'true').lower() == 'true'
+
+def warm_up():
+    """Load what the first classify and summary requests would otherwise wait for.
+
+    Returns the seconds spent per step. Safe to call more than once.
+    """
+    timings = {}
+    
+    started = time.monotonic()
+    model_registry.get(CLASSIFICATION_MODEL, CLASSIFICATION_PROMPT)
+    model_registry.get(SUMMARY_MODEL)
+    timings['models'] = round(time.monotonic() - started, 3)
+    
+    # Pillow registers its image codecs on the first decode
+    started = time.monotonic()
+    Image.init()
+    timings['image_codecs'] = round(time.monotonic() - started, 3)
+    
+    server_state['warm_up'] = timings
+    return timings
+
+def reset_after_fork():
+    """Per-worker setup after a preloading server forks this process.
+
+    SQLite connections and background threads do not survive fork(), so each
+    worker opens its own connections, restarts the location index refresh and
+    starts its job workers.
+    """
+    for store in (classification_store, flight_store, local_classifier.store if local_classifier else None, job_store,
+                  upstream_budgets):
+        if store is not None:
+            store.reset_after_fork()
+    job_workers.start()
+    if os.getenv('LOCATION_INDEX_ENABLED', 'true').lower() == 'true':
+        location_index.start_background_refresh()
+    server_state['started_at'] = time.time()
+
+def begin_draining():
+    """Report not-ready from now on, so load balancers stop routing here during shutdown"""
+    server_state['draining'] = True
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 while this worker cannot usefully take traffic"""
+    checks = {
+        'model_configured': bool(os.getenv('GEMINI_API_KEY')),
+        'not_draining': not server_state['draining']
+    }
+    ready = all(checks.values())
+    return jsonify({
+        'ready': ready,
+        'checks': checks,
+        # Informational: lookups fall back to the providers until the index has loaded
+        'location_index_loaded': location_index.loaded_at is not None,
+        'startup': {key: server_state[key] for key in ('import_s', 'warm_up')},
+        'pid': os.getpid(),
+        'uptime_s': round(time.time() - server_state['started_at'], 1),
+        'memory': memory_mb()
+    }), 200 if ready else 503
+
+@app.teardown_request
+def stop_request_profiler(error=None):
+    # after_request is skipped when a view raises; never leave the thread profiled
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms and counters of every worker, in the Prometheus text format"""
+    # Budgets live in SQLite, so every worker reports the same shared values
+    return Response(metrics.registry.render() + upstream_budgets.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now(timezone.utc).isoformat()})
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Cache and performance counters"""
+    return jsonify({
+        'classification_cache': classification_cache.stats(),
+        'location_cache': location_cache.stats(),
+        'location_index': location_index.stats(),
+        'providers': {name: client.stats() for name, client in provider_clients.items()},
+        'location_prefetch': dict(location_prefetch_stats),
+        'single_flight': {'classify': classify_flight.stats(), 'location': location_flight.stats()},
+        'local_classifier': local_classifier.stats() if local_classifier is not None else None,
+        'classify_routes': dict(classify_route_stats),
+        'models': model_registry.stats(),
+        'summary_cache': summary_cache.stats(),
+        'image_preprocess': preprocess_stats.snapshot(),
+        'uploads': dict(upload_stats),
+        'request_budgets': dict(request_budget_stats),
+        'log': structured_log.stats(),
+        'jobs': job_workers.stats(),
+        'budgets': {'buckets': upstream_budgets.snapshot(), **dict(budget_stats)}
+    })
+
 @app.route('/api/icons', methods=['GET'])
 def get_available_icons():
     """Get all available icon sets and icons"""
     return jsonify(ICON_SETS)
 
+SUMMARY_FALLBACK_MESSAGE = "We encountered an issue generating your detailed summary, but your stats are looking great! Keep up the excellent work."
+
+def build_summary_prompt(data):
+    """Build the environmental coach prompt from bucketed impact stats.
+
+    The answer is cached for every user in the bucket, so the model writes
+    placeholders for the figures and fill_summary() puts in each user's own.
+    """
+    total_co2 = data.get('total_co2_saved', 0)
+    total_items = data.get('total_items', 0)
+    total_weight = data.get('total_weight', 0)
+    categories = data.get('category_breakdown', [])
+    achievements = data.get('recent_achievements', [])
+    
+    # Data validation and enrichment
+    if not categories or not isinstance(categories, list):
+        categories = []
+    
+    # Sort categories by count to find the top one
+    top_category = sorted(categories, key=lambda x: x.get('count', 0), reverse=True)
+    top_category_name = top_category[0]['name'] if top_category else "N/A"
+    
+    # Calculate some extra metrics for the prompt
+    avg_weight_per_item = total_weight / total_items if total_items > 0 else 0
+    co2_per_item = total_co2 / total_items if total_items > 0 else 0
+    items_per_kg = total_items / total_weight if total_weight > 0 else 0
+
+    # Construct a concise and engaging prompt
+    prompt = f"""
+    Act as a passionate and encouraging Environmental Coach. Your tone should be inspiring and positive.
+    Generate a personalized environmental impact summary for a user of the Bin Buddy app.
+    **The summary must be a single paragraph, consisting of 4-5 sentences.** Do not use markdown or headers.
+
+    Here is the user's data for context (all figures are rounded):
+    - Total CO₂ Saved: about {total_co2:g} kg
+    - Total Items Processed: about {total_items}
+    - Top Category by count: {top_category_name}
+    - Category Breakdown: {json.dumps(categories)}
+    - Recent Achievements: {', '.join(achievements) if achievements else 'None yet'}
+
+    Never write these figures as numbers. Where a figure belongs, write one of these placeholders exactly, braces included, and the app fills in the user's exact value:
+    {{co2_kg}} for the kg of CO₂ saved, {{items}} for the number of items, {{weight_kg}} for the kg of waste sorted, {{tree_years}} for how many trees absorb that much CO₂ in a year.
+    Mention categories by name only, without their counts.
+
+    Please create a single paragraph of 4-5 sentences that includes the following points:
+    - **Celebrate:** Start with a "Wow!" and state their total CO₂ saved, converting it to a relatable equivalent (like planting trees).
+    - **Praise:** Mention their top category and praise their effort in that area.
+    - **Advise:** Provide ONE specific, actionable tip for what they could focus on next to increase their impact (e.g., tackle e-waste, improve recyclable sorting, or start composting).
+    - **Motivate:** End with a short, powerful sentence to encourage them.
+
+    Example Structure: "Wow, fantastic work! You've saved {{co2_kg}} kg of CO₂, as much as {{tree_years}} trees absorb in a year... You're a star when it comes to recycling {top_category_name}. To boost your impact even more, try focusing on [Actionable Tip]. Keep leading the charge for a healthier planet!"
+
+    Generate the summary now.
+    """
+    return prompt
+
+def get_summary_template(data):
+    """Template summary for low-activity stats, or None when the model should write one"""
+    summary = render_template_summary(data, SUMMARY_TEMPLATE_MAX_ITEMS)
+    if summary is not None:
+        summary_cache.record_template_hit()
+    return summary
+
+def generate_summary_text(bucketed):
+    """Ask the summary model for a fresh summary of the bucketed stats"""
+    with span('prompt_build'):
+        prompt = build_summary_prompt(bucketed)
+    with span('model_call'):
+        response = model_registry.generate(SUMMARY_MODEL, prompt)
+    return response.text.strip()
+
+async def generate_summary_text_async(bucketed):
+    """Async twin of generate_summary_text"""
+    with span('prompt_build'):
+        prompt = build_summary_prompt(bucketed)
+    with span('model_call'):
+        response = await model_registry.generate_async(SUMMARY_MODEL, prompt)
+    return response.text.strip()
+
 @app.route('/api/generate_summary', methods=['POST'])
 def generate_environmental_summary():
     """Generates a detailed, personalized environmental impact summary using Gemini."""
@@ -644,60 +1884,92 @@ def generate_environmental_summary():
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        total_co2 = data.get('total_co2_saved', 0)
-        total_items = data.get('total_items', 0)
-        total_weight = data.get('total_weight', 0)
-        categories = data.get('category_breakdown', [])
-        achievements = data.get('recent_achievements', [])
-        
-        # Data validation and enrichment
-        if not categories or not isinstance(categories, list):
-            categories = []
-        
-        # Sort categories by count to find the top one
-        top_category = sorted(categories, key=lambda x: x.get('count', 0), reverse=True)
-        top_category_name = top_category[0]['name'] if top_category else "N/A"
-        
-        # Calculate some extra metrics for the prompt
-        avg_weight_per_item = total_weight / total_items if total_items > 0 else 0
-        co2_per_item = total_co2 / total_items if total_items > 0 else 0
-        items_per_kg = total_items / total_weight if total_weight > 0 else 0
-
-        # Construct a concise and engaging prompt
-        prompt = f"""
-        Act as a passionate and encouraging Environmental Coach. Your tone should be inspiring and positive.
-        Generate a personalized environmental impact summary for a user of the Bin Buddy app.
-        **The summary must be a single paragraph, consisting of 4-5 sentences.** Do not use markdown or headers.
-
-        Here is the user's data for context:
-        - Total CO₂ Saved: {total_co2:.2f} kg
-        - Total Items Processed: {total_items}
-        - Top Category by count: {top_category_name}
-        - Category Breakdown: {json.dumps(categories)}
-        - Recent Achievements: {', '.join(achievements) if achievements else 'None yet'}
-
-        Please create a single paragraph of 4-5 sentences that includes the following points:
-        - **Celebrate:** Start with a "Wow!" and state their total CO₂ saved, converting it to a relatable equivalent (like planting trees).
-        - **Praise:** Mention their top category and praise their effort in that area.
-        - **Advise:** Provide ONE specific, actionable tip for what they could focus on next to increase their impact (e.g., tackle e-waste, improve recyclable sorting, or start composting).
-        - **Motivate:** End with a short, powerful sentence to encourage them.
-
-        Example Structure: "Wow, fantastic work! You've saved {total_co2:.2f} kg of CO₂, which is like... You're a star when it comes to recycling {top_category_name}. To boost your impact even more, try focusing on [Actionable Tip]. Keep leading the charge for a healthier planet!"
-
-        Generate the summary now.
-        """
-
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        
-        summary_text = response.text.strip()
+        summary_text = get_summary_template(data)
+        if summary_text is None:
+            # Users with similar stats share one cached summary
+            bucketed = bucket_summary_stats(data)
+            summary_text = summary_cache.get_or_generate(
+                summary_cache_key(bucketed), lambda: generate_summary_text(bucketed)
+            )
 
-        return jsonify({"summary": summary_text})
+        return jsonify({"summary": fill_summary(summary_text, summary_figures(data))})
         
     except Exception as e:
-        print(f"Error generating summary: {e}")
+        log_event('summary_error', level='error', error=str(e))
         # Simple fallback response
-        return jsonify({"summary": "We encountered an issue generating your detailed summary, but your stats are looking great! Keep up the excellent work."}), 500
+        return jsonify({"summary": SUMMARY_FALLBACK_MESSAGE}), 500
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stream_summary_events(data):
+    """Yield SSE events for a summary: text chunks as they arrive, then done (or fallback on failure)"""
+    summary_text = get_summary_template(data)
+    bucketed = bucket_summary_stats(data)
+    key = summary_cache_key(bucketed)
+    if summary_text is None:
+        summary_text = summary_cache.cached(key, lambda: generate_summary_text(bucketed))
+
+    # Templates and cache hits are complete already, send them in one go
+    figures = summary_figures(data)
+    if summary_text is not None:
+        summary_text = fill_summary(summary_text, figures)
+        yield sse_event('chunk', {'text': summary_text})
+        yield sse_event('done', {'summary': summary_text})
+        return
+
+    chunks = []
+    filler = SummaryFiller(figures)
+    try:
+        for text in model_registry.stream(SUMMARY_MODEL, build_summary_prompt(bucketed)):
+            chunks.append(text)
+            text = filler.feed(text)
+            if text:
+                yield sse_event('chunk', {'text': text})
+        text = filler.flush()
+        if text:
+            yield sse_event('chunk', {'text': text})
+    except Exception as e:
+        log_event('summary_error', level='error', error=str(e), streaming=True)
+        yield sse_event('fallback', {'summary': SUMMARY_FALLBACK_MESSAGE})
+        return
+
+    summary_text = ''.join(chunks).strip()
+    if not summary_text:
+        yield sse_event('fallback', {'summary': SUMMARY_FALLBACK_MESSAGE})
+        return
+    summary_cache.put(key, summary_text)
+    yield sse_event('done', {'summary': fill_summary(summary_text, figures)})
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Stop nginx-style proxies from buffering the stream
+    'X-Accel-Buffering': 'no'
+}
+
+@app.route('/api/generate_summary/stream', methods=['POST'])
+def stream_environmental_summary():
+    """Streams the environmental impact summary as Server-Sent Events"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    return Response(
+        stream_with_context(stream_summary_events(data)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+server_state['import_s'] = round(time.monotonic() - IMPORT_STARTED, 3)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    if WARM_UP:
+        warm_up()
+    job_workers.start()
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(
+        debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true',
+        host='0.0.0.0',
+        port=int(os.getenv('PORT', 5001))
+    ) 
\ No newline at end of file
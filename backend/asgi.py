@@ -0,0 +1,306 @@
+"""Async serving path for Bin Buddy.
+
+/api/classify, /api/generate_summary and its SSE stream run natively on the
+event loop, so one process can hold many in-flight Gemini and provider calls.
+Every other route is served by the Flask app through a WSGI adapter.
+
+Run with: uvicorn asgi:application --host 0.0.0.0 --port 5001
+or, with several workers: SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+"""
+import asyncio
+import contextlib
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as backend
+import metrics
+from budgets import LoadShed
+from image_preprocess import ImageRejected
+from jobs import QueueFull
+from structured_log import log_event
+from uploads import SpooledUpload, UploadTooLarge, parse_coordinate, upload_kind
+
+
+# Speculative location searches; the event loop only holds weak references to tasks
+prefetch_tasks = set()
+
+
+async def classify_image_with_gemini_async(image_data, on_prepared=None):
+    """Async twin of classify_image_with_gemini.
+
+    on_prepared(image_hash) is called right before the model call, so callers
+    can start work that overlaps with it.
+    """
+    try:
+        # Decoding and resizing are CPU-bound, keep them off the event loop
+        image_hash, encoded_image, mime_type, embedding = await asyncio.to_thread(backend.prepare_upload, image_data)
+
+        cached = await asyncio.to_thread(backend.get_cached_classification, image_hash)
+        if cached is not None:
+            return cached
+
+        if on_prepared is not None:
+            on_prepared(image_hash)
+
+        return await backend.route_classification_async(image_hash, encoded_image, mime_type, embedding)
+
+    except (ImageRejected, LoadShed):
+        raise
+    except Exception as e:
+        log_event('classify_error', level='error', error=str(e))
+        return backend.fallback_classification()
+
+
+def limit_body(request, max_bytes):
+    """The request with a body that raises UploadTooLarge once more than max_bytes arrive.
+
+    Covers chunked bodies, which have no Content-Length to check up front, in
+    every form: JSON, multipart and raw.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_bytes:
+                raise UploadTooLarge(f"Upload is over the {max_bytes} byte limit")
+        return message
+
+    return Request(request.scope, receive)
+
+
+async def read_classify_upload(request):
+    """Async twin of backend.read_classify_upload"""
+    kind = upload_kind(request.headers.get('content-type', '').split(';')[0].strip())
+    backend.upload_stats[kind] += 1
+
+    if kind == 'multipart':
+        # Starlette spools form files to disk past 1 MB
+        form = await request.form(max_files=1)
+        upload = form.get('image')
+        return (upload.file if getattr(upload, 'filename', None) else None,
+                parse_coordinate(form.get('lat')), parse_coordinate(form.get('lon')))
+
+    if kind == 'raw':
+        spool = SpooledUpload(backend.upload_limit('classify_waste'), backend.UPLOAD_SPOOL_BYTES)
+        async for chunk in request.stream():
+            spool.write(chunk)
+        return (spool.finish(),
+                parse_coordinate(request.query_params.get('lat')), parse_coordinate(request.query_params.get('lon')))
+
+    data = await request.json()
+    return data.get('image'), data.get('lat'), data.get('lon')
+
+
+async def classify_waste(request):
+    """Main endpoint to classify waste and return recommendations"""
+    try:
+        try:
+            image_data, lat, lon = await read_classify_upload(request)
+        except UploadTooLarge:
+            return JSONResponse({'error': backend.upload_too_large_error('classify_waste')}, status_code=413)
+
+        if not image_data or not lat or not lon:
+            return JSONResponse({'error': 'Missing required fields: image, lat, lon'}, status_code=400)
+
+        if backend.wants_async_job(request.query_params.get('mode'), request.headers.get('prefer')):
+            try:
+                job_id = await asyncio.to_thread(
+                    backend.enqueue_classify_job, image_data, lat, lon, request.query_params.get('priority', 'normal')
+                )
+            except ImageRejected as e:
+                return JSONResponse({'error': f'Image rejected: {e}'}, status_code=413)
+            except QueueFull:
+                return JSONResponse({'error': 'Too many queued jobs, retry later'}, status_code=429,
+                                    headers={'Retry-After': str(backend.JOB_RETRY_AFTER)})
+            body, headers = backend.job_accepted_response(job_id)
+            return JSONResponse(body, status_code=202, headers=headers)
+
+        # Speculatively search for the most likely location query while Gemini runs
+        prefetches = {}
+
+        def start_prefetch(image_hash):
+            guess = backend.guess_location_query(image_hash)
+            if guess and not guess.startswith('nearest_'):
+                backend.location_prefetch_stats['started'] += 1
+                task = asyncio.ensure_future(backend.find_nearby_locations_async(lat, lon, guess))
+                prefetch_tasks.add(task)
+                task.add_done_callback(prefetch_tasks.discard)
+                prefetches[guess] = task
+
+        classification = None
+        try:
+            classification = await classify_image_with_gemini_async(image_data, start_prefetch)
+        except ImageRejected as e:
+            return JSONResponse({'error': f'Image rejected: {e}'}, status_code=413)
+        except LoadShed as e:
+            return JSONResponse({'error': backend.CLASSIFY_SHED_ERROR}, status_code=503,
+                                headers={'Retry-After': str(e.retry_after)})
+        finally:
+            # Cancelling a wrong guess stops its provider calls, and the quota they
+            # spend, unless another request is waiting on the same search
+            prefetch = prefetches.pop(classification['location_query'], None) if classification else None
+            for wasted in prefetches.values():
+                backend.location_prefetch_stats['wasted'] += 1
+                wasted.cancel()
+
+        location_query = classification['location_query']
+        backend.remember_location_query(location_query)
+
+        if prefetch is not None:
+            backend.location_prefetch_stats['used'] += 1
+            suggestions = await prefetch
+        else:
+            suggestions = await backend.find_nearby_locations_async(lat, lon, location_query)
+
+        return JSONResponse(backend.build_classify_response(classification, suggestions))
+
+    except Exception as e:
+        log_event('request_error', level='error', endpoint='classify_waste', error=str(e))
+        return JSONResponse({'error': 'Internal server error'}, status_code=500)
+
+
+async def generate_environmental_summary(request):
+    """Generates a detailed, personalized environmental impact summary using Gemini."""
+    try:
+        data = await request.json()
+        if not data:
+            return JSONResponse({"error": "No data provided"}, status_code=400)
+
+        summary_text = backend.get_summary_template(data)
+        if summary_text is None:
+            bucketed = backend.bucket_summary_stats(data)
+            summary_text = await backend.summary_cache.get_or_generate_async(
+                backend.summary_cache_key(bucketed), lambda: backend.generate_summary_text_async(bucketed)
+            )
+
+        return JSONResponse({"summary": backend.fill_summary(summary_text, backend.summary_figures(data))})
+
+    except UploadTooLarge:
+        raise
+    except Exception as e:
+        log_event('summary_error', level='error', error=str(e))
+        return JSONResponse({"summary": backend.SUMMARY_FALLBACK_MESSAGE}, status_code=500)
+
+
+async def stream_summary_events(data):
+    """Async twin of backend.stream_summary_events"""
+    summary_text = backend.get_summary_template(data)
+    bucketed = backend.bucket_summary_stats(data)
+    key = backend.summary_cache_key(bucketed)
+    if summary_text is None:
+        summary_text = await backend.summary_cache.cached_async(
+            key, lambda: backend.generate_summary_text_async(bucketed)
+        )
+
+    figures = backend.summary_figures(data)
+    if summary_text is not None:
+        summary_text = backend.fill_summary(summary_text, figures)
+        yield backend.sse_event('chunk', {'text': summary_text})
+        yield backend.sse_event('done', {'summary': summary_text})
+        return
+
+    chunks = []
+    filler = backend.SummaryFiller(figures)
+    try:
+        async for text in backend.model_registry.stream_async(backend.SUMMARY_MODEL, backend.build_summary_prompt(bucketed)):
+            chunks.append(text)
+            text = filler.feed(text)
+            if text:
+                yield backend.sse_event('chunk', {'text': text})
+        text = filler.flush()
+        if text:
+            yield backend.sse_event('chunk', {'text': text})
+    except Exception as e:
+        log_event('summary_error', level='error', error=str(e), streaming=True)
+        yield backend.sse_event('fallback', {'summary': backend.SUMMARY_FALLBACK_MESSAGE})
+        return
+
+    summary_text = ''.join(chunks).strip()
+    if not summary_text:
+        yield backend.sse_event('fallback', {'summary': backend.SUMMARY_FALLBACK_MESSAGE})
+        return
+    backend.summary_cache.put(key, summary_text)
+    yield backend.sse_event('done', {'summary': backend.fill_summary(summary_text, figures)})
+
+
+async def stream_environmental_summary(request):
+    """Streams the environmental impact summary as Server-Sent Events"""
+    try:
+        data = await request.json()
+    except UploadTooLarge:
+        raise
+    except ValueError:
+        data = None
+    if not data:
+        return JSONResponse({"error": "No data provided"}, status_code=400)
+
+    return StreamingResponse(stream_summary_events(data), media_type='text/event-stream', headers=backend.SSE_HEADERS)
+
+
+def with_budget(endpoint):
+    """Answer 504 once an endpoint runs past its request budget (for a stream, until it starts).
+
+    Also records the request's latency and stage timings, like the Flask hooks do.
+    """
+    name = endpoint.__name__
+    budget = backend.request_budget(name)
+
+    async def handler(request):
+        backend.request_budget_stats[f'{name}.requests'] += 1
+        started = time.monotonic()
+        token = metrics.start_request()
+        # Like the Flask hook, refuse an oversized body before reading any of it
+        length = request.headers.get('content-length', '')
+        try:
+            if length.isdigit() and int(length) > backend.upload_limit(name):
+                response = JSONResponse({'error': backend.upload_too_large_error(name)}, status_code=413)
+            else:
+                # Chunked bodies have no Content-Length, so they are counted as they are read
+                response = await asyncio.wait_for(endpoint(limit_body(request, backend.upload_limit(name))), budget)
+        except UploadTooLarge:
+            response = JSONResponse({'error': backend.upload_too_large_error(name)}, status_code=413)
+        except asyncio.TimeoutError:
+            backend.request_budget_stats[f'{name}.over_budget'] += 1
+            response = JSONResponse({'error': 'Request took too long'}, status_code=504)
+
+        elapsed = time.monotonic() - started
+        stages = metrics.end_request(token, name, response.status_code, elapsed)
+        log_event('request', level='warning' if response.status_code == 504 else 'info', endpoint=name,
+                  status=response.status_code, ms=round(elapsed * 1000, 1), budget_s=budget, stages=stages)
+        return response
+
+    return handler
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    if backend.WARM_UP:
+        await asyncio.to_thread(backend.warm_up)
+    backend.job_workers.start()
+    yield
+    for client in backend.provider_clients.values():
+        await client.aclose()
+
+
+application = Starlette(
+    routes=[
+        Route('/api/classify', with_budget(classify_waste), methods=['POST']),
+        Route('/api/generate_summary', with_budget(generate_environmental_summary), methods=['POST']),
+        Route('/api/generate_summary/stream', with_budget(stream_environmental_summary), methods=['POST']),
+        Mount('/', app=WSGIMiddleware(backend.app))
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
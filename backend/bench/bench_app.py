@@ -0,0 +1,25 @@
+"""The backend with its Gemini models replaced by bench/stub_model.py.
+
+Served by load_test.py through the normal gunicorn.conf.py, e.g.
+  gunicorn -c gunicorn.conf.py bench.bench_app:app
+or with SERVER_MODE=asgi, bench.bench_app:application. Point the location
+providers at bench/fake_providers.py with OVERPASS_URL, HERE_DISCOVER_URL and
+FOURSQUARE_SEARCH_URL.
+"""
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+import stub_model  # noqa: E402
+
+import app as backend  # noqa: E402
+
+backend.model_registry.use_sdk(stub_model)
+
+app = backend.app
+
+if os.getenv('SERVER_MODE', 'wsgi').lower() == 'asgi':
+    from asgi import application  # noqa: E402,F401
@@ -0,0 +1,181 @@
+"""Local stand-ins for the Overpass, HERE and Foursquare APIs.
+
+Overpass requests get a fixed payload: a synthetic one of --overpass-size
+elements around CENTER, or recorded responses from --overpass-replay served
+in turn. HERE and Foursquare get ten places around the requested point. Every
+response waits --latency (+/- --jitter) seconds and --failure-rate of them
+are 503s.
+
+Point the backend at it with
+  OVERPASS_URL=http://127.0.0.1:<port>/overpass
+  HERE_DISCOVER_URL=http://127.0.0.1:<port>/here
+  FOURSQUARE_SEARCH_URL=http://127.0.0.1:<port>/foursquare
+
+Usage: python bench/fake_providers.py [--port 8901] [--overpass-size medium]
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from overpass_memory import LAT, LON, synthetic_response  # noqa: E402
+
+CENTER = (LAT, LON)
+
+# Elements per union response; a city-centre recycling query returns tens to hundreds
+OVERPASS_SIZES = {'empty': 0, 'small': 30, 'medium': 500, 'large': 5000}
+
+
+def load_replays(path):
+    """Recorded Overpass responses from a .json file or a directory of them"""
+    paths = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+    payloads = []
+    for replay_path in paths:
+        with open(replay_path, 'rb') as f:
+            payloads.append(f.read())
+    if not payloads:
+        raise SystemExit(f"No Overpass responses found in {path}")
+    return payloads
+
+
+def nearby_places(lat, lon, count=10, seed=0):
+    """(name, lat, lon, address) of count places within a few km of the point"""
+    rng = random.Random(f'{lat:.3f},{lon:.3f},{seed}')
+    return [
+        (f'Drop-off Point {i}', lat + rng.uniform(-0.03, 0.03), lon + rng.uniform(-0.03, 0.03), f'{i * 10} Main St')
+        for i in range(1, count + 1)
+    ]
+
+
+def here_payload(params):
+    lat, lon = (float(value) for value in params['at'][0].split(','))
+    return {'items': [
+        {'title': name, 'position': {'lat': place_lat, 'lng': place_lon},
+         'address': {'label': address}, 'categories': [{'name': 'Recycling Center'}]}
+        for name, place_lat, place_lon, address in nearby_places(lat, lon, seed=1)
+    ]}
+
+
+def foursquare_payload(params):
+    lat, lon = (float(value) for value in params['ll'][0].split(','))
+    return {'results': [
+        {'name': name, 'geocodes': {'main': {'latitude': place_lat, 'longitude': place_lon}},
+         'location': {'formatted_address': address}, 'categories': [{'name': 'Recycling Facility'}], 'rating': 8.1}
+        for name, place_lat, place_lon, address in nearby_places(lat, lon, seed=2)
+    ]}
+
+
+class FakeProviders(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, overpass_payloads, latency=0.2, jitter=0.05, failure_rate=0.0, seed=0):
+        super().__init__(address, FakeProviderHandler)
+        self.overpass_payloads = itertools.cycle(overpass_payloads)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed or None)
+        self.lock = threading.Lock()
+        self.served = {'overpass': 0, 'here': 0, 'foursquare': 0, 'failed': 0}
+
+    def draw(self, provider):
+        """(delay in seconds, whether to fail) for one response"""
+        with self.lock:
+            self.served[provider] += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            failed = self.rng.random() < self.failure_rate
+            if failed:
+                self.served['failed'] += 1
+            return delay, failed
+
+    def handle_error(self, request, client_address):
+        # The backend hangs up on providers it no longer needs once it has enough places
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def next_overpass_payload(self):
+        with self.lock:
+            return next(self.overpass_payloads)
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/overpass'):
+            return self.reply(404, b'{}')
+        if self.wait('overpass'):
+            return self.reply(503, b'{"remark": "injected failure"}')
+        self.reply(200, self.server.next_overpass_payload())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path.startswith('/here'):
+            provider, payload = 'here', here_payload
+        elif url.path.startswith('/foursquare'):
+            provider, payload = 'foursquare', foursquare_payload
+        elif url.path == '/stats':
+            return self.reply(200, json.dumps(self.server.served).encode())
+        else:
+            return self.reply(404, b'{}')
+        if self.wait(provider):
+            return self.reply(503, b'{"error": "injected failure"}')
+        self.reply(200, json.dumps(payload(params)).encode())
+
+    def wait(self, provider):
+        delay, failed = self.server.draw(provider)
+        time.sleep(delay)
+        return failed
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8901, help='0 picks a free port')
+    parser.add_argument('--overpass-size', default='medium',
+                        help=f"one of {', '.join(OVERPASS_SIZES)}, or an element count")
+    parser.add_argument('--overpass-replay', help='recorded Overpass response, or a directory of them')
+    parser.add_argument('--latency', type=float, default=0.2, help='mean seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.overpass_replay:
+        payloads = load_replays(args.overpass_replay)
+    else:
+        size = OVERPASS_SIZES[args.overpass_size] if args.overpass_size in OVERPASS_SIZES else int(args.overpass_size)
+        payloads = [synthetic_response(size)]
+
+    server = FakeProviders(('127.0.0.1', args.port), payloads, args.latency, args.jitter,
+                           args.failure_rate, args.seed)
+    # load_test.py reads the bound port from this line
+    print(f"Fake providers on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""Load and latency benchmark of the backend against local stand-ins.
+
+Starts bench/fake_providers.py and the backend under gunicorn.conf.py, with
+Gemini replaced by bench/stub_model.py (bench/bench_app.py), so nothing leaves
+the machine. Each endpoint is then driven at each concurrency level for
+--duration seconds by closed-loop clients. The report has p50/p95/p99
+latency, requests per second and errors per phase, plus each worker's memory
+at the end of the phase.
+
+Caches and the local classifier are off unless --caches is given, so every
+request does the full work. With --check the results are compared against
+bench/load_baseline.json and the script exits non-zero on a regression;
+baselines are only comparable when taken on the same machine with the same
+settings.
+
+Usage: python bench/load_test.py [--endpoints classify,summary,icons] [--concurrency 1,8,32]
+                                 [--duration 10] [--workers 2] [--check | --write-baseline]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, '..')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'load_baseline.json')
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_providers import CENTER  # noqa: E402
+from process_stats import memory_mb  # noqa: E402
+
+# Turn off everything that would let a repeated request skip work
+NO_CACHES = {
+    'CLASSIFY_CACHE_DISK': 'false',
+    'CLASSIFY_CACHE_SIZE': '0',
+    'LOCAL_CLASSIFIER': 'false',
+    'LOCATION_CACHE_SIZE': '0',
+    'SUMMARY_CACHE_SIZE': '0'
+}
+
+# Settings a baseline was taken with; --check refuses to compare across different ones
+COMPARED_SETTINGS = ('endpoints', 'concurrency', 'duration', 'workers', 'threads', 'server_mode',
+                     'model_latency', 'provider_latency', 'overpass_size', 'caches')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_images(count, seed=0):
+    """Distinct photo-sized JPEG data URLs, so perceptual hashes do not collide"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = Image.fromarray(rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)).resize((1600, 1200), Image.BILINEAR)
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=90)
+        images.append('data:image/jpeg;base64,' + base64.b64encode(output.getvalue()).decode())
+    return images
+
+
+def nearby_point(rng):
+    return CENTER[0] + rng.uniform(-0.02, 0.02), CENTER[1] + rng.uniform(-0.02, 0.02)
+
+
+def classify_request(rng, images):
+    lat, lon = nearby_point(rng)
+    return 'POST', '/api/classify', {'image': rng.choice(images), 'lat': lat, 'lon': lon}
+
+
+def summary_request(rng, images):
+    # More items than SUMMARY_TEMPLATE_MAX_ITEMS, so the model writes the summary
+    items = rng.randint(5, 400)
+    return 'POST', '/api/generate_summary', {
+        'total_items': items,
+        'total_co2_saved': round(items * rng.uniform(0.1, 2.0), 2),
+        'total_weight': round(items * rng.uniform(0.05, 0.5), 2),
+        'category_breakdown': [
+            {'name': name, 'count': rng.randint(1, items)} for name in rng.sample(
+                ['recyclable', 'electronic', 'donation', 'compost', 'hazardous'], 3
+            )
+        ],
+        'recent_achievements': ['First Steps']
+    }
+
+
+def icons_request(rng, images):
+    return 'GET', '/api/icons', None
+
+
+ENDPOINTS = {'classify': classify_request, 'summary': summary_request, 'icons': icons_request}
+
+
+def start_fake_providers(args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_providers.py'), '--port', '0',
+         '--overpass-size', args.overpass_size, '--latency', str(args.provider_latency),
+         '--failure-rate', str(args.provider_failure_rate)]
+        + (['--overpass-replay', args.overpass_replay] if args.overpass_replay else []),
+        stdout=subprocess.PIPE, text=True
+    )
+    return process, process.stdout.readline().split()[-1]
+
+
+def start_server(args, providers_url, cache_dir, port):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        SERVER_MODE=args.server_mode,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        GUNICORN_ACCESS_LOG=os.devnull,
+        BINBUDDY_CACHE_DIR=cache_dir,
+        LOCATION_INDEX_ENABLED='false',
+        LOG_LEVEL='WARNING',
+        OVERPASS_URL=f'{providers_url}/overpass',
+        HERE_DISCOVER_URL=f'{providers_url}/here',
+        FOURSQUARE_SEARCH_URL=f'{providers_url}/foursquare',
+        HERE_API_KEY='bench',
+        FOURSQUARE_API_KEY='bench',
+        # The fake providers have no quota; HERE's default daily budget would run out part-way through a run
+        HERE_BUDGET='',
+        GEMINI_API_KEY='bench',
+        STUB_MODEL_LATENCY=str(args.model_latency),
+        STUB_MODEL_FAILURE_RATE=str(args.model_failure_rate),
+        STUB_MODEL_SEED=str(args.seed),
+        **({} if args.caches else NO_CACHES)
+    )
+    app_name = 'bench.bench_app:application' if args.server_mode == 'asgi' else 'bench.bench_app:app'
+    log = open(os.path.join(cache_dir, 'server.log'), 'w')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', app_name],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(base_url, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"❌ Server exited with status {server.returncode}")
+        try:
+            if requests.get(f'{base_url}/api/ready', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"❌ Server not ready after {timeout}s")
+
+
+def worker_pids(master_pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, the fields after it do not
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == master_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_phase(base_url, build_request, images, concurrency, duration, seed):
+    """Closed loop: each client sends its next request as soon as the last one answers"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(number):
+        rng = random.Random(seed * 1000 + number)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            method, path, body = build_request(rng, images)
+            started = time.perf_counter()
+            try:
+                status = session.request(method, base_url + path, json=body, timeout=120).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors.append(status)
+        session.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_statuses': sorted({str(status) for status in errors}),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None
+    }
+
+
+def check(report, baseline, tolerance):
+    """Regression messages; empty when every phase is within tolerance of the baseline"""
+    if baseline['settings'] != {key: report['settings'][key] for key in baseline['settings']}:
+        return [f"settings differ from the baseline's {baseline['settings']}; rerun with those or re-baseline"]
+    problems = []
+    for name, expected in baseline['phases'].items():
+        actual = report['phases'].get(name)
+        if actual is None:
+            problems.append(f"{name} missing from this run")
+            continue
+        if actual['p95_ms'] is not None and actual['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name} p95 {actual['p95_ms']}ms exceeds baseline {expected['p95_ms']}ms by more than {tolerance:.0%}")
+        if actual['rps'] < expected['rps'] * (1 - tolerance):
+            problems.append(f"{name} {actual['rps']} rps is below baseline {expected['rps']} rps by more than {tolerance:.0%}")
+        if actual['errors'] / max(actual['requests'], 1) > expected['errors'] / max(expected['requests'], 1) + 0.01:
+            problems.append(f"{name} error rate rose: {actual['errors']}/{actual['requests']} ({actual['error_statuses']})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoints', default='classify,summary,icons', help=f"comma-separated, of {', '.join(ENDPOINTS)}")
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per phase')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds before each endpoint')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker (wsgi mode)')
+    parser.add_argument('--server-mode', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--model-latency', type=float, default=0.5, help='stub model seconds per call')
+    parser.add_argument('--model-failure-rate', type=float, default=0.0)
+    parser.add_argument('--provider-latency', type=float, default=0.2, help='fake provider seconds per response')
+    parser.add_argument('--provider-failure-rate', type=float, default=0.0)
+    parser.add_argument('--overpass-size', default='medium', help='empty, small, medium, large or an element count')
+    parser.add_argument('--overpass-replay', help='serve recorded Overpass responses from this file or directory')
+    parser.add_argument('--images', type=int, default=64, help='distinct images to upload')
+    parser.add_argument('--caches', action='store_true', help="keep the server's caches on")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='allowed p95 slowdown or RPS drop against the baseline, as a fraction')
+    parser.add_argument('--output', help='also write the report to this file')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--check', action='store_true', help='fail on a regression against the baseline')
+    mode.add_argument('--write-baseline', action='store_true')
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(',')
+    levels = [int(level) for level in args.concurrency.split(',')]
+    settings = {
+        'endpoints': endpoints, 'concurrency': levels, 'duration': args.duration, 'workers': args.workers,
+        'threads': args.threads, 'server_mode': args.server_mode, 'model_latency': args.model_latency,
+        'provider_latency': args.provider_latency, 'overpass_size': args.overpass_replay or args.overpass_size,
+        'caches': args.caches
+    }
+    images = make_images(args.images, args.seed) if 'classify' in endpoints else []
+
+    report = {'settings': settings, 'phases': {}}
+    providers, providers_url = start_fake_providers(args)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server = start_server(args, providers_url, cache_dir, port)
+        try:
+            wait_ready(base_url, server)
+            for endpoint in endpoints:
+                run_phase(base_url, ENDPOINTS[endpoint], images, max(levels), args.warmup, args.seed)
+                for level in levels:
+                    name = f'{endpoint}@{level}'
+                    phase = run_phase(base_url, ENDPOINTS[endpoint], images, level, args.duration, args.seed)
+                    phase['workers'] = {pid: memory_mb(pid) for pid in worker_pids(server.pid)}
+                    report['phases'][name] = phase
+                    print(f"{name:>14}: {phase['rps']:7.1f} rps  p50 {phase['p50_ms']}ms  p95 {phase['p95_ms']}ms  "
+                          f"p99 {phase['p99_ms']}ms  errors {phase['errors']}/{phase['requests']}", flush=True)
+        except SystemExit:
+            with open(os.path.join(cache_dir, 'server.log')) as f:
+                print(f.read()[-4000:])
+            raise
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+            providers.terminate()
+            providers.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.write_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({
+                'settings': settings,
+                'phases': {
+                    name: {key: phase[key] for key in ('requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms')}
+                    for name, phase in report['phases'].items()
+                }
+            }, f, indent=2)
+            f.write('\n')
+        print(f"✅ Wrote {BASELINE_PATH}")
+    elif args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        problems = check(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ Load within baseline")
+
+
+if __name__ == '__main__':
+    main()
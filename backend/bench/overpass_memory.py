@@ -0,0 +1,83 @@
+"""Peak memory of parsing an Overpass response whole versus streaming it.
+
+Builds a synthetic response of --elements named nodes and reports the
+tracemalloc peak and time of each path.
+
+Usage: python bench/overpass_memory.py [--elements 50000]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from location_ranking import rank_suggestions  # noqa: E402
+from overpass_stream import NearestElements, collect_nearest  # noqa: E402
+
+LAT, LON = 43.65, -79.38
+
+
+def synthetic_response(count, seed=0):
+    rng = random.Random(seed)
+    elements = []
+    for i in range(count):
+        element = {
+            'type': 'node', 'id': i,
+            'lat': LAT + rng.uniform(-0.15, 0.15), 'lon': LON + rng.uniform(-0.15, 0.15),
+            'tags': {'amenity': 'recycling', 'recycling:glass': 'yes', 'addr:street': f'Street {i % 300}'}
+        }
+        if i % 4:  # a quarter of real-world matches have no name
+            element['tags']['name'] = f'Depot {i}'
+        elements.append(element)
+    return json.dumps({'version': 0.6, 'elements': elements}).encode()
+
+
+def parse_whole(body):
+    suggestions = []
+    for element in json.loads(body)['elements']:
+        tags = element.get('tags', {})
+        if 'lat' in element and tags.get('name'):
+            suggestions.append({'name': tags['name'], 'lat': element['lat'], 'lon': element['lon']})
+    return rank_suggestions(LAT, LON, suggestions, limit=10)
+
+
+def parse_streaming(body):
+    nearest = collect_nearest(io.BytesIO(body), NearestElements(LAT, LON, k=10, settle_km=0))
+    return rank_suggestions(LAT, LON, nearest.suggestions(), limit=10)
+
+
+def measure(parse, body):
+    """(result, peak traced bytes, seconds); timed separately since tracing slows allocation"""
+    started = time.perf_counter()
+    result = parse(body)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    parse(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--elements', type=int, default=50000)
+    args = parser.parse_args()
+
+    body = synthetic_response(args.elements)
+    print(f"Response: {args.elements} elements, {len(body) / 1e6:.1f} MB")
+    results = {}
+    for name, parse in (('json.loads', parse_whole), ('streaming', parse_streaming)):
+        results[name], peak, elapsed = measure(parse, body)
+        print(f"{name:>10}: peak {peak / 1e6:7.1f} MB above the body, {elapsed * 1000:7.0f} ms")
+
+    same = [s['distance_km'] for s in results['json.loads']] == [s['distance_km'] for s in results['streaming']]
+    print(f"Same nearest distances: {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Start-up profile of the backend: import-time breakdown and time to first request.
+
+Each run imports app.py in a fresh interpreter under -X importtime, then times
+the first /api/health and /api/icons requests through the Flask test client.
+A second fresh interpreter times importing Flask and NumPy alone; start-up is
+reported relative to that reference, so it compares across machines. With
+--check the median ratios are compared against bench/startup_baseline.json and
+the script exits non-zero on a regression, or when a module that should load
+lazily was imported eagerly.
+
+Usage: python bench/startup_profile.py [--runs 5] [--check | --write-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+
+# Only the routes that need them may import these
+LAZY_MODULES = ['google.generativeai', 'httpx']
+
+# Start-up is measured in multiples of importing these, which app.py always needs
+REFERENCE_MODULES = ['flask', 'numpy']
+REFERENCE_PROBE = """
+import time
+started = time.monotonic()
+import %s
+print(time.monotonic() - started)
+""" % ', '.join(REFERENCE_MODULES)
+
+PROBE = """
+import json, sys, time
+started = time.monotonic()
+import app
+imported = time.monotonic()
+client = app.app.test_client()
+client.get('/api/health')
+first_request = time.monotonic()
+client.get('/api/icons')
+icons = time.monotonic()
+print(json.dumps({
+    'import_s': imported - started,
+    'first_request_s': first_request - started,
+    'icons_ms': (icons - first_request) * 1000,
+    'eager_modules': [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+
+def parse_importtime(stderr):
+    """Cumulative milliseconds of each module app.py (and its sibling modules) imports directly"""
+    breakdown = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            breakdown[name.strip()] = int(cumulative) / 1000
+    return breakdown
+
+
+def run_once():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Request log lines would share stdout with the probe's result
+        env = dict(os.environ, BINBUDDY_CACHE_DIR=cache_dir, LOCATION_INDEX_ENABLED='false', LOG_LEVEL='WARNING')
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        reference = subprocess.run(
+            [sys.executable, '-c', REFERENCE_PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['imports_ms'] = parse_importtime(completed.stderr)
+    result['reference_s'] = float(reference.stdout.strip().splitlines()[-1])
+    return result
+
+
+def summarize(runs):
+    imports = {}
+    for run in runs:
+        for name, ms in run['imports_ms'].items():
+            imports.setdefault(name, []).append(ms)
+    return {
+        'import_s': round(statistics.median(r['import_s'] for r in runs), 3),
+        'first_request_s': round(statistics.median(r['first_request_s'] for r in runs), 3),
+        'reference_s': round(statistics.median(r['reference_s'] for r in runs), 3),
+        # Per-run ratios, so a machine busy during one run does not skew the rest
+        'import_ratio': round(statistics.median(r['import_s'] / r['reference_s'] for r in runs), 2),
+        'first_request_ratio': round(statistics.median(r['first_request_s'] / r['reference_s'] for r in runs), 2),
+        'icons_ms': round(statistics.median(r['icons_ms'] for r in runs), 1),
+        'eager_modules': sorted({name for r in runs for name in r['eager_modules']}),
+        'imports_ms': dict(sorted(
+            ((name, round(statistics.median(ms), 1)) for name, ms in imports.items()),
+            key=lambda item: -item[1]
+        )[:15])
+    }
+
+
+def check(profile, baseline, tolerance):
+    """Regression messages; empty when the profile is within tolerance of the baseline"""
+    problems = [f"{name} is imported at start-up but should load lazily" for name in profile['eager_modules']]
+    for key in ('import_ratio', 'first_request_ratio'):
+        limit = baseline[key] * (1 + tolerance)
+        if profile[key] > limit:
+            problems.append(f"{key} {profile[key]:.2f}x the reference import exceeds baseline "
+                            f"{baseline[key]:.2f}x by more than {tolerance:.0%}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown over the baseline, as a fraction')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--check', action='store_true', help='fail on a regression against the baseline')
+    mode.add_argument('--write-baseline', action='store_true')
+    args = parser.parse_args()
+
+    profile = summarize([run_once() for _ in range(args.runs)])
+    print(json.dumps(profile, indent=2))
+
+    if args.write_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({key: profile[key] for key in ('import_ratio', 'first_request_ratio')}, f, indent=2)
+            f.write('\n')
+        print(f"✅ Wrote {BASELINE_PATH}")
+    elif args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        problems = check(profile, baseline, args.tolerance)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ Start-up within baseline")
+
+
+if __name__ == '__main__':
+    main()
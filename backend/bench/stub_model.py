@@ -0,0 +1,125 @@
+"""Stand-in for google.generativeai with configurable latency and failures.
+
+bench_app.py installs it with model_registry.use_sdk(), so the server runs its
+real request path while every model call sleeps instead of calling Gemini.
+Classification answers are picked deterministically from the image bytes;
+any other prompt gets a fixed summary paragraph.
+
+Environment:
+  STUB_MODEL_LATENCY       mean seconds per call (default 0.5)
+  STUB_MODEL_JITTER        +/- seconds spread around the mean (default 0.1)
+  STUB_MODEL_FAILURE_RATE  fraction of calls that raise (default 0)
+  STUB_MODEL_SEED          seed of the latency and failure draws
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import zlib
+
+LATENCY = float(os.getenv('STUB_MODEL_LATENCY', 0.5))
+JITTER = float(os.getenv('STUB_MODEL_JITTER', 0.1))
+FAILURE_RATE = float(os.getenv('STUB_MODEL_FAILURE_RATE', 0))
+
+_rng = random.Random(int(os.getenv('STUB_MODEL_SEED', 0)) or None)
+
+CLASSIFICATIONS = [
+    {
+        "main_category": "recyclable", "specific_category": "aluminum_can", "display_name": "Aluminum Can",
+        "estimated_weight_kg": 0.015, "confidence": "high", "co2_saved_kg_per_kg": 9.0, "color": "#2196F3",
+        "icon": "fa/FaRecycle", "disposal_methods": ["Rinse the can", "Place it in the blue bin"],
+        "location_query": "recycling center", "recyclable": True, "donation_worthy": False
+    },
+    {
+        "main_category": "electronic", "specific_category": "mobile_phone", "display_name": "Mobile Phone",
+        "estimated_weight_kg": 0.2, "confidence": "medium", "co2_saved_kg_per_kg": 20.0, "color": "#9C27B0",
+        "icon": "material/MdPhoneAndroid", "disposal_methods": ["Wipe personal data", "Take it to an e-waste drop-off"],
+        "location_query": "electronics recycling", "recyclable": True, "donation_worthy": True
+    },
+    {
+        "main_category": "donation", "specific_category": "clothing", "display_name": "Clothing",
+        "estimated_weight_kg": 0.5, "confidence": "high", "co2_saved_kg_per_kg": 15.0, "color": "#FF9800",
+        "icon": "fa/FaTshirt", "disposal_methods": ["Wash before donating"],
+        "location_query": "donation center", "recyclable": False, "donation_worthy": True
+    }
+]
+
+SUMMARY = ("You've made a real difference this month! Every item you sorted kept material in use and out of "
+           "landfill, and the CO₂ you saved adds up to weeks of work by a growing tree. Your recycling habit is "
+           "clearly taking hold. Keep snapping photos of the tricky items and your impact will keep climbing!")
+
+
+class StubModelError(Exception):
+    """Injected model failure"""
+
+
+class Usage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class StubResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def configure(**kwargs):
+    pass
+
+
+class GenerativeModel:
+    """Answers like a Gemini model handle after a randomized delay"""
+
+    def __init__(self, model_name, system_instruction=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def _answer(self, contents):
+        parts = contents if isinstance(contents, list) else [contents]
+        images = [part['data'] for part in parts if isinstance(part, dict)]
+        if not images:
+            return SUMMARY
+        answers = [CLASSIFICATIONS[zlib.crc32(data) % len(CLASSIFICATIONS)] for data in images]
+        return json.dumps(answers if len(answers) > 1 else answers[0])
+
+    def _draw(self):
+        """(delay in seconds, whether this call fails)"""
+        delay = max(0.0, LATENCY + _rng.uniform(-JITTER, JITTER))
+        return delay, _rng.random() < FAILURE_RATE
+
+    def _response(self, contents, failed):
+        if failed:
+            raise StubModelError(f'injected failure of {self.model_name}')
+        text = self._answer(contents)
+        prompt_length = sum(len(part) for part in (contents if isinstance(contents, list) else [contents])
+                            if isinstance(part, str))
+        return StubResponse(text, Usage(prompt_length // 4 + 258, len(text) // 4))
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        delay, failed = self._draw()
+        time.sleep(delay)
+        response = self._response(contents, failed)
+        return _chunks(response) if stream else response
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        delay, failed = self._draw()
+        await asyncio.sleep(delay)
+        response = self._response(contents, failed)
+        return _async_chunks(response) if stream else response
+
+
+def _split(text, size=80):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _chunks(response):
+    for text in _split(response.text):
+        yield StubResponse(text)
+
+
+async def _async_chunks(response):
+    for text in _split(response.text):
+        yield StubResponse(text)
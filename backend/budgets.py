@@ -0,0 +1,164 @@
+"""Token-bucket budgets for upstream providers and models, shared by all workers.
+
+A bucket holds up to `capacity` tokens and refills at capacity/period tokens
+per second; every upstream call takes one. Buckets live in SQLite next to the
+other stores, so all worker processes draw on the same budget and what was
+spent survives a restart. Names without a configured limit are unlimited.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class BudgetExhausted(Exception):
+    """Raised instead of making an upstream call that its budget cannot cover"""
+
+
+class LoadShed(Exception):
+    """Raised to turn a request away while its upstream budget is nearly spent"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Over quota, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def model_bucket(model_name):
+    """Bucket name of a model's budget; provider buckets are named after the provider"""
+    return f'model:{model_name}'
+
+
+def parse_budget(spec):
+    """'1000/day' or '15/60' as (capacity, period_seconds); None for an empty spec (unlimited)"""
+    spec = (spec or '').strip().lower()
+    if not spec or spec == 'unlimited':
+        return None
+    capacity, _, period = spec.partition('/')
+    period = period.strip() or 'second'
+    seconds = PERIODS[period] if period in PERIODS else float(period)
+    if float(capacity) <= 0 or seconds <= 0:
+        raise ValueError(f"Invalid budget {spec!r}, expected <count>/<second|minute|hour|day|seconds>")
+    return float(capacity), float(seconds)
+
+
+class TokenBuckets:
+    """Named token buckets persisted in SQLite; limits maps name -> (capacity, period_seconds)"""
+
+    def __init__(self, path, limits):
+        self.path = path
+        self.limits = dict(limits)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._inherited = []
+        self._denied = Counter()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            for name, (capacity, _) in self.limits.items():
+                conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", (name, capacity, now))
+                # A lowered limit applies at once
+                conn.execute("UPDATE buckets SET tokens = MIN(tokens, ?) WHERE name = ?", (capacity, name))
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def reset_after_fork(self):
+        """Forget the connection inherited from the parent process; SQLite connections must not cross fork()"""
+        # Kept referenced rather than closed: closing it here could release the parent's locks
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def _refilled(self, name, tokens, updated_at, now):
+        capacity, period = self.limits[name]
+        return min(capacity, tokens + (now - updated_at) * capacity / period)
+
+    def try_acquire(self, name, cost=1.0):
+        """Take cost tokens from the bucket if it has them; always True for unlimited names"""
+        if name not in self.limits:
+            return True
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            tokens, updated_at = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            tokens = self._refilled(name, tokens, updated_at, now)
+            granted = tokens >= cost
+            if granted:
+                tokens -= cost
+            conn.execute("UPDATE buckets SET tokens = ?, updated_at = ? WHERE name = ?", (tokens, now, name))
+        if not granted:
+            self._denied[name] += 1
+        return granted
+
+    def drain(self, name):
+        """Empty a bucket, e.g. when the upstream reports its quota used up before we counted it so"""
+        if name in self.limits:
+            conn = self._connect()
+            with conn:
+                conn.execute("UPDATE buckets SET tokens = 0, updated_at = ? WHERE name = ?", (time.time(), name))
+
+    def remaining(self, name):
+        """Tokens available now, or None for an unlimited name"""
+        if name not in self.limits:
+            return None
+        tokens, updated_at = self._connect().execute(
+            "SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)
+        ).fetchone()
+        return self._refilled(name, tokens, updated_at, time.time())
+
+    def fraction(self, name):
+        """Share of the bucket that is left, 1.0 for an unlimited name"""
+        remaining = self.remaining(name)
+        return 1.0 if remaining is None else remaining / self.limits[name][0]
+
+    def seconds_until(self, name, tokens):
+        """Seconds until the bucket holds at least tokens, 0 if it already does"""
+        remaining = self.remaining(name)
+        if remaining is None or remaining >= tokens:
+            return 0.0
+        capacity, period = self.limits[name]
+        return (tokens - remaining) * period / capacity
+
+    def snapshot(self):
+        return {
+            name: {
+                'remaining': round(self.remaining(name), 2),
+                'capacity': capacity,
+                'period_s': period,
+                'denied': self._denied[name]
+            }
+            for name, (capacity, period) in sorted(self.limits.items())
+        }
+
+    def render(self):
+        """Remaining and capacity of every bucket in the Prometheus text format"""
+        lines = [
+            '# HELP binbuddy_budget_remaining Tokens left in each upstream budget, shared by all workers',
+            '# TYPE binbuddy_budget_remaining gauge'
+        ]
+        snapshot = self.snapshot()
+        for name, bucket in snapshot.items():
+            lines.append(f'binbuddy_budget_remaining{{bucket="{name}"}} {bucket["remaining"]}')
+        lines.append('# HELP binbuddy_budget_capacity Size of each upstream budget')
+        lines.append('# TYPE binbuddy_budget_capacity gauge')
+        for name, bucket in snapshot.items():
+            lines.append(f'binbuddy_budget_capacity{{bucket="{name}"}} {bucket["capacity"]}')
+        return '\n'.join(lines) + '\n'
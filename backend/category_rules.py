@@ -0,0 +1,207 @@
+"""Declarative location-category table and the keyword matcher compiled from it.
+
+A new category only needs an entry in CATEGORY_RULES: its keywords, Overpass
+filters, provider search terms and which generic fallbacks it gets.
+"""
+import functools
+import re
+
+# In priority order: the first matching category wins
+CATEGORY_RULES = [
+    {
+        'name': 'electronic',
+        'keywords': ['electronic', 'e-waste'],
+        # Tag filters merged into one Overpass union over nodes, ways and relations
+        'overpass_filters': [
+            '["shop"="electronics"]', '["name"~"Best Buy|Staples|Future Shop"]',
+            '["recycling:small_appliances"="yes"]', '["amenity"="recycling"]["recycling_type"="centre"]'
+        ],
+        'search_terms': ['electronics recycling', 'Best Buy', 'computer repair', 'e-waste'],
+        'generic': 'dropoff'
+    },
+    {
+        'name': 'furniture',
+        'keywords': ['furniture'],
+        'overpass_filters': [
+            '["shop"="charity"]', '["name"~"Goodwill|Salvation Army|Value Village"]',
+            '["shop"="second_hand"]', '["shop"="thrift"]'
+        ],
+        'search_terms': ['Goodwill', 'Salvation Army', 'thrift store', 'furniture donation'],
+        'generic': 'donate'
+    },
+    {
+        'name': 'clothing',
+        'keywords': ['clothing'],
+        'overpass_filters': [
+            '["shop"="charity"]', '["shop"="second_hand"]', '["name"~"Goodwill|Salvation Army|Value Village"]'
+        ],
+        'search_terms': ['clothing donation', 'Goodwill', 'thrift store', 'charity shop'],
+        'generic': 'donate'
+    },
+    {
+        'name': 'battery',
+        'keywords': ['battery'],
+        'overpass_filters': ['["amenity"="recycling"]["recycling:batteries"="yes"]', '["shop"="car_repair"]'],
+        'search_terms': ['battery recycling', 'auto parts store', 'car repair'],
+        'generic': 'dropoff'
+    },
+    {
+        'name': 'recycling',
+        'keywords': ['recycling'],
+        'overpass_filters': ['["amenity"="recycling"]', '["amenity"="waste_disposal"]'],
+        'search_terms': ['recycling center', 'waste management', 'municipal recycling'],
+        'generic': 'dropoff'
+    },
+    {
+        'name': 'donation',
+        'keywords': ['donation'],
+        'overpass_filters': ['["shop"="charity"]', '["amenity"="social_facility"]'],
+        'search_terms': ['donation center', 'charity', 'Goodwill', 'Salvation Army'],
+        'generic': 'donate'
+    }
+]
+
+# Used when no keyword matches
+DEFAULT_CATEGORY = {
+    'name': 'general',
+    'keywords': [],
+    'overpass_filters': ['["amenity"="recycling"]', '["amenity"="waste_disposal"]'],
+    'search_terms': ['recycling center', 'waste management'],
+    'generic': 'dropoff'
+}
+
+# Suggestion types for provider results, checked in order
+TYPE_RULES = [
+    {
+        'type': 'donate',
+        'osm_tags': {'shop': ['charity', 'second_hand', 'thrift']},
+        'name_keywords': ['goodwill', 'salvation army'],
+        'category_keywords': ['charity', 'thrift', 'donation']
+    },
+    {
+        'type': 'dispose',
+        'osm_tags': {'amenity': ['waste_disposal', 'waste_transfer_station']},
+        'name_keywords': ['dump'],
+        'category_keywords': ['waste', 'dump', 'disposal']
+    }
+]
+DEFAULT_TYPE = 'dropoff'
+
+# Placeholder suggestions when providers return too little, offset from the user
+GENERIC_SUGGESTIONS = {
+    'donate': [
+        {"type": "donate", "name": "Local Goodwill Store", "address": "Check maps for nearest location",
+         "distance_km": 3.2, "lat_offset": 0.02, "lon_offset": 0.015},
+        {"type": "donate", "name": "Salvation Army Donation Center", "address": "Check maps for nearest location",
+         "distance_km": 4.1, "lat_offset": -0.025, "lon_offset": 0.02}
+    ],
+    'dropoff': [
+        {"type": "dropoff", "name": "Municipal Recycling Center", "address": "Contact city for location",
+         "distance_km": 2.8, "lat_offset": 0.015, "lon_offset": -0.01},
+        {"type": "dropoff", "name": "Local Waste Management Facility", "address": "Check city website",
+         "distance_km": 5.3, "lat_offset": -0.03, "lon_offset": 0.025}
+    ]
+}
+
+
+def _trie_pattern(node):
+    """Regex for every keyword in a trie node, with common prefixes factored out"""
+    alternatives = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ''
+    pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    if '' in node:
+        pattern = f'(?:{pattern})?' if len(alternatives) == 1 else pattern + '?'
+    return pattern
+
+
+class KeywordMatcher:
+    """Finds every keyword occurring in a text in one pass.
+
+    The keywords are folded into a trie, which is compiled into a single regex
+    so the scan runs inside the regex engine rather than per character in Python.
+    """
+
+    def __init__(self, keywords):
+        """keywords maps each (lowercase) keyword to the value reported when it occurs"""
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        # The regex reports the longest keyword starting at each position, which
+        # also stands for every shorter keyword that is a prefix of it
+        self._values = {
+            keyword: {value for other, value in keywords.items() if keyword.startswith(other)}
+            for keyword in keywords
+        }
+        self._pattern = re.compile(f'(?=({_trie_pattern(trie)}))' if keywords else '(?!)')
+
+    def find(self, text):
+        """Set of values whose keywords occur in text (matched case-sensitively; pass it lowercased)"""
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._values[match.group(1)]
+        return found
+
+
+_category_matcher = KeywordMatcher({
+    keyword: index for index, rule in enumerate(CATEGORY_RULES) for keyword in rule['keywords']
+})
+
+# TYPE_RULES flattened into tuples for the per-element checks
+_type_checks = [
+    (
+        rule['type'],
+        tuple((key, frozenset(values)) for key, values in rule['osm_tags'].items()),
+        tuple(rule['name_keywords']),
+        tuple(rule['category_keywords'])
+    )
+    for rule in TYPE_RULES
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def match_location_query(location_query):
+    """Everything the location search needs to know about a query, worked out once.
+
+    Returns a dict with the category name, its Overpass tag filters, search
+    terms, and the generic fallback kind.
+    """
+    matched = _category_matcher.find(location_query.lower())
+    rule = CATEGORY_RULES[min(matched)] if matched else DEFAULT_CATEGORY
+    # Any donation-type keyword in the query gets donation fallbacks, whatever the category
+    generic = 'donate' if any(CATEGORY_RULES[i]['generic'] == 'donate' for i in matched) else 'dropoff'
+    return {
+        'category': rule['name'],
+        'overpass_filters': rule['overpass_filters'],
+        'search_terms': rule['search_terms'],
+        'generic': generic
+    }
+
+
+def suggestion_type_for_tags(tags):
+    """Suggestion type of an OpenStreetMap element from its tags"""
+    # Per element, a few C-level substring tests beat any Python-side automaton
+    name = tags.get('name', '').lower()
+    for suggestion_type, osm_tags, name_keywords, _ in _type_checks:
+        for key, values in osm_tags:
+            if key in tags and tags[key].lower() in values:
+                return suggestion_type
+        for keyword in name_keywords:
+            if keyword in name:
+                return suggestion_type
+    return DEFAULT_TYPE
+
+
+def suggestion_type_for_categories(categories):
+    """Suggestion type of a HERE/Foursquare place from its category names"""
+    for category in categories:
+        cat_name = category.get('name', '').lower() if isinstance(category, dict) else str(category).lower()
+        for suggestion_type, _, _, category_keywords in _type_checks:
+            for keyword in category_keywords:
+                if keyword in cat_name:
+                    return suggestion_type
+    return DEFAULT_TYPE
@@ -0,0 +1,228 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from structured_log import log_event
+
+HASH_BITS = 64
+# The 64-bit hash is split into bands for the on-disk lookup. Two hashes within
+# a Hamming distance smaller than the band count always share at least one band,
+# so 8 bands cover every max_distance up to 7 without a full scan.
+HASH_BANDS = 8
+BAND_BITS = HASH_BITS // HASH_BANDS
+
+
+def dhash(image, hash_size=8):
+    """Compute a 64-bit difference hash of a PIL image"""
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+def _hash_bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(HASH_BANDS)]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class SQLiteClassificationStore:
+    """On-disk cache tier that survives restarts, keyed on the perceptual hash"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._inherited = []
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS classifications (
+                    hash INTEGER PRIMARY KEY,
+                    band0 INTEGER NOT NULL,
+                    band1 INTEGER NOT NULL,
+                    band2 INTEGER NOT NULL,
+                    band3 INTEGER NOT NULL,
+                    band4 INTEGER NOT NULL,
+                    band5 INTEGER NOT NULL,
+                    band6 INTEGER NOT NULL,
+                    band7 INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            for i in range(HASH_BANDS):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_band{i} ON classifications(band{i})")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def reset_after_fork(self):
+        """Forget the connection inherited from the parent process; SQLite connections must not cross fork()"""
+        # Kept referenced rather than closed: closing it here could release the parent's locks
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def get(self, image_hash, max_distance, min_created_at):
+        """Return (distance, result) of the closest stored hash, or None"""
+        conn = self._connect()
+        if max_distance < HASH_BANDS:
+            bands = _hash_bands(image_hash)
+            where = ' OR '.join(f'band{i} = ?' for i in range(HASH_BANDS))
+            rows = conn.execute(
+                f"SELECT hash, result FROM classifications WHERE ({where}) AND created_at >= ?",
+                (*bands, min_created_at)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT hash, result FROM classifications WHERE created_at >= ?",
+                (min_created_at,)
+            ).fetchall()
+
+        best = None
+        for stored_hash, result in rows:
+            distance = hamming_distance(image_hash, _to_unsigned(stored_hash))
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, result)
+
+        if best is None:
+            return None
+        return best[0], json.loads(best[1])
+
+    def put(self, image_hash, result):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO classifications (hash, {}, result, created_at) VALUES (?, {}, ?, ?)".format(
+                    ', '.join(f'band{i}' for i in range(HASH_BANDS)), ', '.join('?' * HASH_BANDS)
+                ),
+                (_to_signed(image_hash), *_hash_bands(image_hash), json.dumps(result), time.time())
+            )
+
+    def prune(self, min_created_at):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM classifications WHERE created_at < ?", (min_created_at,))
+
+
+class ClassificationCache:
+    """Two-tier (memory LRU + optional disk) cache of classification results"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=7 * 24 * 3600, max_distance=4, store=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.store = store
+        self._entries = OrderedDict()  # hash -> (expires_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, image_hash):
+        """Return a copy of the cached result for a near-duplicate image, or None"""
+        now = time.time()
+        with self._lock:
+            best_hash = None
+            best_distance = self.max_distance + 1
+            for stored_hash, (expires_at, _) in list(self._entries.items()):
+                if expires_at < now:
+                    del self._entries[stored_hash]
+                    continue
+                distance = hamming_distance(image_hash, stored_hash)
+                if distance < best_distance:
+                    best_hash, best_distance = stored_hash, distance
+                    if distance == 0:
+                        break
+
+            if best_hash is not None:
+                self._entries.move_to_end(best_hash)
+                self.hits += 1
+                return dict(self._entries[best_hash][1])
+
+        if self.store is not None:
+            try:
+                found = self.store.get(image_hash, self.max_distance, now - self.ttl_seconds)
+            except sqlite3.Error as e:
+                log_event('classification_store_error', level='warning', error=str(e))
+                found = None
+            if found is not None:
+                _, result = found
+                self._remember(image_hash, result)
+                with self._lock:
+                    self.disk_hits += 1
+                return dict(result)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def peek(self, image_hash, max_distance):
+        """Closest in-memory result within max_distance, without touching LRU order or counters"""
+        now = time.time()
+        with self._lock:
+            best = None
+            best_distance = max_distance + 1
+            for stored_hash, (expires_at, result) in self._entries.items():
+                if expires_at < now:
+                    continue
+                distance = hamming_distance(image_hash, stored_hash)
+                if distance < best_distance:
+                    best, best_distance = result, distance
+            return dict(best) if best is not None else None
+
+    def put(self, image_hash, result):
+        self._remember(image_hash, result)
+        if self.store is not None:
+            try:
+                self.store.put(image_hash, result)
+            except sqlite3.Error as e:
+                log_event('classification_store_error', level='warning', error=str(e))
+
+    def _remember(self, image_hash, result):
+        with self._lock:
+            self._entries[image_hash] = (time.time() + self.ttl_seconds, dict(result))
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                'max_distance': self.max_distance
+            }
@@ -0,0 +1,210 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from structured_log import log_event
+
+
+def _spherical_kmeans(vectors, n_lists, iterations=10, seed=0):
+    """Cluster unit vectors by cosine similarity; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+            else:
+                # Re-seed empty lists so every list stays useful
+                centroids[i] = vectors[rng.integers(len(vectors))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over unit vectors.
+
+    Vectors are grouped under the closest of n_lists centroids and stored list
+    by list, so a query only scans the n_probe lists nearest to it. The grouped
+    part is saved as .npy files and memory-mapped on load. New vectors go to an
+    in-memory tail that is searched exhaustively until the next save() folds it
+    in.
+    """
+
+    def __init__(self, dim, n_lists=64, n_probe=8, min_train_size=2048):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self._base_vectors = np.zeros((0, dim), dtype=np.float32)
+        self._base_ids = np.zeros(0, dtype=np.int64)
+        self._centroids = None
+        self._offsets = None  # list i covers rows offsets[i]:offsets[i + 1]
+        self._tail_vectors = np.zeros((256, dim), dtype=np.float32)
+        self._tail_ids = np.zeros(256, dtype=np.int64)
+        self._tail_size = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._base_ids) + self._tail_size
+
+    def max_id(self):
+        with self._lock:
+            ids = [self._base_ids.max()] if len(self._base_ids) else []
+            if self._tail_size:
+                ids.append(self._tail_ids[:self._tail_size].max())
+            return int(max(ids)) if ids else 0
+
+    def missing(self, ids):
+        """The given ids that are not in the index"""
+        with self._lock:
+            present = np.concatenate([self._base_ids, self._tail_ids[:self._tail_size]])
+        return np.setdiff1d(np.asarray(ids, dtype=np.int64), present)
+
+    def add(self, item_id, vector):
+        """Insert one unit vector under an integer id"""
+        with self._lock:
+            if self._tail_size == len(self._tail_ids):
+                self._tail_vectors = np.concatenate([self._tail_vectors, np.zeros_like(self._tail_vectors)])
+                self._tail_ids = np.concatenate([self._tail_ids, np.zeros_like(self._tail_ids)])
+            self._tail_vectors[self._tail_size] = vector
+            self._tail_ids[self._tail_size] = item_id
+            self._tail_size += 1
+            return self._tail_size
+
+    def search(self, vector, k):
+        """Return up to k (cosine similarity, id) pairs, most similar first"""
+        with self._lock:
+            base_vectors, base_ids = self._base_vectors, self._base_ids
+            centroids, offsets = self._centroids, self._offsets
+            tail_vectors = self._tail_vectors[:self._tail_size]
+            tail_ids = self._tail_ids[:self._tail_size]
+
+        similarities = [tail_vectors @ vector]
+        ids = [tail_ids]
+        if centroids is None:
+            similarities.append(base_vectors @ vector)
+            ids.append(base_ids)
+        else:
+            n_probe = min(self.n_probe, len(centroids))
+            for i in np.argpartition(-(centroids @ vector), n_probe - 1)[:n_probe]:
+                start, end = offsets[i], offsets[i + 1]
+                if end > start:
+                    similarities.append(base_vectors[start:end] @ vector)
+                    ids.append(base_ids[start:end])
+
+        similarities = np.concatenate(similarities)
+        ids = np.concatenate(ids)
+        if not len(ids):
+            return []
+        k = min(k, len(ids))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        return [(float(similarities[i]), int(ids[i])) for i in top]
+
+    def save(self, directory):
+        """Fold the tail into the list layout and write it out as .npy files.
+
+        Centroids are (re)trained once there is enough data, or when the tail
+        has outgrown the part they were trained on. Worker processes sharing a
+        directory take turns through a lock file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._save_lock, open(os.path.join(directory, 'LOCK'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                tail_size = self._tail_size
+                vectors = np.concatenate([self._base_vectors, self._tail_vectors[:tail_size]])
+                ids = np.concatenate([self._base_ids, self._tail_ids[:tail_size]])
+                centroids = self._centroids
+
+            if len(ids) >= self.min_train_size and (centroids is None or tail_size > len(ids) // 2):
+                n_lists = min(self.n_lists, max(1, len(ids) // 32))
+                sample = vectors[np.random.default_rng(0).permutation(len(vectors))[:n_lists * 256]]
+                centroids = _spherical_kmeans(sample, n_lists)
+
+            if centroids is not None:
+                assignments = np.argmax(vectors @ centroids.T, axis=1)
+                order = np.argsort(assignments, kind='stable')
+                vectors, ids = vectors[order], ids[order]
+                offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))])
+            else:
+                offsets = None
+
+            # Each save is a fresh snapshot directory; CURRENT is switched atomically,
+            # so readers in other worker processes never see a half-written index
+            try:
+                with open(os.path.join(directory, 'CURRENT')) as f:
+                    previous = f.read().strip()
+            except OSError:
+                previous = None
+            snapshot = f'snapshot-{time.time_ns()}-{os.getpid()}'
+            snapshot_dir = os.path.join(directory, snapshot)
+            os.makedirs(snapshot_dir)
+            arrays = {'vectors': vectors, 'ids': ids}
+            if centroids is not None:
+                arrays.update(centroids=centroids, offsets=offsets)
+            for name, array in arrays.items():
+                np.save(os.path.join(snapshot_dir, f'{name}.npy'), array)
+
+            tmp_path = os.path.join(directory, f'CURRENT.{os.getpid()}.tmp')
+            with open(tmp_path, 'w') as f:
+                f.write(snapshot)
+            os.replace(tmp_path, os.path.join(directory, 'CURRENT'))
+
+            # Older snapshots are unused as saves hold the lock; the previous one is kept
+            # for a worker that read CURRENT just before the switch and is still loading it
+            for name in os.listdir(directory):
+                if name.startswith('snapshot-') and name not in (snapshot, previous):
+                    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+            with self._lock:
+                # Keep anything added while the files were written
+                remaining = self._tail_size - tail_size
+                tail_vectors = np.zeros_like(self._tail_vectors)
+                tail_ids = np.zeros_like(self._tail_ids)
+                tail_vectors[:remaining] = self._tail_vectors[tail_size:self._tail_size]
+                tail_ids[:remaining] = self._tail_ids[tail_size:self._tail_size]
+                self._tail_vectors, self._tail_ids, self._tail_size = tail_vectors, tail_ids, remaining
+                self._base_vectors, self._base_ids = vectors, ids
+                self._centroids, self._offsets = centroids, offsets
+
+    @classmethod
+    def load(cls, directory, dim, **kwargs):
+        """Open a saved index with its vectors memory-mapped; returns an empty index if none is saved"""
+        index = cls(dim, **kwargs)
+        try:
+            with open(os.path.join(directory, 'CURRENT')) as f:
+                snapshot_dir = os.path.join(directory, f.read().strip())
+            vectors = np.load(os.path.join(snapshot_dir, 'vectors.npy'), mmap_mode='r')
+            ids = np.load(os.path.join(snapshot_dir, 'ids.npy'))
+        except (OSError, ValueError):
+            return index
+
+        if vectors.ndim != 2 or vectors.shape[1] != dim or len(vectors) != len(ids):
+            log_event('embedding_index_ignored', level='warning', path=snapshot_dir, shape=list(vectors.shape), dim=dim)
+            return index
+
+        index._base_vectors, index._base_ids = vectors, ids
+        centroids_path = os.path.join(snapshot_dir, 'centroids.npy')
+        if os.path.exists(centroids_path):
+            index._centroids = np.load(centroids_path)
+            index._offsets = np.load(os.path.join(snapshot_dir, 'offsets.npy'))
+        return index
+
+    def stats(self):
+        with self._lock:
+            return {
+                'vectors': len(self._base_ids) + self._tail_size,
+                'unsaved': self._tail_size,
+                'lists': len(self._centroids) if self._centroids is not None else 0,
+                'n_probe': self.n_probe,
+                'memory_mapped': isinstance(self._base_vectors, np.memmap)
+            }
@@ -0,0 +1,108 @@
+"""Production server settings for Bin Buddy.
+
+Run from backend/ with: gunicorn -c gunicorn.conf.py
+
+SERVER_MODE=wsgi (default) serves the Flask app on threaded workers;
+SERVER_MODE=asgi serves asgi:application on uvicorn workers. The app is
+preloaded in the master, so google.generativeai, PIL, numpy and the model
+handles are imported once and shared copy-on-write by every worker.
+"""
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+# Read before the app is preloaded, so cold start includes every import
+CONFIG_LOADED = time.monotonic()
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+# Workers share their metrics through snapshot files, so /metrics covers the whole server
+os.environ.setdefault('METRICS_DIR', os.path.join(
+    os.getenv('BINBUDDY_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')),
+    'metrics'
+))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+wsgi_app = 'asgi:application' if SERVER_MODE == 'asgi' else 'app:app'
+worker_class = 'uvicorn.workers.UvicornWorker' if SERVER_MODE == 'asgi' else 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Requests mostly wait on Gemini and the location providers, so threads are cheap concurrency
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+preload_app = True
+
+# Hung-worker backstop, above the largest per-endpoint budget (REQUEST_BUDGET_* in app.py)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 75))
+# Time given to in-flight requests after SIGTERM before workers are killed
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so slow leaks cannot grow without bound
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def _backend():
+    return sys.modules['app']
+
+
+def on_starting(server):
+    # Runs in the master after the app is preloaded and before any worker forks
+    backend = _backend()
+    backend.metrics.registry.clear_directory()
+    if backend.WARM_UP:
+        server.log.info(f"🔥 Warmed up in the master: {backend.warm_up()}")
+
+
+def when_ready(server):
+    memory = _backend().memory_mb()
+    server.log.info(f"🚀 Cold start {time.monotonic() - CONFIG_LOADED:.2f}s (config to listening), master {memory}")
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+    _backend().reset_after_fork()
+
+
+def post_worker_init(worker):
+    backend = _backend()
+    worker.log.info(
+        f"👷 Worker {worker.pid} ready {time.monotonic() - worker.forked_at:.2f}s after fork, "
+        f"{backend.memory_mb()}"
+    )
+
+    # Report not-ready on /api/ready while the worker drains after SIGTERM
+    if SERVER_MODE == 'asgi':
+        # uvicorn installs Server.handle_exit for SIGTERM once it starts serving,
+        # replacing any handler set here, so the drain goes in front of it instead
+        from uvicorn.server import Server
+
+        handle_exit = Server.handle_exit
+
+        def drain_and_exit(self, sig, frame):
+            backend.begin_draining()
+            handle_exit(self, sig, frame)
+
+        Server.handle_exit = drain_and_exit
+        return
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        backend.begin_draining()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    backend = _backend()
+    server.log.info(f"👋 Worker {worker.pid} exiting, {backend.memory_mb()}")
+    # Keep this worker's final counts in the merged metrics, and write out queued log lines
+    if backend.metrics.registry.directory:
+        backend.metrics.registry.flush()
+    backend.structured_log.flush()
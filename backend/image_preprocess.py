@@ -0,0 +1,128 @@
+import io
+import threading
+
+from PIL import Image, ImageOps
+
+from metrics import span
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+class ImageRejected(ValueError):
+    """Raised for uploads that should not be decoded at all"""
+
+
+class PreprocessStats:
+    """Running totals of bytes and pixels before and after preprocessing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.pixels_in = 0
+        self.pixels_out = 0
+
+    def record(self, info):
+        with self._lock:
+            self.images += 1
+            self.bytes_in += info['bytes_in']
+            self.bytes_out += info['bytes_out']
+            self.pixels_in += info['width_in'] * info['height_in']
+            self.pixels_out += info['width_out'] * info['height_out']
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'images': self.images,
+                'rejected': self.rejected,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'pixels_in': self.pixels_in,
+                'pixels_out': self.pixels_out,
+                'compression_ratio': round(self.bytes_in / self.bytes_out, 2) if self.bytes_out else 0.0
+            }
+
+
+def _flatten_to_rgb(image):
+    """Convert to RGB, compositing transparent images onto white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def prepare_image(image_source, max_edge=1024, quality=85, image_format='JPEG', max_pixels=64_000_000):
+    """Downscale and re-encode an uploaded photo before sending it to the model.
+
+    image_source is the upload as bytes or as a seekable binary file, which is
+    decoded in place rather than copied. Returns (image, encoded_bytes,
+    mime_type, info) where image is the downscaled RGB PIL image and info holds
+    the per-request byte/size metrics.
+    """
+    image_format = image_format.upper()
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported output format: {image_format}")
+
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        bytes_in = len(image_source)
+        image_source = io.BytesIO(image_source)
+    else:
+        bytes_in = image_source.seek(0, io.SEEK_END)
+        image_source.seek(0)
+
+    with span('image_open'):
+        # Pillow refuses images over twice its MAX_IMAGE_PIXELS itself; max_pixels below catches smaller ones
+        try:
+            image = Image.open(image_source)
+        except Image.DecompressionBombError as e:
+            raise ImageRejected(str(e))
+
+        # Image.open only reads the header, so this runs before any pixel data is decoded
+        width_in, height_in = image.size
+        if width_in * height_in > max_pixels:
+            raise ImageRejected(f"Image has {width_in * height_in} pixels, limit is {max_pixels}")
+
+        # JPEG can decode straight to a smaller scale (1/2, 1/4, 1/8) for free
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_edge, max_edge))
+
+        # Decode now, so the open stage covers decoding and resize covers only resizing
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        image = _flatten_to_rgb(image)
+
+    with span('image_resize'):
+        longest = max(image.size)
+        if longest > max_edge:
+            factor = longest // max_edge
+            if factor >= 2:
+                image = image.reduce(factor)
+            if max(image.size) > max_edge:
+                scale = max_edge / max(image.size)
+                new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+    with span('image_encode'):
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=quality)
+        encoded = output.getvalue()
+
+    info = {
+        'bytes_in': bytes_in,
+        'bytes_out': len(encoded),
+        'width_in': width_in,
+        'height_in': height_in,
+        'width_out': image.width,
+        'height_out': image.height
+    }
+    return image, encoded, MIME_TYPES[image_format], info
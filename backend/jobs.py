@@ -0,0 +1,305 @@
+"""Asynchronous classification jobs: a SQLite job table and a bounded worker pool.
+
+An async /api/classify request stores its prepared image as a queued job and
+returns a job id at once. Every server process runs a few JobWorkers threads
+that claim queued jobs in priority order, run them and store the result for
+GET /api/classify/<job_id>. Claims are leases, so a job whose worker died is
+picked up again, and queued jobs survive a restart.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+
+from structured_log import log_event
+
+JOB_PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+FINISHED = ('done', 'failed')
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already waiting; the client should retry later"""
+
+
+class SQLiteJobStore:
+    """Job queue and results shared by worker processes on one host"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._inherited = []
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    params TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    lease_until REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority, created_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def reset_after_fork(self):
+        """Forget the connection inherited from the parent process; SQLite connections must not cross fork()"""
+        # Kept referenced rather than closed: closing it here could release the parent's locks
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def add(self, job_id, priority, payload, params, max_queued):
+        """Queue a job unless max_queued jobs are already waiting; returns whether it was queued"""
+        conn = self._connect()
+        with conn:
+            # Counting and inserting in one write transaction keeps the bound exact across processes
+            conn.execute('BEGIN IMMEDIATE')
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= max_queued:
+                return False
+            conn.execute(
+                "INSERT INTO jobs (id, status, priority, payload, params, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, priority, payload, json.dumps(params), time.time())
+            )
+        return True
+
+    def claim(self, lease_seconds, max_attempts):
+        """Lease the most urgent queued job; returns (job_id, payload, params) or None.
+
+        Jobs whose lease ran out are queued again first, or failed once they
+        have used up max_attempts.
+        """
+        now = time.time()
+        conn = self._connect()
+        # Cheap read first, so idle workers do not take the write lock every poll
+        if conn.execute(
+            "SELECT 1 FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) LIMIT 1", (now,)
+        ).fetchone() is None:
+            return None
+
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_until = NULL "
+                "WHERE status = 'running' AND lease_until < ? AND attempts < ?",
+                (now, max_attempts)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker lost', finished_at = ?, payload = x'' "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now, now)
+            )
+            row = conn.execute(
+                "SELECT id, payload, params FROM jobs WHERE status = 'queued' ORDER BY priority, created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ? "
+                "WHERE id = ?",
+                (now, now + lease_seconds, row[0])
+            )
+        return row[0], row[1], json.loads(row[2])
+
+    def renew(self, job_ids, lease_seconds):
+        """Extend the leases of jobs that are still running"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND id IN ({})".format(
+                    ', '.join('?' * len(job_ids))
+                ),
+                (time.time() + lease_seconds, *job_ids)
+            )
+
+    def finish(self, job_id, result=None, error=None):
+        """Store a job's outcome; the image is dropped as it is no longer needed"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, payload = x'', lease_until = NULL "
+                "WHERE id = ?",
+                ('failed' if error is not None else 'done', json.dumps(result) if result is not None else None,
+                 error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        """The job's state as a dict, or None for an unknown id"""
+        row = self._connect().execute(
+            "SELECT status, priority, result, error, attempts, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, priority, result, error, attempts, created_at, started_at, finished_at = row
+        job = {'job_id': job_id, 'status': status, 'attempts': attempts, 'created_at': created_at,
+               'started_at': started_at, 'finished_at': finished_at}
+        if status == 'queued':
+            job['queue_position'] = self._connect().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND created_at < ?))",
+                (priority, priority, created_at)
+            ).fetchone()[0] + 1
+        if result is not None:
+            job['result'] = json.loads(result)
+        if error is not None:
+            job['error'] = error
+        return job
+
+    def counts(self):
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def prune(self, min_finished_at):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (min_finished_at,))
+
+
+class JobWorkers:
+    """Bounded pool of threads running jobs from a SQLiteJobStore.
+
+    handler(payload, params) returns the job's JSON-serializable result. The
+    pool wakes at once for jobs submitted in this process and polls for jobs
+    queued by other processes or left over from before a restart. Leases of
+    running jobs are renewed every third of lease_seconds, so only jobs of a
+    worker that died are picked up again, however long they run.
+    """
+
+    def __init__(self, store, handler, workers=4, max_queued=200, lease_seconds=30, max_attempts=2,
+                 poll_seconds=1.0, result_ttl_seconds=3600):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self._wake = threading.Condition()
+        self._finished = threading.Condition()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._running = set()
+        self._last_prune = 0.0
+        self._stats = Counter(submitted=0, rejected=0, completed=0, failed=0)
+
+    def start(self):
+        """Start this process's worker threads; a no-op once running (also after fork)"""
+        with self._lock:
+            if self._started_pid == os.getpid() or self.workers <= 0:
+                return
+            self._started_pid = os.getpid()
+        # Jobs claimed before a fork belong to the parent
+        self._running = set()
+        for number in range(self.workers):
+            threading.Thread(target=self._run, name=f'job-worker-{number}', daemon=True).start()
+        threading.Thread(target=self._renew_loop, name='job-lease', daemon=True).start()
+
+    def submit(self, payload, params, priority='normal'):
+        """Queue a job and return its id; raises QueueFull when max_queued jobs are waiting"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        if not self.store.add(job_id, JOB_PRIORITIES.get(priority, JOB_PRIORITIES['normal']), payload, params,
+                              self.max_queued):
+            self._stats['rejected'] += 1
+            raise QueueFull(f"{self.max_queued} jobs are already queued")
+        self._stats['submitted'] += 1
+        with self._wake:
+            self._wake.notify()
+        return job_id
+
+    def _run(self):
+        while True:
+            try:
+                claimed = self.store.claim(self.lease_seconds, self.max_attempts)
+            except sqlite3.Error as e:
+                log_event('job_store_error', level='warning', error=str(e))
+                claimed = None
+            if claimed is None:
+                with self._wake:
+                    self._wake.wait(self.poll_seconds)
+                self._prune()
+                continue
+
+            try:
+                self._process(*claimed)
+            except sqlite3.Error as e:
+                # The lease runs out and another worker retries the job
+                log_event('job_store_error', level='warning', job_id=claimed[0], error=str(e))
+            with self._finished:
+                self._finished.notify_all()
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                self.store.renew(running, self.lease_seconds)
+            except sqlite3.Error as e:
+                log_event('job_store_error', level='warning', error=str(e))
+
+    def _process(self, job_id, payload, params):
+        started = time.monotonic()
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            result = self.handler(payload, params)
+        except Exception as e:
+            self._stats['failed'] += 1
+            log_event('job_failed', level='error', job_id=job_id, error=str(e))
+            self.store.finish(job_id, error=str(e))
+            return
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+        self._stats['completed'] += 1
+        self.store.finish(job_id, result=result)
+        log_event('job_done', job_id=job_id, ms=round((time.monotonic() - started) * 1000, 1))
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        try:
+            self.store.prune(now - self.result_ttl_seconds)
+        except sqlite3.Error as e:
+            log_event('job_store_error', level='warning', error=str(e))
+
+    def wait(self, job_id, timeout):
+        """The job's state once it has finished, or its current state after timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in FINISHED or remaining <= 0:
+                return job
+            # Woken early by jobs finishing here; jobs run by other processes are polled
+            with self._finished:
+                self._finished.wait(min(remaining, self.poll_seconds))
+
+    def stats(self):
+        return {'workers': self.workers, 'max_queued': self.max_queued,
+                **dict(self._stats), 'jobs': self.store.counts()}
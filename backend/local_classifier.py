@@ -0,0 +1,325 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from embedding_index import IVFIndex
+from structured_log import log_event
+
+# 8x4x4 HSV colour bins plus 4x4 cells of 8 gradient orientations
+EMBEDDING_DIM = 8 * 4 * 4 + 4 * 4 * 8
+
+
+def image_embedding(image):
+    """Small CPU-only descriptor of an image: colour histogram plus gradient orientation histogram"""
+    rgb = image.convert('RGB').resize((64, 64), Image.Resampling.BILINEAR)
+
+    hsv = np.asarray(rgb.convert('HSV'), dtype=np.float32).reshape(-1, 3) / 256.0
+    colour, _ = np.histogramdd(hsv, bins=(8, 4, 4), range=((0, 1), (0, 1), (0, 1)))
+    colour = np.sqrt(colour.ravel() / colour.sum())
+
+    gray = np.asarray(rgb.convert('L'), dtype=np.float32)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = np.minimum((np.arctan2(gy, gx) % np.pi) / np.pi * 8, 7).astype(np.int64)
+    rows, cols = np.indices(gray.shape)
+    cells = (rows // 16) * 4 + cols // 16
+    gradients = np.bincount((cells * 8 + orientation).ravel(), weights=magnitude.ravel(), minlength=128)
+    norm = np.linalg.norm(gradients)
+    if norm > 0:
+        gradients = gradients / norm
+
+    embedding = np.concatenate([colour, gradients]).astype(np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+class SQLiteExampleStore:
+    """Labelled examples (embedding + validated model answer) that survive restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._inherited = []
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS labelled_examples (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hash TEXT UNIQUE NOT NULL,
+                    category TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_examples_created ON labelled_examples(created_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def reset_after_fork(self):
+        """Forget the connection inherited from the parent process; SQLite connections must not cross fork()"""
+        # Kept referenced rather than closed: closing it here could release the parent's locks
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def put(self, example_hash, embedding, result):
+        """Insert or update an example; returns (id, previous category or None if new)"""
+        conn = self._connect()
+        category = result['specific_category']
+        with conn:
+            row = conn.execute(
+                "SELECT id, category FROM labelled_examples WHERE hash = ?", (example_hash,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE labelled_examples SET category = ?, result = ?, created_at = ? WHERE id = ?",
+                    (category, json.dumps(result), time.time(), row[0])
+                )
+                return row[0], row[1]
+
+            cursor = conn.execute(
+                "INSERT INTO labelled_examples (hash, category, embedding, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (example_hash, category, np.asarray(embedding, dtype=np.float32).tobytes(),
+                 json.dumps(result), time.time())
+            )
+            return cursor.lastrowid, None
+
+    def results(self, ids):
+        """Stored results by id; ids that were pruned are left out"""
+        ids = list(ids)
+        rows = self._connect().execute(
+            f"SELECT id, result FROM labelled_examples WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return {example_id: json.loads(result) for example_id, result in rows}
+
+    def ids(self):
+        rows = self._connect().execute("SELECT id FROM labelled_examples ORDER BY id").fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def embeddings(self, ids):
+        """(id, embedding) of the given examples, in id order"""
+        ids = [int(example_id) for example_id in ids]
+        rows = []
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows += self._connect().execute(
+                f"SELECT id, embedding FROM labelled_examples WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY id",
+                chunk
+            ).fetchall()
+        return [(example_id, np.frombuffer(embedding, dtype=np.float32)) for example_id, embedding in rows]
+
+    def embeddings_after(self, last_id):
+        """(id, embedding) of every example newer than last_id"""
+        rows = self._connect().execute(
+            "SELECT id, embedding FROM labelled_examples WHERE id > ? ORDER BY id", (last_id,)
+        ).fetchall()
+        return [(example_id, np.frombuffer(embedding, dtype=np.float32)) for example_id, embedding in rows]
+
+    def max_id(self):
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM labelled_examples").fetchone()[0]
+
+    def category_counts(self):
+        rows = self._connect().execute(
+            "SELECT category, COUNT(*) FROM labelled_examples GROUP BY category"
+        ).fetchall()
+        return Counter(dict(rows))
+
+    def prune(self, keep):
+        """Drop all but the newest keep examples; returns how many were removed"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM labelled_examples WHERE id NOT IN "
+                "(SELECT id FROM labelled_examples ORDER BY created_at DESC LIMIT ?)", (keep,)
+            )
+        return cursor.rowcount
+
+
+class LocalClassifier:
+    """k-nearest-neighbour classifier over embeddings of past model answers.
+
+    Neighbours come from an IVF embedding index kept next to the example store.
+    A neighbour within reuse_similarity is returned as is; otherwise the answer
+    copies the closest example of the winning specific_category, so it carries
+    the same schema (category, colour, icon, CO2 rate, ...) as the model's.
+    Each worker process holds its own index and picks up the examples other
+    workers recorded every sync_seconds.
+    """
+
+    def __init__(self, store, index_dir=None, k=5, min_examples=20, max_examples=100000,
+                 min_similarity=0.85, confident_similarity=0.97, common_min_examples=25,
+                 reuse_similarity=0.99, n_lists=64, n_probe=8, save_every=256, sync_seconds=30):
+        self.store = store
+        self.index_dir = index_dir
+        self.k = k
+        self.min_examples = min_examples
+        self.min_similarity = min_similarity
+        self.confident_similarity = confident_similarity
+        self.common_min_examples = common_min_examples
+        self.reuse_similarity = reuse_similarity
+        self.save_every = save_every
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding-index')
+        self._saving = False
+        self.predictions = 0
+        self.reused = 0
+        self.abstained = 0
+
+        # A pruned or replaced store invalidates the saved index, so it is rebuilt from the store
+        pruned = store.prune(max_examples)
+        self.index = IVFIndex(EMBEDDING_DIM, n_lists=n_lists, n_probe=n_probe)
+        if index_dir and not pruned:
+            saved = IVFIndex.load(index_dir, EMBEDDING_DIM, n_lists=n_lists, n_probe=n_probe)
+            if saved.max_id() <= store.max_id():
+                self.index = saved
+            else:
+                pruned = True
+
+        # Catch up with every example the saved index lacks: newer ones, and older
+        # ones another worker recorded but that worker's snapshot was not the last saved
+        store_ids = store.ids()
+        missing = store.embeddings(self.index.missing(store_ids))
+        for example_id, embedding in missing:
+            self.index.add(example_id, embedding)
+        if index_dir and (missing or pruned):
+            self.index.save(index_dir)
+
+        self._synced_id = int(store_ids[-1]) if len(store_ids) else 0
+        self._synced_at = time.monotonic()
+        self._categories = store.category_counts()
+
+    def add(self, example_hash, embedding, result):
+        """Record a validated model answer as a labelled example"""
+        # Held with the store write so sync() cannot add the same example to the index again
+        with self._index_lock:
+            try:
+                example_id, previous_category = self.store.put(example_hash, embedding, result)
+            except sqlite3.Error as e:
+                log_event('local_classifier_store_error', level='warning', error=str(e))
+                return
+            unsaved = self.index.add(example_id, embedding) if previous_category is None else 0
+
+        with self._lock:
+            if previous_category is not None:
+                self._categories[previous_category] -= 1
+            self._categories[result['specific_category']] += 1
+
+        if self.index_dir and unsaved >= self.save_every:
+            self._schedule_save()
+
+    def sync(self):
+        """Add the examples other worker processes recorded since the last sync"""
+        with self._index_lock:
+            self._synced_at = time.monotonic()
+            rows = self.store.embeddings_after(self._synced_id)
+            if not rows:
+                return 0
+            self._synced_id = rows[-1][0]
+            new_ids = set(self.index.missing([example_id for example_id, _ in rows]).tolist())
+            unsaved = 0
+            for example_id, embedding in rows:
+                if example_id in new_ids:
+                    unsaved = self.index.add(example_id, embedding)
+            categories = self.store.category_counts()
+        with self._lock:
+            self._categories = categories
+        if self.index_dir and unsaved >= self.save_every:
+            self._schedule_save()
+        return len(new_ids)
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._saving:
+                return
+            self._saving = True
+        self._save_executor.submit(self._save)
+
+    def _save(self):
+        try:
+            self.index.save(self.index_dir)
+        except (OSError, ValueError) as e:
+            log_event('embedding_index_save_error', level='warning', error=str(e))
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def classify(self, embedding):
+        """Return (result, mode) for the nearest examples, or None when unsure.
+
+        mode is 'reuse' when a stored answer is close enough to return as is,
+        'confident' when every neighbour agrees, the best match is very close and
+        the category is common enough to skip the model, and 'fallback' otherwise.
+        """
+        if time.monotonic() - self._synced_at >= self.sync_seconds:
+            try:
+                self.sync()
+            except sqlite3.Error as e:
+                log_event('local_classifier_sync_error', level='warning', error=str(e))
+        nearest = self.index.search(embedding, self.k)
+        results = self.store.results(example_id for _, example_id in nearest) if nearest else {}
+        neighbours = [(similarity, results[example_id]) for similarity, example_id in nearest if example_id in results]
+
+        if neighbours and neighbours[0][0] >= self.reuse_similarity:
+            with self._lock:
+                self.reused += 1
+            return dict(neighbours[0][1]), 'reuse'
+
+        if len(self.index) < self.min_examples or not neighbours or neighbours[0][0] < self.min_similarity:
+            with self._lock:
+                self.abstained += 1
+            return None
+
+        votes = Counter()
+        for similarity, result in neighbours:
+            votes[result['specific_category']] += max(similarity, 0.0)
+        category, weight = votes.most_common(1)[0]
+        similarity, best = next(n for n in neighbours if n[1]['specific_category'] == category)
+        agreement = weight / sum(votes.values()) if sum(votes.values()) > 0 else 0.0
+
+        with self._lock:
+            category_examples = self._categories.get(category, 0)
+            self.predictions += 1
+
+        confident = (similarity >= self.confident_similarity and agreement >= 0.999
+                     and category_examples >= self.common_min_examples)
+        result = dict(best)
+        if confident:
+            result['confidence'] = 'high'
+        elif similarity >= (self.min_similarity + self.confident_similarity) / 2 and agreement >= 0.6:
+            result['confidence'] = 'medium'
+        else:
+            result['confidence'] = 'low'
+
+        return result, 'confident' if confident else 'fallback'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'examples': len(self.index),
+                'categories': len([c for c in self._categories.values() if c > 0]),
+                'predictions': self.predictions,
+                'reused': self.reused,
+                'abstained': self.abstained,
+                'index': self.index.stats()
+            }
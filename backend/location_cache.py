@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from structured_log import log_event
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lon, precision=5):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value_range = lon_range if even else lat_range
+        value = lon if even else lat
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+class ProvidersUnavailable(Exception):
+    """Raised by a fetch when no provider answered, so its empty result says nothing about the area"""
+
+
+def normalize_query(location_query):
+    """Collapse case and whitespace so equivalent queries share a cache entry"""
+    return ' '.join(location_query.lower().split())
+
+
+class LocationCache:
+    """TTL/LRU cache of provider results per (query, geohash cell) with stale-while-revalidate"""
+
+    def __init__(self, precision=5, max_entries=5000, ttl_seconds=24 * 3600,
+                 stale_seconds=6 * 24 * 3600, negative_ttl_seconds=600, refresh_workers=2):
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries = OrderedDict()  # key -> (fresh_until, stale_until, suggestions)
+        self._refreshing = set()
+        self._refresh_tasks = set()  # the event loop only holds weak references to tasks
+        self._lock = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='location-refresh')
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.unanswered = 0
+
+    def key(self, location_query, lat, lon):
+        return normalize_query(location_query), geohash_encode(lat, lon, self.precision)
+
+    def lookup(self, key):
+        """Return (suggestions, needs_refresh) for a cached key, or None on a miss.
+
+        A stale hit is marked as refreshing, so only one caller gets needs_refresh.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            fresh_until, _, suggestions = entry
+            self._entries.move_to_end(key)
+            if fresh_until >= now:
+                if suggestions:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return suggestions, False
+
+            self.stale_hits += 1
+            if key in self._refreshing:
+                return suggestions, False
+            self._refreshing.add(key)
+            return suggestions, True
+
+    def get_or_fetch(self, key, fetch):
+        """Return cached suggestions for key, calling fetch() on a miss.
+
+        Stale entries are served immediately while fetch() runs in the background.
+        When fetch() raises ProvidersUnavailable nothing is cached and [] is returned.
+        """
+        found = self.lookup(key)
+        if found is not None:
+            suggestions, needs_refresh = found
+            if needs_refresh:
+                self._refresh_executor.submit(self._refresh, key, fetch)
+            return suggestions
+
+        try:
+            suggestions = fetch()
+        except ProvidersUnavailable:
+            return self._unanswered()
+        self.put(key, suggestions)
+        return suggestions
+
+    async def get_or_fetch_async(self, key, fetch):
+        """Async twin of get_or_fetch; fetch is a coroutine function"""
+        found = self.lookup(key)
+        if found is not None:
+            suggestions, needs_refresh = found
+            if needs_refresh:
+                task = asyncio.ensure_future(self._refresh_async(key, fetch))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            return suggestions
+
+        try:
+            suggestions = await fetch()
+        except ProvidersUnavailable:
+            return self._unanswered()
+        self.put(key, suggestions)
+        return suggestions
+
+    def _unanswered(self):
+        with self._lock:
+            self.unanswered += 1
+        return []
+
+    def put(self, key, suggestions):
+        now = time.time()
+        if suggestions:
+            fresh_until = now + self.ttl_seconds
+            stale_until = fresh_until + self.stale_seconds
+        else:
+            # Negative results expire quickly and are never served stale
+            fresh_until = stale_until = now + self.negative_ttl_seconds
+
+        with self._lock:
+            self._entries[key] = (fresh_until, stale_until, list(suggestions))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, fetch):
+        try:
+            suggestions = fetch()
+            # Keep serving the old results if the refresh came back empty
+            if suggestions:
+                self.put(key, suggestions)
+            with self._lock:
+                self.refreshes += 1
+        except ProvidersUnavailable:
+            pass
+        except Exception as e:
+            log_event('location_cache_refresh_error', level='error', key=key, error=str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, fetch):
+        try:
+            suggestions = await fetch()
+            if suggestions:
+                self.put(key, suggestions)
+            with self._lock:
+                self.refreshes += 1
+        except ProvidersUnavailable:
+            pass
+        except Exception as e:
+            log_event('location_cache_refresh_error', level='error', key=key, error=str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'unanswered': self.unanswered,
+                'precision': self.precision
+            }
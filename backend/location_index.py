@@ -0,0 +1,150 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from structured_log import log_event
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.32
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """Uniform lat/lon grid of places, bucketed per category"""
+
+    def __init__(self, cell_degrees=0.1):
+        self.cell_degrees = cell_degrees
+        self._cells = defaultdict(list)  # (category, row, col) -> [place]
+        self._keys = set()
+        self.size = 0
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def add(self, category, place):
+        """Add a place dict with at least name, lat and lon; duplicates are ignored"""
+        key = (category, place['name'].lower().replace(' ', ''), round(place['lat'], 4), round(place['lon'], 4))
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        row, col = self._cell(place['lat'], place['lon'])
+        self._cells[(category, row, col)].append(place)
+        self.size += 1
+        return True
+
+    def nearest(self, category, lat, lon, k, radius_km):
+        """Return up to k (distance_km, place) pairs of a category within radius_km"""
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_row, min_col = self._cell(lat - lat_span, lon - lon_span)
+        max_row, max_col = self._cell(lat + lat_span, lon + lon_span)
+
+        candidates = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for place in self._cells.get((category, row, col), ()):
+                    distance = _haversine_km(lat, lon, place['lat'], place['lon'])
+                    if distance <= radius_km:
+                        candidates.append((distance, place))
+        return heapq.nsmallest(k, candidates, key=lambda c: c[0])
+
+
+class LocationIndex:
+    """In-memory spatial index over stored disposal locations and harvested provider results.
+
+    Lookups never block on a refresh: a new grid is built off to the side and
+    swapped in with a single assignment.
+    """
+
+    def __init__(self, loader=None, cell_degrees=0.1, refresh_seconds=900, max_harvested=50000):
+        self.loader = loader
+        self.max_harvested = max_harvested
+        self.cell_degrees = cell_degrees
+        self.refresh_seconds = refresh_seconds
+        self._grid = GridIndex(cell_degrees)
+        self._harvested = []  # (category, place), replayed into every rebuilt grid
+        self._lock = threading.Lock()
+        self._thread = None
+        self.loaded_at = None
+        self.stored_places = 0
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self):
+        """Reload stored locations and rebuild the grid"""
+        rows = self.loader() if self.loader else []
+        grid = GridIndex(self.cell_degrees)
+        for category, place in rows:
+            grid.add(category, place)
+        stored_places = grid.size
+
+        with self._lock:
+            harvested = list(self._harvested)
+        for category, place in harvested:
+            grid.add(category, place)
+
+        with self._lock:
+            # Harvests that arrived while rebuilding are added to the new grid too
+            for category, place in self._harvested[len(harvested):]:
+                grid.add(category, place)
+            self._grid = grid
+            self.stored_places = stored_places
+            self.loaded_at = time.time()
+
+    def start_background_refresh(self):
+        # A thread inherited through fork() is not running in the child
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name='location-index', daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+                log_event('location_index_loaded', places=self.stored_places)
+            except Exception as e:
+                log_event('location_index_refresh_error', level='error', error=str(e))
+            time.sleep(self.refresh_seconds)
+
+    def add_harvested(self, category, places):
+        with self._lock:
+            for place in places:
+                if len(self._harvested) >= self.max_harvested:
+                    break
+                if self._grid.add(category, place):
+                    self._harvested.append((category, place))
+
+    def nearest(self, category, lat, lon, k=10, radius_km=25, min_results=1):
+        """Return up to k suggestions of a category, nearest first, with distance_km set.
+
+        Lookups returning fewer than min_results places count as misses.
+        """
+        results = [
+            {**place, 'distance_km': round(distance, 1)}
+            for distance, place in self._grid.nearest(category, lat, lon, k, radius_km)
+        ]
+        with self._lock:
+            if len(results) >= min_results:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'places': self._grid.size,
+                'stored_places': self.stored_places,
+                'harvested_places': len(self._harvested),
+                'loaded_at': self.loaded_at,
+                'hits': self.hits,
+                'misses': self.misses
+            }
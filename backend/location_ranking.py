@@ -0,0 +1,72 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Distances in km from one point to arrays of coordinates"""
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lons, dtype=float))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _coordinates(suggestions):
+    count = len(suggestions)
+    lats = np.fromiter((s['lat'] for s in suggestions), dtype=float, count=count)
+    lons = np.fromiter((s['lon'] for s in suggestions), dtype=float, count=count)
+    return lats, lons
+
+
+def attach_distances(lat, lon, suggestions):
+    """Set distance_km (rounded to 0.1 km) on every suggestion in one pass"""
+    if not suggestions:
+        return suggestions
+    lats, lons = _coordinates(suggestions)
+    for suggestion, distance in zip(suggestions, np.round(haversine_km(lat, lon, lats, lons), 1).tolist()):
+        suggestion['distance_km'] = distance
+    return suggestions
+
+
+def _stable_top_k(values, k):
+    """Indices of the k smallest values, ordered like a stable sort would order them"""
+    if k is None or k >= len(values):
+        return np.argsort(values, kind='stable')
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+
+    threshold = values[np.argpartition(values, k - 1)[:k]].max()
+    below = np.flatnonzero(values < threshold)
+    ties = np.flatnonzero(values == threshold)[:k - len(below)]
+    selected = np.sort(np.concatenate([below, ties]))
+    return selected[np.argsort(values[selected], kind='stable')]
+
+
+def rank_suggestions(lat, lon, suggestions, radius_km=25, limit=None):
+    """Recompute distances, drop far and duplicate places and return the nearest first.
+
+    Duplicates share a normalized name and a 0.01 degree grid cell; the first
+    occurrence wins. Ties in distance keep their input order.
+    """
+    if not suggestions:
+        return []
+
+    lats, lons = _coordinates(suggestions)
+    distances = np.round(haversine_km(lat, lon, lats, lons), 1)
+
+    kept = []
+    seen_places = set()
+    for i in np.flatnonzero(distances <= radius_km).tolist():
+        suggestion = suggestions[i]
+        # Formatted, not np.round: the two disagree on half-way coordinates such as -28.905
+        place_key = f"{suggestion['name'].lower().replace(' ', '')}_{suggestion['lat']:.2f}_{suggestion['lon']:.2f}"
+        if place_key not in seen_places:
+            seen_places.add(place_key)
+            kept.append(i)
+
+    kept = np.array(kept, dtype=np.intp)
+    order = kept[_stable_top_k(distances[kept], limit)]
+    return [{**suggestions[i], 'distance_km': distance} for i, distance in zip(order.tolist(), distances[order].tolist())]
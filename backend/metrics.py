@@ -0,0 +1,347 @@
+"""In-process metrics: counters, latency histograms and per-stage timing spans.
+
+Everything is rendered in the Prometheus text format by render(). When
+METRICS_DIR is set (gunicorn.conf.py sets it), every worker process writes a
+snapshot there every few seconds and render() sums the snapshots of all
+workers, so a scrape that lands on any one worker sees the whole server.
+Snapshots of workers that have exited are folded into one totals file, so
+their counts are kept without the directory growing with every restart.
+"""
+import contextlib
+import contextvars
+import cProfile
+import fcntl
+import glob
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+
+from structured_log import log_event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+# Where the counts of worker processes that have exited are kept
+RETIRED_FILE = 'retired.json'
+
+# Stage timings of the request being served, for its log line
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += 1
+            values[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): list(values) for key, values in self._values.items()}
+
+
+class MetricsRegistry:
+    """Named metrics of this process, plus the snapshots other workers left in METRICS_DIR"""
+
+    def __init__(self, directory=None, flush_seconds=5):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {
+                'kind': metric.kind,
+                'help': metric.help,
+                'labelnames': metric.labelnames,
+                'buckets': getattr(metric, 'buckets', None),
+                'values': metric.snapshot()
+            }
+            for metric in metrics
+        }
+
+    def ensure_flusher(self):
+        """Start this process's snapshot writer; a no-op without a directory or once running"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            # Also true in a freshly forked worker, whose parent's thread did not come along
+            self._flusher_pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                self.retire_exited()
+            except (OSError, TypeError, ValueError) as e:
+                log_event('metrics_snapshot_error', level='warning', error=str(e))
+
+    def flush(self):
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    @contextlib.contextmanager
+    def _directory_lock(self, mode):
+        # Retiring a snapshot rewrites two files; readers must not see it in both or neither
+        with open(os.path.join(self.directory, 'LOCK'), 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            yield
+
+    def retire_exited(self):
+        """Fold the snapshots of worker processes that are gone into RETIRED_FILE"""
+        exited = [
+            path for path in glob.glob(os.path.join(self.directory, '*.json'))
+            if os.path.basename(path)[:-len('.json')].isdigit()
+            and not _pid_alive(int(os.path.basename(path)[:-len('.json')]))
+        ]
+        if not exited:
+            return
+        retired_path = os.path.join(self.directory, RETIRED_FILE)
+        with self._directory_lock(fcntl.LOCK_EX):
+            snapshots = []
+            for path in [retired_path] + exited:
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except FileNotFoundError:
+                    # Already retired by another worker
+                    continue
+            tmp_path = f'{retired_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(_merge(snapshots), f)
+            os.replace(tmp_path, retired_path)
+            for path in exited:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def clear_directory(self):
+        """Forget snapshots of earlier server runs; called by the master before workers start"""
+        for path in glob.glob(os.path.join(self.directory or '', '*.json')):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    def collect(self):
+        """This process's metrics merged with every other worker's latest snapshot"""
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = os.path.join(self.directory, f'{os.getpid()}.json')
+            with self._directory_lock(fcntl.LOCK_SH):
+                for path in glob.glob(os.path.join(self.directory, '*.json')):
+                    if path == own:
+                        continue
+                    try:
+                        with open(path) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        return _merge(snapshots)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["kind"]}')
+            for key, value in sorted(metric['values'].items()):
+                labels = list(zip(metric['labelnames'], json.loads(key)))
+                if metric['kind'] == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                for bound, count in zip(metric['buckets'], value):
+                    lines.append(f'{name}_bucket{_labels(labels + [("le", repr(float(bound)))])} {count}')
+                lines.append(f'{name}_bucket{_labels(labels + [("le", "+Inf")])} {value[-2]}')
+                lines.append(f'{name}_sum{_labels(labels)} {value[-1]}')
+                lines.append(f'{name}_count{_labels(labels)} {value[-2]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(snapshots):
+    """Sum snapshots of the same metrics: counters add up, histograms bucket by bucket"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, 'values': {}})
+            for key, value in metric['values'].items():
+                if key not in target['values']:
+                    target['values'][key] = value
+                elif metric['kind'] == 'counter':
+                    target['values'][key] += value
+                else:
+                    target['values'][key] = [a + b for a, b in zip(target['values'][key], value)]
+    return merged
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, under another user
+        pass
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+registry = MetricsRegistry(METRICS_DIR, METRICS_FLUSH_SECONDS)
+
+stage_seconds = registry.histogram(
+    'binbuddy_stage_seconds', 'Time spent in one stage of a request', ['stage']
+)
+request_seconds = registry.histogram(
+    'binbuddy_request_seconds', 'Request latency by endpoint and status code', ['endpoint', 'status']
+)
+model_seconds = registry.histogram(
+    'binbuddy_model_seconds', 'Gemini call latency by model and outcome', ['model', 'outcome']
+)
+provider_seconds = registry.histogram(
+    'binbuddy_provider_seconds', 'Location provider query latency by outcome', ['provider', 'status']
+)
+provider_results = registry.counter(
+    'binbuddy_provider_results_total', 'Places returned by each location provider', ['provider']
+)
+events = registry.counter(
+    'binbuddy_events_total', 'Notable events on the request path', ['event']
+)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Time a block as one stage: feeds binbuddy_stage_seconds and the request's log line"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def start_request():
+    """Collect the spans of the request now being served; returns a token for end_request"""
+    registry.ensure_flusher()
+    return _request_spans.set([])
+
+
+def end_request(token, endpoint, status, seconds):
+    """Record a finished request; returns its stage timings in milliseconds"""
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    request_seconds.observe(seconds, endpoint=endpoint, status=status)
+    timings = {}
+    for stage, elapsed in spans:
+        timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 1)
+    return timings
+
+
+class RequestProfiler:
+    """Runs cProfile on a random sample of requests and saves the profiles.
+
+    Profiling is per thread, so it covers the request's own thread only: the
+    synchronous Flask path, not work handed to executors or the event loop.
+    """
+
+    def __init__(self, sample_rate=0.0, output_dir=None, top=15):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.top = top
+
+    def start(self):
+        """A running profiler for a sampled request, or None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profiler
+
+    def stop(self, profiler, endpoint):
+        """Stop profiling; saves the profile and returns the top functions by cumulative time"""
+        profiler.disable()
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.output_dir, f'{endpoint}-{time.time_ns()}-{os.getpid()}.prof'))
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(self.top)
+        return output.getvalue()
@@ -0,0 +1,177 @@
+import asyncio
+import inspect
+import threading
+import time
+
+import metrics
+from budgets import BudgetExhausted, model_bucket
+
+
+class ModelStats:
+    """Call, latency and token counters for one model"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.over_budget = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'over_budget': self.over_budget,
+            'avg_latency_ms': round(self.total_seconds / self.calls * 1000) if self.calls else 0,
+            'max_latency_ms': round(self.max_seconds * 1000),
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens
+        }
+
+
+class ModelRegistry:
+    """Builds GenerativeModel handles once and reuses them across requests.
+
+    Fixed instructions are attached as a system instruction when the installed
+    SDK supports it, otherwise they are sent as the first content part. The SDK
+    itself is imported and configured on first use, as it dominates start-up.
+    With budgets (a TokenBuckets), every call first takes a token from its
+    model's bucket and raises BudgetExhausted when there is none.
+    """
+
+    def __init__(self, api_key=None, budgets=None):
+        self.api_key = api_key
+        self.budgets = budgets
+        self.supports_system_instruction = False
+        self._genai = None
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _sdk(self):
+        """google.generativeai, imported and configured on first call; hold self._lock"""
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            # google-generativeai only accepts system instructions from 0.5 on
+            self.supports_system_instruction = 'system_instruction' in inspect.signature(genai.GenerativeModel).parameters
+            self._genai = genai
+        return self._genai
+
+    def use_sdk(self, sdk):
+        """Serve every model from sdk instead of google.generativeai (bench/stub_model.py)"""
+        with self._lock:
+            self._genai = sdk
+            self.supports_system_instruction = 'system_instruction' in inspect.signature(sdk.GenerativeModel).parameters
+            self._models.clear()
+
+    def get(self, model_name, system_instruction=None):
+        with self._lock:
+            genai = self._sdk()
+            key = (model_name, system_instruction if self.supports_system_instruction else None)
+            model = self._models.get(key)
+            if model is None:
+                if key[1] is not None:
+                    model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                else:
+                    model = genai.GenerativeModel(model_name)
+                self._models[key] = model
+                self._stats.setdefault(model_name, ModelStats())
+            return model
+
+    def _acquire(self, model_name):
+        """Take a call from the model's budget; raises BudgetExhausted when it has none"""
+        if self.budgets is not None and not self.budgets.try_acquire(model_bucket(model_name)):
+            with self._lock:
+                self._stats.setdefault(model_name, ModelStats()).over_budget += 1
+            metrics.events.inc(event='model_over_quota')
+            raise BudgetExhausted(f"{model_name} is out of budget")
+
+    async def _acquire_async(self, model_name):
+        # A limited budget is a SQLite write transaction that can wait on other workers; keep it off the event loop
+        if self.budgets is not None and model_bucket(model_name) in self.budgets.limits:
+            await asyncio.to_thread(self._acquire, model_name)
+
+    def _prepare(self, model_name, contents, system_instruction):
+        model = self.get(model_name, system_instruction)
+        if system_instruction is not None and not self.supports_system_instruction:
+            contents = [system_instruction] + (contents if isinstance(contents, list) else [contents])
+        return model, contents
+
+    def generate(self, model_name, contents, system_instruction=None, **kwargs):
+        """generate_content on the shared handle, recording latency and token usage"""
+        self._acquire(model_name)
+        model, contents = self._prepare(model_name, contents, system_instruction)
+        started = time.monotonic()
+        try:
+            response = model.generate_content(contents, **kwargs)
+        except Exception:
+            self._record(model_name, time.monotonic() - started, None, error=True)
+            raise
+        self._record(model_name, time.monotonic() - started, response)
+        return response
+
+    async def generate_async(self, model_name, contents, system_instruction=None, **kwargs):
+        """Async twin of generate()"""
+        await self._acquire_async(model_name)
+        model, contents = self._prepare(model_name, contents, system_instruction)
+        started = time.monotonic()
+        try:
+            response = await model.generate_content_async(contents, **kwargs)
+        except Exception:
+            self._record(model_name, time.monotonic() - started, None, error=True)
+            raise
+        self._record(model_name, time.monotonic() - started, response)
+        return response
+
+    def stream(self, model_name, contents, system_instruction=None, **kwargs):
+        """Yield text chunks from a streaming generate_content call on the shared handle"""
+        self._acquire(model_name)
+        model, contents = self._prepare(model_name, contents, system_instruction)
+        started = time.monotonic()
+        response = None
+        try:
+            response = model.generate_content(contents, stream=True, **kwargs)
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception:
+            self._record(model_name, time.monotonic() - started, None, error=True)
+            raise
+        self._record(model_name, time.monotonic() - started, response)
+
+    async def stream_async(self, model_name, contents, system_instruction=None, **kwargs):
+        """Async twin of stream()"""
+        await self._acquire_async(model_name)
+        model, contents = self._prepare(model_name, contents, system_instruction)
+        started = time.monotonic()
+        response = None
+        try:
+            response = await model.generate_content_async(contents, stream=True, **kwargs)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception:
+            self._record(model_name, time.monotonic() - started, None, error=True)
+            raise
+        self._record(model_name, time.monotonic() - started, response)
+
+    def _record(self, model_name, seconds, response, error=False):
+        metrics.model_seconds.observe(seconds, model=model_name, outcome='error' if error else 'ok')
+        usage = getattr(response, 'usage_metadata', None)
+        with self._lock:
+            stats = self._stats.setdefault(model_name, ModelStats())
+            stats.calls += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if error:
+                stats.errors += 1
+            if usage is not None:
+                stats.prompt_tokens += getattr(usage, 'prompt_token_count', 0) or 0
+                stats.output_tokens += getattr(usage, 'candidates_token_count', 0) or 0
+
+    def stats(self):
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
@@ -0,0 +1,157 @@
+import heapq
+import math
+
+import ijson
+
+from location_ranking import EARTH_RADIUS_KM
+
+ADDRESS_KEYS = ('addr:housenumber', 'addr:street', 'addr:city')
+
+
+def distance_km(lat, lon, other_lat, other_lon):
+    """Great-circle distance between two points, for one element at a time"""
+    lat1, lat2 = math.radians(lat), math.radians(other_lat)
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(other_lon - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class NearestElements:
+    """Keeps the k nearest named Overpass elements seen so far.
+
+    Elements are offered one at a time as the response is parsed, so only k
+    suggestions (plus the names already seen, for de-duplication) are held no
+    matter how large the response is. Stopping early at settle_km makes the
+    result approximate (see settled); settle_km=0 keeps it exact.
+    """
+
+    def __init__(self, lat, lon, k=10, radius_km=25, settle_km=1.0, suggestion_type=None):
+        self.lat = lat
+        self.lon = lon
+        self.k = k
+        self.radius_km = radius_km
+        self.settle_km = settle_km
+        self.suggestion_type = suggestion_type
+        self.seen = 0
+        self.skipped = 0
+        self._heap = []  # (-distance, -order, suggestion): the farthest kept place on top
+        self._places = set()
+
+    def offer(self, element):
+        """Consider one element; returns False once the top k is settled"""
+        self.seen += 1
+        position = element if 'lat' in element else element.get('center') or {}
+        tags = element.get('tags') or {}
+        name = tags.get('name') or tags.get('operator')
+        if 'lat' not in position or 'lon' not in position or not name or name == 'Unknown Location':
+            self.skipped += 1
+            return True
+
+        result_lat, result_lon = float(position['lat']), float(position['lon'])
+        distance = distance_km(self.lat, self.lon, result_lat, result_lon)
+        if distance > self.radius_km or (len(self._heap) == self.k and distance >= -self._heap[0][0]):
+            return not self.settled()
+
+        # Same normalized name in the same 0.01 degree cell, as in rank_suggestions
+        place_key = (name.lower().replace(' ', ''), round(result_lat, 2), round(result_lon, 2))
+        if place_key in self._places:
+            return True
+        self._places.add(place_key)
+
+        address = ', '.join(tags[key] for key in ADDRESS_KEYS if key in tags)
+        suggestion = {
+            "type": self.suggestion_type(tags) if self.suggestion_type else 'dropoff',
+            "name": name,
+            "address": address or 'Address not available',
+            "lat": result_lat,
+            "lon": result_lon,
+            "source": "overpass"
+        }
+        entry = (-distance, -self.seen, suggestion)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heapreplace(self._heap, entry)
+        return not self.settled()
+
+    def settled(self):
+        """Whether k places within settle_km are already held, so parsing can stop.
+
+        Overpass returns elements in quadtile order, not by distance, so closer
+        places may still follow: stopping here gives an approximate top k in
+        which every place is within settle_km, not necessarily the k nearest.
+        """
+        return len(self._heap) == self.k and -self._heap[0][0] <= self.settle_km
+
+    def suggestions(self):
+        """Kept suggestions in the order they appeared in the response"""
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: -entry[1])]
+
+
+class ChunkReader:
+    """Minimal binary file object over a streamed requests response's decoded body chunks"""
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        self._chunks = response.iter_content(chunk_size)
+        self._response = response
+        self._buffer = b''
+
+    def close(self):
+        # Drops whatever was left unread
+        self._response.close()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class AsyncChunkReader:
+    """Async twin of ChunkReader over a streamed httpx response, for ijson's async parsing"""
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        self._chunks = response.aiter_bytes(chunk_size)
+        self._response = response
+        self._buffer = b''
+
+    async def aclose(self):
+        await self._response.aclose()
+
+    async def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = await anext(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def collect_nearest(source, nearest):
+    """Feed the elements of an Overpass JSON document to nearest, stopping once it is settled.
+
+    source is a binary file-like object; elements are parsed one at a time, so
+    the full response is never held as Python objects.
+    """
+    for element in ijson.items(source, 'elements.item', use_float=True):
+        if not nearest.offer(element):
+            break
+    return nearest
+
+
+async def collect_nearest_async(source, nearest):
+    """Async twin of collect_nearest; source is an object with an async read()"""
+    async for element in ijson.items(source, 'elements.item', use_float=True):
+        if not nearest.offer(element):
+            break
+    return nearest
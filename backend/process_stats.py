@@ -0,0 +1,35 @@
+import os
+import resource
+import sys
+
+
+def memory_mb(pid='self'):
+    """Resident memory of a process (this one by default) in MB, split into shared and private pages.
+
+    Pages a preloading server's workers still share with the master show up as
+    shared; private is what each extra worker really costs. Outside Linux only
+    this process's peak RSS is available.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f.read().splitlines()[1:])
+    except OSError:
+        if pid != 'self':
+            return {}
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return {'peak_rss_mb': round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)}
+
+    def kb(name):
+        return int(fields.get(name, '0 kB').split()[0])
+
+    return {
+        'rss_mb': round(kb('Rss') / 1024, 1),
+        'pss_mb': round(kb('Pss') / 1024, 1),
+        'shared_mb': round((kb('Shared_Clean') + kb('Shared_Dirty')) / 1024, 1),
+        'private_mb': round((kb('Private_Clean') + kb('Private_Dirty')) / 1024, 1)
+    }
+
+
+def process_summary():
+    return {'pid': os.getpid(), **memory_mb()}
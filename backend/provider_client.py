@@ -0,0 +1,270 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+
+class ProviderError(requests.RequestException):
+    """Raised when a provider never answered a query with 200 OK"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one trial call through after a cooldown"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """Whether a call may go ahead: True, or 'trial' for the one call let through while half-open"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return 'trial'
+
+    def release_trial(self):
+        """End a trial call that recorded no outcome (e.g. it was cancelled), so another can be tried"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderClient:
+    """Pooled keep-alive HTTP session for one provider, with retries and a circuit breaker"""
+
+    def __init__(self, name, pool_size=10, max_retries=2, backoff_base=0.25, backoff_max=4.0,
+                 failure_threshold=5, reset_seconds=60, user_agent='BinBuddy/1.0'):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # The async client is created on first use, inside the serving event loop
+        self.pool_size = pool_size
+        self.user_agent = user_agent
+        self._async_client = None
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def available(self):
+        return self.breaker.state != 'open'
+
+    def get(self, url, timeout=10, **kwargs):
+        return self.request('GET', url, timeout=timeout, **kwargs)
+
+    def post(self, url, timeout=10, **kwargs):
+        return self.request('POST', url, timeout=timeout, **kwargs)
+
+    def request(self, method, url, timeout=10, **kwargs):
+        """Send a request, retrying 429/5xx and connection errors within the timeout budget"""
+        allowed = self.breaker.allow()
+        if not allowed:
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            return self._request(method, url, timeout, **kwargs)
+        finally:
+            if allowed == 'trial':
+                self.breaker.release_trial()
+
+    def _request(self, method, url, timeout, **kwargs):
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            with self._lock:
+                self.requests += 1
+            try:
+                response = self.session.request(method, url, timeout=max(remaining, 0.1), **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not self._sleep_before_retry(attempt, None, deadline):
+                    self._record_failure()
+                    raise
+                attempt += 1
+                continue
+            except requests.RequestException:
+                self._record_failure()
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+
+            if not self._sleep_before_retry(attempt, _retry_after_seconds(response), deadline):
+                self._record_failure()
+                return response
+            response.close()
+            attempt += 1
+
+    async def request_async(self, method, url, timeout=10, **kwargs):
+        """Async twin of request() on a pooled httpx client; same retries and circuit breaker"""
+        allowed = self.breaker.allow()
+        if not allowed:
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        # Callers cancel stragglers; a cancelled trial must not leave the breaker stuck half-open
+        try:
+            return await self._request_async(method, url, timeout, **kwargs)
+        finally:
+            if allowed == 'trial':
+                self.breaker.release_trial()
+
+    async def _request_async(self, method, url, timeout, **kwargs):
+        # Only the async server needs httpx, so it is not imported up front
+        import httpx
+
+        if isinstance(kwargs.get('data'), (str, bytes)):
+            kwargs['content'] = kwargs.pop('data')
+        # Like requests' stream=True: the body is left unread and the caller must aclose() it
+        stream = kwargs.pop('stream', False)
+
+        client = self._get_async_client()
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            with self._lock:
+                self.requests += 1
+            try:
+                request = client.build_request(method, url, timeout=max(remaining, 0.1), **kwargs)
+                response = await client.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.TimeoutException):
+                delay = self._retry_delay(attempt, None, deadline)
+                if delay is None:
+                    self._record_failure()
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except httpx.HTTPError:
+                self._record_failure()
+                raise
+
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+
+            delay = self._retry_delay(attempt, _retry_after_seconds(response), deadline)
+            if delay is None:
+                self._record_failure()
+                return response
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            import httpx
+            self._async_client = httpx.AsyncClient(
+                headers={'User-Agent': self.user_agent},
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _retry_delay(self, attempt, retry_after, deadline):
+        """Seconds to wait before the next attempt, or None when no retry should be made"""
+        if attempt >= self.max_retries:
+            return None
+        if retry_after is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        else:
+            delay = retry_after
+        # A retry must leave time for the request itself
+        if time.monotonic() + delay >= deadline - 0.5:
+            return None
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def _sleep_before_retry(self, attempt, retry_after, deadline):
+        """Wait before the next attempt; returns False when no retry should be made"""
+        delay = self._retry_delay(attempt, retry_after, deadline)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+        self.breaker.record_failure()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'circuit': self.breaker.state
+            }
@@ -0,0 +1,80 @@
+"""Seed the local classifier from classifications already stored in Supabase.
+
+Each waste_classifications row is joined with its image in Supabase Storage; the
+image is embedded and the stored answer recorded as a labelled example, then the
+embedding index is saved so workers memory-map it on startup.
+
+Usage: python seed_local_classifier.py [--limit 5000]
+"""
+import argparse
+import os
+
+import app
+from classification_cache import dhash
+from image_preprocess import prepare_image
+from local_classifier import image_embedding
+
+RESULT_COLUMNS = {
+    'main_category': 'main_category',
+    'specific_category': 'specific_category',
+    'display_name': 'display_name',
+    'estimated_weight_kg': 'weight_kg',
+    'confidence': 'confidence',
+    'co2_saved_kg_per_kg': 'co2_rate_per_kg',
+    'color': 'color',
+    'icon': 'icon',
+    'disposal_methods': 'disposal_methods',
+    'location_query': 'location_query',
+    'recyclable': 'recyclable',
+    'donation_worthy': 'donation_worthy'
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--limit', type=int, default=5000)
+    parser.add_argument('--bucket', default=os.getenv('SUPABASE_IMAGE_BUCKET', 'waste-images'))
+    args = parser.parse_args()
+
+    if app.local_classifier is None:
+        raise SystemExit('LOCAL_CLASSIFIER is disabled')
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_KEY')
+    if not supabase_url or not supabase_key:
+        raise SystemExit('SUPABASE_URL and SUPABASE_KEY must be set')
+
+    from supabase import create_client
+    client = create_client(supabase_url, supabase_key)
+    rows = client.table('waste_classifications') \
+        .select(', '.join(sorted(set(RESULT_COLUMNS.values()))) + ', waste_images (storage_path)') \
+        .order('created_at', desc=True) \
+        .limit(args.limit) \
+        .execute().data
+
+    recorded = 0
+    for row in rows:
+        storage_path = (row.get('waste_images') or {}).get('storage_path')
+        if not storage_path:
+            continue
+        try:
+            image_bytes = client.storage.from_(args.bucket).download(storage_path)
+            image, _, _, _ = prepare_image(
+                image_bytes, max_edge=app.IMAGE_MAX_EDGE, quality=app.IMAGE_QUALITY,
+                image_format=app.IMAGE_FORMAT, max_pixels=app.IMAGE_MAX_PIXELS
+            )
+        except Exception as e:
+            print(f"⚠️ Skipping {storage_path}: {e}")
+            continue
+
+        result = app.validate_classification({field: row[column] for field, column in RESULT_COLUMNS.items()})
+        result['estimated_weight_kg'] = float(result['estimated_weight_kg'])
+        result['co2_saved_kg_per_kg'] = float(result['co2_saved_kg_per_kg'])
+        app.record_local_example(dhash(image), image_embedding(image), result)
+        recorded += 1
+
+    app.local_classifier.index.save(app.local_classifier.index_dir)
+    print(f"✅ Recorded {recorded} of {len(rows)} stored classifications; {app.local_classifier.stats()}")
+
+
+if __name__ == '__main__':
+    main()
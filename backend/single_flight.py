@@ -0,0 +1,278 @@
+import asyncio
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from structured_log import log_event
+
+
+class SQLiteFlightStore:
+    """Leases and short-lived results shared by worker processes on one host"""
+
+    def __init__(self, path, result_ttl_seconds=30):
+        self.path = path
+        self.result_ttl_seconds = result_ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._inherited = []
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def reset_after_fork(self):
+        """Forget the connection inherited from the parent process; SQLite connections must not cross fork()"""
+        # Kept referenced rather than closed: closing it here could release the parent's locks
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def _owner(self):
+        return f'{os.getpid()}:{threading.get_ident()}'
+
+    def acquire(self, key, lease_seconds, owner=None):
+        """Take the lease on key unless another live owner holds it"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO leases VALUES (?, ?, ?)",
+                (key, owner or self._owner(), now + lease_seconds)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, key, owner=None):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner or self._owner()))
+
+    def publish(self, key, result):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.result_ttl_seconds,))
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(result), now))
+
+    def result(self, key):
+        """Result another process published for key within the TTL, or None"""
+        row = self._connect().execute(
+            "SELECT result FROM results WHERE key = ? AND created_at >= ?",
+            (key, time.time() - self.result_ttl_seconds)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one execution.
+
+    The first caller for a key runs the work; callers arriving while it is in
+    flight wait for its result and get their own deep copy. With a store,
+    worker processes also wait on each other's leases and share results, which
+    must then be JSON-serialisable.
+    """
+
+    def __init__(self, name, store=None, lease_seconds=30, poll_interval=0.05):
+        self.name = name
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._inflight = {}  # key -> Future
+        self._inflight_async = {}  # key -> asyncio.Task
+        self._waiters_async = {}  # asyncio.Task -> callers still awaiting it
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.shared_coalesced = 0
+        self.errors = 0
+        self.abandoned = 0
+
+    def do(self, key, fn):
+        """Return fn(), or the result of an identical call already in flight"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = self._run_shared(key, fn) if self.store is not None else fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def do_async(self, key, fn):
+        """Async twin of do; fn is a coroutine function.
+
+        The shared work runs as its own task, so a cancelled caller does not
+        cancel it for the others; once every caller has gone it is cancelled.
+        """
+        with self._lock:
+            task = self._inflight_async.get(key)
+            leader = task is None
+            if leader:
+                task = asyncio.ensure_future(self._run_async(key, fn))
+                self._inflight_async[key] = task
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+            self._waiters_async[task] = self._waiters_async.get(task, 0) + 1
+
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            with self._lock:
+                self._waiters_async[task] -= 1
+                abandoned = self._waiters_async[task] == 0 and not task.done()
+                if not self._waiters_async[task]:
+                    del self._waiters_async[task]
+                if abandoned:
+                    # New callers start afresh rather than joining work that is being cancelled
+                    if self._inflight_async.get(key) is task:
+                        del self._inflight_async[key]
+                    self.abandoned += 1
+            if abandoned:
+                task.cancel()
+        return result if leader else copy.deepcopy(result)
+
+    async def _run_async(self, key, fn):
+        try:
+            if self.store is not None:
+                return await self._run_shared_async(key, fn)
+            return await fn()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                if self._inflight_async.get(key) is asyncio.current_task():
+                    del self._inflight_async[key]
+
+    def _wait_for_lease(self, key, owner=None):
+        """One polling step: (result, acquired) for the shared store"""
+        found = self.store.result(key)
+        if found is not None:
+            return found, False
+        if self.store.acquire(key, self.lease_seconds, owner):
+            # The previous owner may have published just before releasing
+            found = self.store.result(key)
+            if found is not None:
+                self.store.release(key, owner)
+                return found, False
+            return None, True
+        return None, False
+
+    def _run_shared(self, key, fn):
+        deadline = time.monotonic() + self.lease_seconds
+        acquired = False
+        try:
+            while True:
+                found, acquired = self._wait_for_lease(key)
+                if found is not None:
+                    with self._lock:
+                        self.shared_coalesced += 1
+                    return found
+                if acquired or time.monotonic() > deadline:
+                    break
+                time.sleep(self.poll_interval)
+        except sqlite3.Error as e:
+            log_event('single_flight_store_error', level='warning', flight=self.name, error=str(e))
+            return fn()
+
+        try:
+            result = fn()
+            self._publish(key, result)
+            return result
+        finally:
+            if acquired:
+                self._release(key)
+
+    async def _run_shared_async(self, key, fn):
+        # Store calls block on SQLite locks, so they run in threads; the lease
+        # belongs to this task rather than to whichever thread took it
+        owner = f'{os.getpid()}:task-{id(asyncio.current_task())}'
+        deadline = time.monotonic() + self.lease_seconds
+        acquired = False
+        try:
+            while True:
+                found, acquired = await asyncio.to_thread(self._wait_for_lease, key, owner)
+                if found is not None:
+                    with self._lock:
+                        self.shared_coalesced += 1
+                    return found
+                if acquired or time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        except sqlite3.Error as e:
+            log_event('single_flight_store_error', level='warning', flight=self.name, error=str(e))
+            return await fn()
+
+        try:
+            result = await fn()
+            await asyncio.to_thread(self._publish, key, result)
+            return result
+        finally:
+            if acquired:
+                await asyncio.to_thread(self._release, key, owner)
+
+    def _publish(self, key, result):
+        try:
+            self.store.publish(key, result)
+        except (sqlite3.Error, TypeError) as e:
+            log_event('single_flight_store_error', level='warning', flight=self.name, error=str(e))
+
+    def _release(self, key, owner=None):
+        try:
+            self.store.release(key, owner)
+        except sqlite3.Error as e:
+            log_event('single_flight_store_error', level='warning', flight=self.name, error=str(e))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._inflight) + len(self._inflight_async),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'shared_coalesced': self.shared_coalesced,
+                'errors': self.errors,
+                'abandoned': self.abandoned,
+                'shared': self.store is not None
+            }
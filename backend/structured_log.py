@@ -0,0 +1,107 @@
+"""Structured, non-blocking logging for the request path.
+
+log_event() only puts a record on an in-memory queue; a listener thread
+formats it and writes it out, so request threads never wait on stdout. When
+the queue is full, records are dropped and counted rather than blocking.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of raising when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Fields are formatted on the listener thread, not here
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'event': record.getMessage(),
+            'pid': record.process,
+            **getattr(record, 'fields', {})
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable one-line form for local development"""
+
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in getattr(record, 'fields', {}).items())
+        stamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+        return f"{stamp} {record.levelname.lower():<7} {record.getMessage()} {fields}".rstrip()
+
+
+logger = logging.getLogger('binbuddy')
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+logger.addHandler(_handler)
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _ensure_listener():
+    """Start the writer thread in this process; a forked worker needs its own"""
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        # A fresh queue too: the inherited one's lock may have been held mid-fork
+        _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JSONFormatter())
+        _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+
+def log_event(event, level='info', **fields):
+    """Log one event with structured fields, without blocking the caller"""
+    if _listener_pid != os.getpid():
+        _ensure_listener()
+    if logger.isEnabledFor(LEVELS[level]):
+        logger.log(LEVELS[level], event, extra={'fields': fields})
+
+
+def flush():
+    """Write out everything queued so far; for shutdown and scripts"""
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener.start()
+
+
+def stats():
+    return {'queued': _handler.queue.qsize(), 'dropped': _handler.dropped}
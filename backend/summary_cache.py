@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from structured_log import log_event
+
+# Roughly what one mature tree absorbs in a year
+TREE_CO2_KG_PER_YEAR = 21.0
+
+# Generated summaries are shared by every user in a bucket, so the model writes
+# these placeholders where figures go and each user's exact numbers are filled in
+SUMMARY_PLACEHOLDERS = ('co2_kg', 'items', 'weight_kg', 'tree_years')
+_PLACEHOLDER_PATTERN = re.compile(r'\{(' + '|'.join(SUMMARY_PLACEHOLDERS) + r')\}')
+_LONGEST_PLACEHOLDER = max(len(name) for name in SUMMARY_PLACEHOLDERS) + 2
+
+
+def _band(value):
+    """Round a stat to a coarse band: halves below 10, two significant figures above"""
+    value = float(value or 0)
+    if value <= 0:
+        return 0
+    if value < 10:
+        return round(value * 2) / 2
+    digits = int(math.floor(math.log10(value))) - 1
+    return round(value, -digits)
+
+
+def bucket_summary_stats(data):
+    """Canonical, bucketed copy of the summary inputs; equal buckets share one summary"""
+    categories = data.get('category_breakdown', [])
+    if not categories or not isinstance(categories, list):
+        categories = []
+    categories = sorted(
+        ({'name': str(c.get('name', 'N/A')), 'count': int(_band(c.get('count', 0)))} for c in categories),
+        key=lambda c: (-c['count'], c['name'])
+    )
+    achievements = data.get('recent_achievements', []) or []
+
+    return {
+        'total_co2_saved': _band(data.get('total_co2_saved', 0)),
+        'total_items': int(_band(data.get('total_items', 0))),
+        'total_weight': _band(data.get('total_weight', 0)),
+        'category_breakdown': categories,
+        'recent_achievements': sorted(achievements)
+    }
+
+
+def summary_figures(data):
+    """The user's exact figures for the summary placeholders"""
+    total_co2 = float(data.get('total_co2_saved', 0) or 0)
+    return {
+        'co2_kg': f"{total_co2:.2f}",
+        'items': str(int(data.get('total_items', 0) or 0)),
+        'weight_kg': f"{float(data.get('total_weight', 0) or 0):.2f}",
+        'tree_years': f"{total_co2 / TREE_CO2_KG_PER_YEAR:.1f}"
+    }
+
+
+def fill_summary(text, figures):
+    """Replace the placeholders in a (possibly cached) summary with one user's figures"""
+    return _PLACEHOLDER_PATTERN.sub(lambda match: figures[match.group(1)], text)
+
+
+class SummaryFiller:
+    """Fills placeholders into streamed chunks, holding back a chunk end that may be a split placeholder"""
+
+    def __init__(self, figures):
+        self.figures = figures
+        self._pending = ''
+
+    def feed(self, text):
+        text = self._pending + text
+        start = text.rfind('{')
+        if start != -1 and '}' not in text[start:] and len(text) - start < _LONGEST_PLACEHOLDER:
+            text, self._pending = text[:start], text[start:]
+        else:
+            self._pending = ''
+        return fill_summary(text, self.figures)
+
+    def flush(self):
+        text, self._pending = self._pending, ''
+        return fill_summary(text, self.figures)
+
+
+def summary_cache_key(bucketed):
+    return hashlib.sha256(json.dumps(bucketed, sort_keys=True).encode()).hexdigest()
+
+
+def render_template_summary(data, max_items=3):
+    """Precomputed summary for low-activity users, or None when the model should write one"""
+    total_items = data.get('total_items', 0) or 0
+    total_co2 = data.get('total_co2_saved', 0) or 0
+    if total_items > max_items:
+        return None
+
+    if total_items == 0:
+        return ("Welcome to Bin Buddy! You haven't sorted any items yet, but every journey starts with a single "
+                "step. Snap a photo of your next bottle, can or old gadget and we'll show you exactly where it "
+                "should go. Small habits add up to a big impact on our planet. Let's get started today!")
+
+    categories = data.get('category_breakdown', [])
+    if not isinstance(categories, list):
+        categories = []
+    top_category = sorted(categories, key=lambda x: x.get('count', 0), reverse=True)
+    top_category_name = top_category[0].get('name', 'recycling') if top_category else 'recycling'
+    tree_days = max(1, round(total_co2 / TREE_CO2_KG_PER_YEAR * 365))
+    item_text = 'item' if total_items == 1 else 'items'
+
+    return (f"Wow, great start! You've saved {total_co2:.2f} kg of CO₂ with your first {total_items} "
+            f"{item_text}, about what a tree absorbs in {tree_days} day{'s' if tree_days != 1 else ''}. "
+            f"You're already making a difference with {top_category_name}. "
+            f"To boost your impact, try sorting one new type of item this week, like e-waste or compost. "
+            f"Keep it up, every item counts!")
+
+
+class SummaryCache:
+    """TTL/LRU cache of generated summaries with stale-while-revalidate"""
+
+    def __init__(self, max_entries=2000, ttl_seconds=24 * 3600, stale_seconds=6 * 24 * 3600, refresh_workers=2):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()  # key -> (fresh_until, stale_until, summary)
+        self._refreshing = set()
+        self._refresh_tasks = set()  # the event loop only holds weak references to tasks
+        self._lock = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='summary-refresh')
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.template_hits = 0
+        self.refreshes = 0
+
+    def record_template_hit(self):
+        with self._lock:
+            self.template_hits += 1
+
+    def lookup(self, key):
+        """Return (summary, needs_refresh) for a cached key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            fresh_until, _, summary = entry
+            self._entries.move_to_end(key)
+            if fresh_until >= now:
+                self.hits += 1
+                return summary, False
+
+            self.stale_hits += 1
+            if key in self._refreshing:
+                return summary, False
+            self._refreshing.add(key)
+            return summary, True
+
+    def cached(self, key, generate):
+        """Return the cached summary for key, or None on a miss.
+
+        Stale entries are served immediately while generate() runs in the background.
+        """
+        found = self.lookup(key)
+        if found is None:
+            return None
+        summary, needs_refresh = found
+        if needs_refresh:
+            self._refresh_executor.submit(self._refresh, key, generate)
+        return summary
+
+    async def cached_async(self, key, generate):
+        """Async twin of cached; generate is a coroutine function"""
+        found = self.lookup(key)
+        if found is None:
+            return None
+        summary, needs_refresh = found
+        if needs_refresh:
+            task = asyncio.ensure_future(self._refresh_async(key, generate))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        return summary
+
+    def get_or_generate(self, key, generate):
+        """Return the cached summary for key, calling generate() on a miss"""
+        summary = self.cached(key, generate)
+        if summary is None:
+            summary = generate()
+            self.put(key, summary)
+        return summary
+
+    async def get_or_generate_async(self, key, generate):
+        """Async twin of get_or_generate; generate is a coroutine function"""
+        summary = await self.cached_async(key, generate)
+        if summary is None:
+            summary = await generate()
+            self.put(key, summary)
+        return summary
+
+    def put(self, key, summary):
+        fresh_until = time.time() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (fresh_until, fresh_until + self.stale_seconds, summary)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, generate):
+        try:
+            self.put(key, generate())
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            log_event('summary_cache_refresh_error', level='error', error=str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, generate):
+        try:
+            self.put(key, await generate())
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            log_event('summary_cache_refresh_error', level='error', error=str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'template_hits': self.template_hits,
+                'refreshes': self.refreshes
+            }
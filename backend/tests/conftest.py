@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def backend(tmp_path_factory):
+    """The app module, configured at import time for tests and answering from bench/stub_model.py"""
+    os.environ.update(
+        BINBUDDY_CACHE_DIR=str(tmp_path_factory.mktemp('cache')),
+        LOCATION_INDEX_ENABLED='false',
+        LOG_LEVEL='WARNING',
+        GEMINI_API_KEY='test',
+        MAX_UPLOAD_BYTES=str(1024 * 1024),
+        MAX_BATCH_UPLOAD_BYTES=str(4 * 1024 * 1024),
+        STUB_MODEL_LATENCY='0',
+        STUB_MODEL_JITTER='0'
+    )
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'bench'))
+    app = importlib.import_module('app')
+    app.model_registry.use_sdk(importlib.import_module('stub_model'))
+    return app
@@ -0,0 +1,57 @@
+import base64
+import io
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def noise_images(seed, count):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)).resize((320, 240)).save(buffer, 'JPEG')
+        images.append('data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+def test_batch_items_fall_back_to_the_local_answer(backend, monkeypatch):
+    local = dict(backend.fallback_classification(), specific_category='local_guess')
+    monkeypatch.setattr(backend, 'local_prediction', lambda embedding: (dict(local), 'fallback'))
+    monkeypatch.setattr(backend, 'find_nearby_locations', lambda lat, lon, location_query: [])
+
+    def failing_model(*args, **kwargs):
+        raise RuntimeError('model unavailable')
+
+    monkeypatch.setattr(backend.model_registry, 'generate', failing_model)
+    items = list(backend.classify_batch(noise_images(1, 3), 43.6, -79.4, timeout=10))
+    assert sorted(item['index'] for item in items) == [0, 1, 2]
+    assert {item['specific_category'] for item in items} == {'local_guess'}
+
+
+def test_batch_wait_is_bounded_by_the_request_budget(backend, monkeypatch):
+    release = threading.Event()
+    looked_up = threading.Event()
+
+    def slow_model(prepared_images):
+        release.wait(5)
+        return [backend.fallback_classification() for _ in prepared_images]
+
+    def find_nearby_locations(lat, lon, location_query):
+        looked_up.set()
+        return []
+
+    monkeypatch.setattr(backend, 'local_prediction', lambda embedding: None)
+    monkeypatch.setattr(backend, 'classify_prepared_batch', slow_model)
+    monkeypatch.setattr(backend, 'find_nearby_locations', find_nearby_locations)
+
+    started = time.monotonic()
+    items = list(backend.classify_batch(noise_images(2, 2), 43.6, -79.4, timeout=0.3))
+    assert time.monotonic() - started < 1.5
+    assert items == [{'index': 0, 'error': 'Timed out'}, {'index': 1, 'error': 'Timed out'}]
+
+    # Let the abandoned pack finish while the fakes are still in place
+    release.set()
+    assert looked_up.wait(5)
@@ -0,0 +1,40 @@
+import base64
+import io
+
+from PIL import Image
+
+from budgets import TokenBuckets
+
+
+def image_data_url(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='JPEG')
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_token_bucket_is_shared_and_refuses_when_empty(tmp_path):
+    path = str(tmp_path / 'budgets.sqlite3')
+    first = TokenBuckets(path, {'here': (2, 3600)})
+    second = TokenBuckets(path, {'here': (2, 3600)})
+    assert first.try_acquire('here')
+    assert second.try_acquire('here')
+    assert not first.try_acquire('here')
+    assert first.try_acquire('overpass')
+
+
+def test_classify_is_shed_only_when_the_model_would_be_needed(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'classify_shed_retry_after', lambda: 7)
+    monkeypatch.setattr(backend, 'local_prediction', lambda embedding: None)
+    monkeypatch.setattr(backend, 'find_nearby_locations', lambda lat, lon, location_query: [])
+    client = backend.app.test_client()
+    image = image_data_url((200, 30, 90))
+
+    response = client.post('/api/classify', json={'image': image, 'lat': 43.6, 'lon': -79.4})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+    # An image the cache already knows is answered as usual
+    image_hash = backend.prepare_upload(image)[0]
+    backend.classification_cache.put(image_hash, backend.fallback_classification())
+    response = client.post('/api/classify', json={'image': image, 'lat': 43.6, 'lon': -79.4})
+    assert response.status_code == 200
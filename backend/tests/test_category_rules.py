@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from category_rules import match_location_query, suggestion_type_for_categories, suggestion_type_for_tags
+
+
+def baseline_category(location_query):
+    """get_location_category from app.py before the rule table"""
+    if 'electronic' in location_query.lower() or 'e-waste' in location_query.lower():
+        return 'electronic'
+    elif 'furniture' in location_query.lower():
+        return 'furniture'
+    elif 'clothing' in location_query.lower():
+        return 'clothing'
+    elif 'battery' in location_query.lower():
+        return 'battery'
+    elif 'recycling' in location_query.lower():
+        return 'recycling'
+    elif 'donation' in location_query.lower():
+        return 'donation'
+    else:
+        return 'general'
+
+
+def baseline_search_terms(location_query):
+    """get_search_terms_for_category from app.py before the rule table"""
+    if 'electronic' in location_query.lower() or 'e-waste' in location_query.lower():
+        return ['electronics recycling', 'Best Buy', 'computer repair', 'e-waste']
+    elif 'furniture' in location_query.lower():
+        return ['Goodwill', 'Salvation Army', 'thrift store', 'furniture donation']
+    elif 'clothing' in location_query.lower():
+        return ['clothing donation', 'Goodwill', 'thrift store', 'charity shop']
+    elif 'battery' in location_query.lower():
+        return ['battery recycling', 'auto parts store', 'car repair']
+    elif 'recycling' in location_query.lower():
+        return ['recycling center', 'waste management', 'municipal recycling']
+    elif 'donation' in location_query.lower():
+        return ['donation center', 'charity', 'Goodwill', 'Salvation Army']
+    else:
+        return ['recycling center', 'waste management']
+
+
+def baseline_generic(location_query):
+    """Which fallbacks get_generic_suggestions picked before the rule table"""
+    if 'donation' in location_query.lower() or 'furniture' in location_query.lower() or 'clothing' in location_query.lower():
+        return 'donate'
+    return 'dropoff'
+
+
+def baseline_type_for_tags(tags):
+    """determine_overpass_type from app.py before the rule table"""
+    shop = tags.get('shop', '').lower()
+    amenity = tags.get('amenity', '').lower()
+    name = tags.get('name', '').lower()
+
+    if shop in ['charity', 'second_hand', 'thrift'] or 'goodwill' in name or 'salvation army' in name:
+        return "donate"
+    elif amenity in ['waste_disposal', 'waste_transfer_station'] or 'dump' in name:
+        return "dispose"
+    else:
+        return "dropoff"
+
+
+def baseline_type_for_categories(categories):
+    """determine_suggestion_type_from_categories from app.py before the rule table"""
+    for category in categories:
+        cat_name = category.get('name', '').lower() if isinstance(category, dict) else str(category).lower()
+        if any(keyword in cat_name for keyword in ['charity', 'thrift', 'donation']):
+            return "donate"
+        elif any(keyword in cat_name for keyword in ['waste', 'dump', 'disposal']):
+            return "dispose"
+    return "dropoff"
+
+
+# Keywords, near misses and their pieces, so queries hit overlaps and partial matches
+WORDS = [
+    'electronic', 'Electronics', 'e-waste', 'E-Waste', 'e-was', 'furniture', 'Furniture', 'clothing', 'cloth',
+    'battery', 'batteries', 'recycling', 'Recycling', 'recycle', 'donation', 'donations', 'Donation',
+    'drop-off', 'centre', 'store', 'nearest', 'e', '-', 'elec', 'tronic', 'don', 'ation'
+]
+
+
+def random_query(rng):
+    separators = [' ', '', '_', ' and ']
+    return ''.join(rng.choice(WORDS) + rng.choice(separators) for _ in range(rng.randint(0, 4))).strip()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_location_query_matches_the_old_if_chains(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        query = random_query(rng)
+        matched = match_location_query(query)
+        assert matched['category'] == baseline_category(query), query
+        assert list(matched['search_terms']) == baseline_search_terms(query), query
+        assert matched['generic'] == baseline_generic(query), query
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_suggestion_types_match_the_old_checks(seed):
+    rng = random.Random(seed)
+    names = ['Goodwill', 'Salvation Army Store', 'City Dump', 'Dumpling House', 'Best Buy', '']
+    shops = ['charity', 'Second_Hand', 'thrift', 'electronics', 'car_repair']
+    amenities = ['waste_disposal', 'Waste_Transfer_Station', 'recycling', 'social_facility']
+    category_names = ['Charity', 'Thrift Store', 'Donation Center', 'Waste Management', 'Dump',
+                      'Disposal Site', 'Recycling Center', 'Electronics Store']
+    for _ in range(100):
+        tags = {}
+        for key, values in (('shop', shops), ('amenity', amenities), ('name', names)):
+            if rng.random() < 0.5:
+                tags[key] = rng.choice(values)
+        assert suggestion_type_for_tags(tags) == baseline_type_for_tags(tags), tags
+
+        categories = [
+            {'name': rng.choice(category_names)} if rng.random() < 0.5 else rng.choice(category_names)
+            for _ in range(rng.randint(0, 3))
+        ]
+        assert suggestion_type_for_categories(categories) == baseline_type_for_categories(categories), categories
@@ -0,0 +1,28 @@
+import random
+
+from classification_cache import HASH_BANDS, SQLiteClassificationStore
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def test_band_lookup_finds_every_hash_up_to_distance_seven(tmp_path):
+    store = SQLiteClassificationStore(str(tmp_path / 'classifications.sqlite3'))
+    rng = random.Random(0)
+    for number in range(200):
+        stored = rng.getrandbits(64)
+        store.put(stored, {'number': number})
+        for distance in range(HASH_BANDS):
+            found = store.get(flip_bits(stored, distance, rng), distance, 0)
+            assert found is not None and found[1] == {'number': number}
+
+
+def test_default_distance_uses_the_band_index(tmp_path):
+    store = SQLiteClassificationStore(str(tmp_path / 'classifications.sqlite3'))
+    statements = []
+    store._connect().set_trace_callback(statements.append)
+    store.get(0x0123456789ABCDEF, 4, 0)
+    assert any('band7 = ' in statement for statement in statements)
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import types
+
+
+def model_answer(backend, specific_category):
+    return dict(backend.fallback_classification(), specific_category=specific_category, confidence='high')
+
+
+def test_slow_async_model_call_still_fills_the_cache(backend, monkeypatch):
+    local = dict(backend.fallback_classification(), specific_category='local_guess')
+    monkeypatch.setattr(backend, 'LOCAL_FALLBACK_BUDGET', 0.05)
+    monkeypatch.setattr(backend, 'local_prediction', lambda embedding: (dict(local), 'fallback'))
+
+    async def slow_model(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return types.SimpleNamespace(text=json.dumps(model_answer(backend, 'slow_answer')))
+
+    monkeypatch.setattr(backend.model_registry, 'generate_async', slow_model)
+    image_hash = 0x5a5a_1234_0f0f_7777
+
+    async def run():
+        answer = await backend.route_classification_async(image_hash, 'encoded', 'image/jpeg', None)
+        await asyncio.wait_for(asyncio.gather(*backend.background_classify_tasks), 1)
+        return answer
+
+    assert asyncio.run(run())['specific_category'] == 'local_guess'
+    assert backend.classification_cache.get(image_hash)['specific_category'] == 'slow_answer'
+    assert backend.classify_flight.stats()['in_flight'] == 0
+
+
+def test_cancelled_request_drops_the_model_call(backend, monkeypatch):
+    local = dict(backend.fallback_classification(), specific_category='local_guess')
+    monkeypatch.setattr(backend, 'local_prediction', lambda embedding: (dict(local), 'fallback'))
+    cancelled = []
+
+    async def hanging_model(*args, **kwargs):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    monkeypatch.setattr(backend.model_registry, 'generate_async', hanging_model)
+    abandoned = backend.classify_flight.stats()['abandoned']
+
+    async def run():
+        request = asyncio.ensure_future(
+            backend.route_classification_async(0x0123_4567_89ab_cdef, 'encoded', 'image/jpeg', None)
+        )
+        await asyncio.sleep(0.05)
+        request.cancel()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert cancelled == [1]
+    assert backend.classify_flight.stats()['abandoned'] == abandoned + 1
+
+
+def test_confident_local_answers_still_ask_the_model_by_default(backend, monkeypatch):
+    local = dict(backend.fallback_classification(), specific_category='local_guess')
+    monkeypatch.setattr(backend, 'local_prediction', lambda embedding: (dict(local), 'confident'))
+    monkeypatch.setattr(backend.model_registry, 'generate', lambda *args, **kwargs: types.SimpleNamespace(
+        text=json.dumps(model_answer(backend, 'model_answer'))
+    ))
+
+    answer = backend.route_classification(0x1357_9bdf_2468_ace0, 'encoded', 'image/jpeg', None)
+    assert not backend.LOCAL_ROUTE_FIRST
+    assert answer['specific_category'] == 'model_answer'
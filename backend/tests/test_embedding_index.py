@@ -0,0 +1,38 @@
+import numpy as np
+
+from embedding_index import IVFIndex
+
+
+def normalized(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def clustered_vectors(count, dim, clusters, spread, seed):
+    """Unit vectors scattered around random centres, like embeddings of similar photos"""
+    rng = np.random.default_rng(seed)
+    centres = normalized(rng.normal(size=(clusters, dim)))
+    noise = spread / np.sqrt(dim) * rng.normal(size=(count, dim))
+    return normalized(centres[rng.integers(clusters, size=count)] + noise)
+
+
+def test_ivf_recall_against_brute_force(tmp_path):
+    dim = 256
+    vectors = clustered_vectors(4096, dim, 48, spread=0.5, seed=0)
+    index = IVFIndex(dim)
+    for item_id, vector in enumerate(vectors):
+        index.add(item_id, vector)
+    index.save(str(tmp_path))
+    assert index.stats()['lists'] > index.n_probe
+
+    queries = normalized(vectors[:200] + 0.1 / np.sqrt(dim) * np.random.default_rng(1).normal(size=(200, dim)))
+    k = 5
+    found = 0
+    for query in queries:
+        expected = set(np.argsort(-(vectors @ query), kind='stable')[:k].tolist())
+        found += len(expected & {item_id for _, item_id in index.search(query, k)})
+    assert found / (len(queries) * k) >= 0.95
+
+    # A worker loading the saved layout answers the same
+    loaded = IVFIndex.load(str(tmp_path), dim)
+    assert loaded.stats()['memory_mapped']
+    assert [loaded.search(query, k) for query in queries[:20]] == [index.search(query, k) for query in queries[:20]]
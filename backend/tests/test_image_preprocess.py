@@ -0,0 +1,34 @@
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from image_preprocess import ImageRejected, prepare_image
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_header(width, height):
+    """A PNG that declares its size but has no pixel data; enough for Image.open"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', ihdr) + png_chunk(b'IDAT', b'') + png_chunk(b'IEND', b'')
+
+
+# Between Pillow's limit and twice it, Pillow only warns; the max_pixels check rejects those
+@pytest.mark.filterwarnings('ignore::PIL.Image.DecompressionBombWarning')
+@pytest.mark.parametrize('width, height', [(9000, 9000), (20000, 20000)])
+def test_oversized_images_are_rejected_before_decoding(width, height):
+    with pytest.raises(ImageRejected):
+        prepare_image(png_header(width, height), max_pixels=64_000_000)
+
+
+def test_rejection_holds_across_threads():
+    def prepare(_):
+        with pytest.raises(ImageRejected):
+            prepare_image(png_header(20000, 20000))
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(prepare, range(32)))
@@ -0,0 +1,23 @@
+import time
+
+from jobs import JobWorkers, SQLiteJobStore
+
+
+def test_running_job_keeps_its_lease_past_lease_seconds(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+
+    def slow_handler(payload, params):
+        time.sleep(1.0)
+        return {'ok': True}
+
+    workers = JobWorkers(store, slow_handler, workers=1, lease_seconds=0.3, poll_seconds=0.05)
+    job_id = workers.submit(b'image', {})
+    time.sleep(0.6)
+
+    # Another process looking for work must not take the job over while it still runs
+    other = SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+    assert other.claim(0.3, 2) is None
+
+    job = workers.wait(job_id, 5)
+    assert job['status'] == 'done'
+    assert job['attempts'] == 1
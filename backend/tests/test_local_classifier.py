@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from local_classifier import EMBEDDING_DIM, LocalClassifier, SQLiteExampleStore
+
+
+def unit_vectors(count, seed):
+    vectors = np.random.default_rng(seed).normal(size=(count, EMBEDDING_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def result(category):
+    return {'specific_category': category, 'confidence': 'high'}
+
+
+def worker(tmp_path, **kwargs):
+    """A classifier as one gunicorn worker would build it, sharing the store and index directory"""
+    store = SQLiteExampleStore(str(tmp_path / 'examples.sqlite3'))
+    return LocalClassifier(store, index_dir=str(tmp_path / 'index'), **kwargs)
+
+
+def test_restart_recovers_examples_missing_from_the_last_saved_snapshot(tmp_path):
+    first, second = worker(tmp_path), worker(tmp_path)
+    for number, vector in enumerate(unit_vectors(4, seed=1)):
+        first.add(f'first-{number}', vector, result('can'))
+    for number, vector in enumerate(unit_vectors(4, seed=2)):
+        second.add(f'second-{number}', vector, result('bottle'))
+    # The worker with the lower ids saves last, so the snapshot lacks the other's examples
+    second.index.save(first.index_dir)
+    first.index.save(first.index_dir)
+
+    restarted = worker(tmp_path)
+    assert len(restarted.index) == 8
+    assert len(restarted.index.missing(restarted.store.ids())) == 0
+
+
+def test_sync_picks_up_other_workers_examples_once(tmp_path):
+    first, second = worker(tmp_path), worker(tmp_path)
+    vectors = unit_vectors(3, seed=3)
+    for number, vector in enumerate(vectors):
+        first.add(f'first-{number}', vector, result('can'))
+    first.add('first-0', vectors[0], result('tin'))
+
+    assert second.sync() == 3
+    assert second.sync() == 0
+    assert len(second.index) == 3
+    assert len(first.index) == 3
+    assert second.index.search(vectors[1], 1)[0][0] > 0.999
+
+
+def test_saves_keep_the_previous_snapshot_for_loading_workers(tmp_path):
+    classifier = worker(tmp_path)
+    for number, vector in enumerate(unit_vectors(3, seed=4)):
+        classifier.add(f'example-{number}', vector, result('can'))
+        classifier.index.save(classifier.index_dir)
+
+    snapshots = sorted(name for name in os.listdir(classifier.index_dir) if name.startswith('snapshot-'))
+    with open(os.path.join(classifier.index_dir, 'CURRENT')) as f:
+        assert f.read().strip() in snapshots
+    assert len(snapshots) == 2
@@ -0,0 +1,57 @@
+import math
+import random
+
+import pytest
+
+from location_ranking import rank_suggestions
+
+
+def baseline_distance(lat1, lon1, lat2, lon2):
+    """calculate_distance from app.py before ranking moved to NumPy"""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def baseline_rank(lat, lon, suggestions, radius_km=25, limit=None):
+    """The loops rank_suggestions replaced: radius filter, name and 0.01 degree dedup, stable sort"""
+    unique_suggestions = []
+    seen_places = set()
+    for suggestion in suggestions:
+        distance = round(baseline_distance(lat, lon, suggestion['lat'], suggestion['lon']), 1)
+        if distance > radius_km:
+            continue
+        place_key = f"{suggestion['name'].lower().replace(' ', '')}_{suggestion['lat']:.2f}_{suggestion['lon']:.2f}"
+        if place_key not in seen_places:
+            seen_places.add(place_key)
+            unique_suggestions.append({**suggestion, 'distance_km': distance})
+    unique_suggestions.sort(key=lambda s: s['distance_km'])
+    return unique_suggestions[:limit] if limit is not None else unique_suggestions
+
+
+def random_suggestions(rng, lat, lon, count):
+    names = ['Depot', 'Eco Centre', 'eco centre', 'Thrift Store', 'Drop Off']
+    suggestions = []
+    for i in range(count):
+        if suggestions and rng.random() < 0.2:
+            # Same place reported again, by another provider
+            suggestions.append({**rng.choice(suggestions), 'source': 'here'})
+            continue
+        suggestions.append({
+            'name': rng.choice(names),
+            # Coarse offsets give plenty of equal distances and shared grid cells
+            'lat': round(lat + rng.randint(-30, 30) * 0.001, 4),
+            'lon': round(lon + rng.randint(-30, 30) * 0.001, 4),
+            'source': 'overpass',
+            'order': i
+        })
+    return suggestions
+
+
+@pytest.mark.parametrize('seed', range(50))
+@pytest.mark.parametrize('limit', [None, 10])
+def test_rank_suggestions_matches_the_baseline(seed, limit):
+    rng = random.Random(seed)
+    lat, lon = rng.uniform(-60, 60), rng.uniform(-180, 180)
+    suggestions = random_suggestions(rng, lat, lon, rng.randint(0, 60))
+    assert rank_suggestions(lat, lon, suggestions, 2.5, limit) == baseline_rank(lat, lon, suggestions, 2.5, limit)
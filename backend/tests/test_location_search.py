@@ -0,0 +1,104 @@
+import asyncio
+import io
+import json
+import threading
+
+import pytest
+import requests
+
+LAT, LON = 43.65, -79.38
+
+
+def overpass_payload(places):
+    return json.dumps({'elements': [
+        {'type': 'node', 'id': i, 'lat': lat, 'lon': lon, 'tags': {'amenity': 'recycling', 'name': name}}
+        for i, (name, lat, lon) in enumerate(places)
+    ]}).encode()
+
+
+@pytest.fixture
+def fake_overpass(backend, monkeypatch):
+    """Serve the given Overpass payloads in turn from bench/fake_providers.py"""
+    from fake_providers import FakeProviders
+
+    servers = []
+
+    def serve(payloads):
+        server = FakeProviders(('127.0.0.1', 0), payloads, latency=0, jitter=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(backend, 'OVERPASS_URL', f'http://127.0.0.1:{server.server_address[1]}/overpass')
+        return server
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_widening_keeps_the_places_the_smaller_radius_found(backend, fake_overpass):
+    near = [(f'Near Depot {i}', LAT + 0.002 * i, LON) for i in range(1, 4)]
+    # A capped wider query: its first elements in quadtile order are all far away
+    far = [(f'Far Depot {i}', LAT + 0.09, LON + 0.001 * i) for i in range(20)]
+    server = fake_overpass([overpass_payload(near), overpass_payload(far)])
+
+    queries = tuple(backend.get_overpass_queries(LAT, LON, 'recycling centre'))
+    suggestions = backend.run_provider_query('overpass', LAT, LON, 'recycling centre', queries, timeout=10)
+
+    assert server.served['overpass'] == 2
+    names = [suggestion['name'] for suggestion in suggestions]
+    assert names[:3] == ['Near Depot 1', 'Near Depot 2', 'Near Depot 3']
+    assert len(names) == len(set(names)) >= backend.LOCATION_TARGET_RESULTS
+
+
+def test_only_wider_overpass_queries_are_capped(backend):
+    queries = backend.get_overpass_queries(LAT, LON, 'recycling centre')
+    assert queries[0].endswith('out center tags qt;')
+    assert all(query.endswith(f'out center tags qt {backend.OVERPASS_RESULT_LIMIT};') for query in queries[1:])
+
+
+def test_async_overpass_responses_are_streamed_and_closed(backend, fake_overpass, monkeypatch):
+    places = [(f'Depot {i}', LAT + 0.001 * i, LON - 0.001 * i) for i in range(40)]
+    fake_overpass([overpass_payload(places)])
+    parse = backend.parse_overpass_response_async
+    responses = []
+
+    async def recording_parse(lat, lon, location_query, query, response):
+        responses.append((response, response.is_stream_consumed))
+        return await parse(lat, lon, location_query, query, response)
+
+    monkeypatch.setitem(backend.PROVIDER_ASYNC_PARSERS, 'overpass', recording_parse)
+    query = backend.get_overpass_queries(LAT, LON, 'recycling centre')[0]
+
+    async def run():
+        try:
+            return await backend.run_provider_query_async('overpass', LAT, LON, 'recycling centre', query)
+        finally:
+            await backend.provider_clients['overpass'].aclose()
+
+    suggestions = asyncio.run(run())
+    [(response, consumed_before_parsing)] = responses
+    assert not consumed_before_parsing
+    assert response.is_closed
+    assert suggestions == backend.run_provider_query('overpass', LAT, LON, 'recycling centre', query)
+
+
+def overpass_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(body)
+    return response
+
+
+@pytest.mark.parametrize('status_code, cached', [(400, None), (200, ([], False))])
+def test_only_answered_searches_are_negative_cached(backend, monkeypatch, status_code, cached):
+    monkeypatch.setattr(backend.provider_clients['overpass'], 'request',
+                        lambda method, url, timeout, **kwargs: overpass_response(status_code, b'{"elements": []}'))
+    lat, lon = -33.86 - status_code / 1000, 151.2
+
+    report = {}
+    suggestions = backend.find_nearby_locations(lat, lon, 'battery drop-off', report)
+    assert [timing['status'] for timing in report['providers']] == ['ok' if status_code == 200 else 'error']
+    # Both answers fall back to the generic suggestions
+    assert suggestions == backend.get_generic_suggestions(lat, lon, 'battery drop-off')
+    assert backend.location_cache.lookup(backend.location_cache.key('battery drop-off', lat, lon)) == cached
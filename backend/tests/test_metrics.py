@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+import metrics
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_snapshot(directory, pid, count):
+    registry = metrics.MetricsRegistry(str(directory))
+    registry.counter('events_total', 'Events', ('event',)).inc(count, event='x')
+    with open(directory / f'{pid}.json', 'w') as f:
+        json.dump(registry.snapshot(), f)
+
+
+def test_snapshots_of_exited_workers_are_folded_into_one_file(tmp_path):
+    registry = metrics.MetricsRegistry(str(tmp_path))
+    events = registry.counter('events_total', 'Events', ('event',))
+    events.inc(event='x')
+
+    for count in (2, 3):
+        write_snapshot(tmp_path, exited_pid(), count)
+        registry.retire_exited()
+    write_snapshot(tmp_path, os.getppid(), 10)
+    registry.retire_exited()
+
+    assert set(os.listdir(tmp_path)) == {'LOCK', f'{os.getppid()}.json', metrics.RETIRED_FILE}
+    assert registry.collect()['events_total']['values'][json.dumps(['x'])] == 1 + 2 + 3 + 10
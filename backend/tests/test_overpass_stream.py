@@ -0,0 +1,75 @@
+import io
+import json
+import random
+
+from overpass_stream import NearestElements, collect_nearest, distance_km
+
+LAT, LON = 43.65, -79.38
+
+
+def node(name, lat, lon, **tags):
+    element = {'type': 'node', 'lat': lat, 'lon': lon, 'tags': dict(tags)}
+    if name is not None:
+        element['tags']['name'] = name
+    return element
+
+
+def random_elements(seed, count):
+    rng = random.Random(seed)
+    return [node(f'Depot {i}', LAT + rng.uniform(-0.1, 0.1), LON + rng.uniform(-0.1, 0.1)) for i in range(count)]
+
+
+def brute_force_nearest(elements, k):
+    """Names of the k nearest elements by a full sort"""
+    by_distance = sorted(elements, key=lambda element: distance_km(LAT, LON, element['lat'], element['lon']))
+    return {element['tags']['name'] for element in by_distance[:k]}
+
+
+def document(elements):
+    return io.BytesIO(json.dumps({'version': 0.6, 'elements': elements}).encode())
+
+
+def test_nameless_and_unplaced_elements_are_skipped():
+    nearest = collect_nearest(document([
+        node(None, LAT, LON),
+        node('Unknown Location', LAT, LON),
+        {'type': 'way', 'tags': {'name': 'No Centre'}},
+        {'type': 'way', 'center': {'lat': LAT + 0.01, 'lon': LON}, 'tags': {'name': 'Depot Way'}},
+        node(None, LAT, LON + 0.01, operator='City Works'),
+        node('Far Away', LAT + 1, LON)
+    ]), NearestElements(LAT, LON, k=10, radius_km=25))
+
+    assert [suggestion['name'] for suggestion in nearest.suggestions()] == ['Depot Way', 'City Works']
+    assert nearest.seen == 6
+    assert nearest.skipped == 3
+
+
+def test_duplicates_keep_the_first_occurrence():
+    nearest = NearestElements(LAT, LON, k=10)
+    for element in [node('Eco Centre', LAT, LON, shop='charity'), node('eco centre', LAT + 0.001, LON),
+                    node('Eco Centre', LAT + 0.05, LON)]:
+        nearest.offer(element)
+    suggestions = nearest.suggestions()
+    assert [(suggestion['name'], suggestion['lat']) for suggestion in suggestions] == [
+        ('Eco Centre', LAT), ('Eco Centre', LAT + 0.05)
+    ]
+
+
+def test_without_settling_the_heap_holds_the_exact_k_nearest():
+    for seed in range(10):
+        elements = random_elements(seed, 300)
+        nearest = collect_nearest(document(elements), NearestElements(LAT, LON, k=10, settle_km=0))
+        assert nearest.seen == len(elements)
+        assert len(nearest.suggestions()) == 10
+        assert {suggestion['name'] for suggestion in nearest.suggestions()} == brute_force_nearest(elements, 10)
+
+
+def test_settling_stops_early_with_places_within_settle_km():
+    for seed in range(10):
+        elements = random_elements(seed, 2000)
+        nearest = collect_nearest(document(elements), NearestElements(LAT, LON, k=5, settle_km=2))
+        assert nearest.seen < len(elements)
+        kept = nearest.suggestions()
+        assert all(distance_km(LAT, LON, suggestion['lat'], suggestion['lon']) <= 2 for suggestion in kept)
+        # Exact over what was parsed; later, unparsed elements may still be closer
+        assert {suggestion['name'] for suggestion in kept} == brute_force_nearest(elements[:nearest.seen], 5)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from provider_client import ProviderClient
+
+
+class HangingAsyncClient:
+    """Stands in for httpx.AsyncClient; every request waits until cancelled"""
+
+    def build_request(self, method, url, **kwargs):
+        return (method, url)
+
+    async def send(self, request, stream=False):
+        await asyncio.Event().wait()
+
+
+def half_open_client():
+    client = ProviderClient('test', failure_threshold=1, reset_seconds=0)
+    client.breaker.record_failure()
+    assert client.breaker.state == 'half_open'
+    return client
+
+
+def test_cancelled_async_trial_releases_breaker():
+    client = half_open_client()
+    client._async_client = HangingAsyncClient()
+
+    async def cancel_trial():
+        trial = asyncio.ensure_future(client.request_async('GET', 'http://provider.invalid', timeout=5))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(cancel_trial())
+    assert client.available()
+    assert client.breaker.allow() == 'trial'
+
+
+def test_interrupted_sync_trial_releases_breaker(monkeypatch):
+    client = half_open_client()
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(client.session, 'request', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        client.request('GET', 'http://provider.invalid', timeout=5)
+    assert client.breaker.allow() == 'trial'
+
+
+def test_only_one_trial_at_a_time():
+    client = half_open_client()
+    assert client.breaker.allow() == 'trial'
+    assert not client.breaker.allow()
+    client.breaker.record_success()
+    assert client.breaker.state == 'closed'
+    assert client.breaker.allow() is True
@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from single_flight import SingleFlight, SQLiteFlightStore
+
+
+def test_shared_work_is_cancelled_once_every_caller_has_gone():
+    flight = SingleFlight('test')
+    calls = []
+
+    async def run():
+        cancelled = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.ensure_future(flight.do_async('key', work))
+        second = asyncio.ensure_future(flight.do_async('key', work))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        for caller in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+
+    asyncio.run(run())
+    assert calls == [1]
+    assert flight.stats()['abandoned'] == 1
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_caller_after_abandoned_work_starts_afresh():
+    flight = SingleFlight('test')
+
+    async def run():
+        async def hang():
+            await asyncio.Event().wait()
+
+        async def answer():
+            return 'fresh'
+
+        abandoned = asyncio.ensure_future(flight.do_async('key', hang))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        await asyncio.sleep(0.01)
+        return await asyncio.wait_for(flight.do_async('key', answer), 1)
+
+    assert asyncio.run(run()) == 'fresh'
+
+
+def test_shared_store_calls_do_not_block_the_event_loop(tmp_path):
+    store = SQLiteFlightStore(str(tmp_path / 'flights.sqlite3'))
+    flight = SingleFlight('test', store=store)
+
+    # Another process holds the write lock for a while
+    blocker = sqlite3.connect(store.path, check_same_thread=False)
+    blocker.execute('BEGIN IMMEDIATE')
+    threading.Timer(0.3, blocker.rollback).start()
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        async def answer():
+            return {'answer': 42}
+
+        ticking = asyncio.ensure_future(ticker())
+        result = await flight.do_async('key', answer)
+        ticking.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(run())
+    assert result == {'answer': 42}
+    assert ticks >= 10
+    assert store.result('key') == {'answer': 42}
+    # The lease taken in one thread was released from another
+    assert store._connect().execute('SELECT COUNT(*) FROM leases').fetchone()[0] == 0
@@ -0,0 +1,26 @@
+from summary_cache import SummaryFiller, bucket_summary_stats, fill_summary, summary_cache_key, summary_figures
+
+CACHED = "Wow! You've saved {co2_kg} kg of CO₂ over {items} items, as much as {tree_years} trees absorb in a year."
+
+
+def test_users_in_one_bucket_get_their_own_figures():
+    first = {'total_co2_saved': 123.4, 'total_items': 123, 'total_weight': 7.26}
+    second = {'total_co2_saved': 118.0, 'total_items': 118, 'total_weight': 7.4}
+    assert summary_cache_key(bucket_summary_stats(first)) == summary_cache_key(bucket_summary_stats(second))
+
+    assert fill_summary(CACHED, summary_figures(first)) == (
+        "Wow! You've saved 123.40 kg of CO₂ over 123 items, as much as 5.9 trees absorb in a year."
+    )
+    assert '118.00 kg' in fill_summary(CACHED, summary_figures(second))
+
+
+def test_unknown_braces_are_left_alone():
+    assert fill_summary('{total} {co2_kg}', summary_figures({'total_co2_saved': 1})) == '{total} 1.00'
+
+
+def test_streamed_placeholders_split_across_chunks_are_filled():
+    figures = summary_figures({'total_co2_saved': 42, 'total_items': 9})
+    chunks = ["Wow! You've saved {co", "2_kg} kg over {", "items} items {no", "t a placeholder} {"]
+    filler = SummaryFiller(figures)
+    streamed = ''.join(filler.feed(chunk) for chunk in chunks) + filler.flush()
+    assert streamed == "Wow! You've saved 42.00 kg over 9 items {not a placeholder} {"
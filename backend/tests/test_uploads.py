@@ -0,0 +1,60 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+# No Content-Length; the server marks the body as terminated, as gunicorn does for chunked requests
+CHUNKED = {'wsgi.input_terminated': True, 'CONTENT_LENGTH': ''}
+
+
+def chunks(body, size=64 * 1024):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def oversized_json(backend):
+    return json.dumps({'image': 'x' * backend.upload_limit('classify_waste'), 'lat': 1, 'lon': 2}).encode()
+
+
+def test_flask_holds_chunked_json_to_the_classify_limit(backend):
+    client = backend.app.test_client()
+    response = client.post('/api/classify', input_stream=io.BytesIO(oversized_json(backend)), content_type='application/json',
+                           environ_overrides=CHUNKED)
+    assert response.status_code == 413
+
+
+def test_flask_holds_chunked_multipart_to_the_classify_limit(backend):
+    client = backend.app.test_client()
+    boundary = 'test-boundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="a.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode()
+    body += b'x' * (backend.upload_limit('classify_waste') + 1) + f'\r\n--{boundary}--\r\n'.encode()
+    response = client.post('/api/classify', input_stream=io.BytesIO(body), content_type=f'multipart/form-data; boundary={boundary}',
+                           environ_overrides=CHUNKED)
+    assert response.status_code == 413
+
+
+def test_asgi_holds_chunked_bodies_to_the_endpoint_limit(backend):
+    asgi = pytest.importorskip('asgi')
+
+    async def post(path, body, content_type):
+        messages = [{'type': 'http.request', 'body': chunk, 'more_body': True} for chunk in chunks(body)]
+        messages.append({'type': 'http.request', 'body': b'', 'more_body': False})
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                 'query_string': b'', 'scheme': 'http', 'server': ('test', 80), 'client': ('test', 1),
+                 'http_version': '1.1', 'headers': [(b'content-type', content_type.encode())]}
+        await asgi.application(scope, receive, send)
+        return next(message['status'] for message in sent if message['type'] == 'http.response.start')
+
+    assert asyncio.run(post('/api/classify', oversized_json(backend), 'application/json')) == 413
+    summary = json.dumps({'total_items': 5, 'padding': 'x' * backend.upload_limit('generate_environmental_summary')})
+    assert asyncio.run(post('/api/generate_summary', summary.encode(), 'application/json')) == 413
@@ -0,0 +1,59 @@
+"""Reading image uploads without holding several copies of the body.
+
+/api/classify takes the image in one of three forms: a base64 data URL in a
+JSON body (the original form), a multipart/form-data file field, or the raw
+image/* body with lat/lon in the query string. The binary forms end up in a
+spooled buffer that stays in memory while small and spills to a temporary
+file when large; PIL reads straight from it.
+"""
+import math
+import tempfile
+
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised once an upload passes its size limit, before the rest is read"""
+
+
+def upload_kind(mimetype):
+    """'multipart', 'raw' or 'json' for a request's content type"""
+    mimetype = (mimetype or '').lower()
+    if mimetype == 'multipart/form-data':
+        return 'multipart'
+    if mimetype.startswith('image/'):
+        return 'raw'
+    return 'json'
+
+
+def parse_coordinate(value):
+    """A latitude or longitude from a form field or query parameter, or None"""
+    try:
+        coordinate = float(value)
+    except (TypeError, ValueError):
+        return None
+    return coordinate if math.isfinite(coordinate) else None
+
+
+class SpooledUpload:
+    """Collects an upload chunk by chunk, in memory up to spool_bytes, enforcing max_bytes"""
+
+    def __init__(self, max_bytes, spool_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            self.file.close()
+            raise UploadTooLarge(f"Upload is over the {self.max_bytes} byte limit")
+        self.file.write(chunk)
+
+    def finish(self):
+        """The buffered upload rewound for reading, or None if it was empty"""
+        if self.size == 0:
+            self.file.close()
+            return None
+        self.file.seek(0)
+        return self.file
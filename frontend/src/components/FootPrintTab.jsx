@@ -176,7 +176,7 @@ const FootPrintTab = ({ user }) => {
   const generateAISummary = async (stats, categoryBreakdown, achievements) => {
     setLoadingSummary(true);
     try {
-      const response = await fetch('/api/generate_summary', {
+      const response = await fetch('/api/generate_summary/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -191,12 +191,45 @@ const FootPrintTab = ({ user }) => {
         })
       });
 
-      if (response.ok) {
-        const data = await response.json();
-        setAiSummary(data.summary);
-      } else {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to generate summary');
       }
+
+      // Read Server-Sent Events and show the summary as it is written
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let summary = '';
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = raw.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+
+          const payload = JSON.parse(data);
+          if (event === 'chunk') {
+            summary += payload.text;
+            setAiSummary(summary);
+            setLoadingSummary(false);
+          } else {
+            // 'done' carries the final text, 'fallback' replaces a stream that failed partway
+            setAiSummary(payload.summary);
+            finished = true;
+          }
+        }
+      }
+
+      if (!finished) {
+        throw new Error('Summary stream ended early');
+      }
     } catch {
       setAiSummary(
         `You have processed ${stats.totalItems} items, saving ${stats.totalCO2Saved}kg of CO₂ across ${stats.totalWeight}kg of waste.\n` +